@@ -0,0 +1,121 @@
+import os
+import sys
+import timeit
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PIL import Image
+from PIL.ImageQt import ImageQt
+from PySide6.QtGui import QPixmap
+from PySide6.QtWidgets import QApplication, QGraphicsPixmapItem, QGraphicsScene
+import numpy as np
+from widgets.image_conversion import tile_to_array, array_to_qimage
+
+VIEWPORTS = [(1280, 720), (1920, 1080), (2560, 1440), (3840, 2160)]
+TILE_SIZE = 256
+
+
+def random_image(width: int, height: int) -> Image.Image:
+    """
+    Creates an RGBA image as returned by read_region
+    :return: the image
+    """
+    data = np.random.randint(0, 256, (height, width, 4), dtype=np.uint8)
+    data[..., 3] = 255
+    return Image.fromarray(data, 'RGBA')
+
+
+def fused_conversion(patches: list, width: int, height: int) -> QPixmap:
+    """
+    The previous conversion: 4x4 viewport-sized patches are pasted into a fused image, which is converted to ARGB by
+    ImageQt and uploaded as a whole
+    :return: the pixmap
+    """
+    fused_image = Image.new('RGBA', (width * 4, height * 4))
+    for i, patch in enumerate(patches):
+        fused_image.paste(patch, ((i % 4) * width, (i // 4) * height))
+    return QPixmap.fromImage(ImageQt(fused_image))
+
+
+def tile_conversion(tiles: list, items: list) -> list:
+    """
+    The current conversion of SlideView.add_tile_item: each tile is converted to an array once, wrapped as QImage
+    without copying and uploaded as pixmap of its own tile item
+    :return: the items
+    """
+    for item, tile in zip(items, tiles):
+        item.setPixmap(QPixmap.fromImage(array_to_qimage(tile_to_array(tile))))
+    return items
+
+
+def cached_tile_conversion(arrays: list, items: list) -> list:
+    """
+    The current conversion for cached tiles, which are already stored as arrays
+    :return: the items
+    """
+    for item, array in zip(items, arrays):
+        item.setPixmap(QPixmap.fromImage(array_to_qimage(array)))
+    return items
+
+
+def imageqt_conversion(tiles: list) -> list:
+    """
+    The previous conversion path on the tiles of the current one: ImageQt converts each image to ARGB
+    :return: the pixmaps
+    """
+    return [QPixmap.fromImage(ImageQt(tile)) for tile in tiles]
+
+
+def array_conversion(tiles: list) -> list:
+    """
+    The current conversion path on the same tiles: the image is converted to an array and wrapped as QImage
+    :return: the pixmaps
+    """
+    return [QPixmap.fromImage(array_to_qimage(tile_to_array(tile))) for tile in tiles]
+
+
+def main(repeat: int = 5):
+    app = QApplication.instance() or QApplication(sys.argv)
+
+    # end-to-end: the previous mosaic covers 16 viewports, the tiles only the viewport and its margin, so most of the
+    # speedup is the smaller area; the equal-area table below compares the conversion paths alone
+    print('end-to-end')
+    print(f"{'viewport':>12} {'fused mosaic':>14} {'tile items':>14} {'cached items':>14} {'speedup':>8}")
+    equal_area = []
+    for width, height in VIEWPORTS:
+        patches = [random_image(width, height) for _ in range(16)]
+
+        # tiles of the viewport and a margin of one tile on each side
+        cols = -(-width // TILE_SIZE) + 2
+        rows = -(-height // TILE_SIZE) + 2
+        tiles = [random_image(TILE_SIZE, TILE_SIZE) for _ in range(cols * rows)]
+        arrays = [tile_to_array(tile) for tile in tiles]
+        scene = QGraphicsScene()
+        root = QGraphicsPixmapItem()
+        scene.addItem(root)
+        items = [QGraphicsPixmapItem(root) for _ in tiles]
+        for i, item in enumerate(items):
+            item.setPos((i % cols) * TILE_SIZE, (i // cols) * TILE_SIZE)
+
+        fused = min(timeit.repeat(lambda: fused_conversion(patches, width, height), number=1, repeat=repeat))
+        tiled = min(timeit.repeat(lambda: tile_conversion(tiles, items), number=1, repeat=repeat))
+        cached = min(timeit.repeat(lambda: cached_tile_conversion(arrays, items), number=1, repeat=repeat))
+
+        print(f"{width:>5}x{height:<6} {fused * 1000:>11.1f} ms {tiled * 1000:>11.1f} ms {cached * 1000:>11.1f} ms "
+              f"{fused / tiled:>7.1f}x")
+
+        imageqt = min(timeit.repeat(lambda: imageqt_conversion(tiles), number=1, repeat=repeat))
+        array = min(timeit.repeat(lambda: array_conversion(tiles), number=1, repeat=repeat))
+        cached_array = min(timeit.repeat(lambda: [QPixmap.fromImage(array_to_qimage(array)) for array in arrays],
+                                         number=1, repeat=repeat))
+        equal_area.append((width, height, imageqt, array, cached_array))
+
+    print('equal area: the tiles of each viewport converted to pixmaps')
+    print(f"{'viewport':>12} {'ImageQt':>14} {'array_to_qimage':>16} {'cached arrays':>14} {'speedup':>8}")
+    for width, height, imageqt, array, cached_array in equal_area:
+        print(f"{width:>5}x{height:<6} {imageqt * 1000:>11.1f} ms {array * 1000:>13.1f} ms "
+              f"{cached_array * 1000:>11.1f} ms {imageqt / array:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PySide6.QtCore import QThreadPool
+from widgets.dzi_export import FORMATS, export_dzi
+from widgets.process_tile_reader import ProcessTileReader
+from widgets.slide_handles import SlideHandlePool
+
+DEFAULT_SLIDE = 'synthetic://20000x15000?levels=4&latency=0.004'
+
+
+def run(slide: str, threads: int, processes: int, tile_format: str) -> dict:
+    """
+    Exports a slide into a temporary directory
+    :return: the statistics of export_dzi
+    """
+    reader = ProcessTileReader(processes) if processes else None
+    slide_pool = SlideHandlePool(per_thread=True) if reader is None else SlideHandlePool(opener=reader.open)
+    thread_pool = QThreadPool()
+    thread_pool.setMaxThreadCount(threads)
+    directory = tempfile.mkdtemp()
+    try:
+        stats = export_dzi(slide, directory, tile_format=tile_format, slide_pool=slide_pool, thread_pool=thread_pool)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+        if reader is not None:
+            reader.close()
+    stats.update(threads=threads, processes=processes)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Exports a slide as Deep Zoom pyramid with different numbers of '
+                                                 'threads and reports the throughput.')
+    parser.add_argument('--slide', default=DEFAULT_SLIDE, help='slide file or backend url')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    parser.add_argument('--processes', type=int, default=0, help='decodes the slide in worker processes')
+    parser.add_argument('--format', default='jpeg', choices=list(FORMATS))
+    parser.add_argument('--json', help='writes the results to this file')
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'threads':>7} {'tiles':>7} {'seconds':>8} {'tiles/s':>8} {'tiles/s/thread':>15}")
+    for threads in args.threads:
+        result = run(args.slide, threads, args.processes, args.format)
+        results.append(result)
+        print(f"{threads:>7} {result['written']:>7} {result['seconds']:>8.1f} {result['tiles_per_second']:>8.1f} "
+              f"{result['tiles_per_second_per_thread']:>15.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'slide': args.slide, 'results': results}, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
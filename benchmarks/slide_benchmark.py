@@ -0,0 +1,277 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PySide6.QtCore import QCoreApplication, QEvent, QMutex, QMutexLocker, QPoint, QPointF, Qt
+from PySide6.QtGui import QMouseEvent, QWheelEvent
+from PySide6.QtWidgets import QApplication, QGraphicsScene
+import numpy as np
+from widgets.slide_backends import SlideBackend, open_backend
+from widgets.process_tile_reader import ProcessTileReader
+from widgets.slide_handles import SlideHandlePool
+from widgets.slide_viewer import SlideView
+
+DEFAULT_SLIDE = 'synthetic://200000x150000?levels=6&latency=0.004'
+TRAJECTORIES = ['pan', 'zoom', 'mixed']
+
+
+class CountingSlide(SlideBackend):
+    """
+    Wraps a backend and counts the regions read from it
+    """
+
+    def __init__(self, slide: SlideBackend, counter: dict, mutex: QMutex):
+        self.slide = slide
+        self.counter = counter
+        self.mutex = mutex
+        self.level_count = slide.level_count
+        self.level_dimensions = tuple(slide.level_dimensions)
+        self.level_downsamples = tuple(slide.level_downsamples)
+        self.properties = dict(slide.properties)
+
+    def get_best_level_for_downsample(self, downsample: float) -> int:
+        return self.slide.get_best_level_for_downsample(downsample)
+
+    def read_region(self, location: tuple, level: int, size: tuple):
+        region = self.slide.read_region(location, level, size)
+        with QMutexLocker(self.mutex):
+            self.counter['reads'] += 1
+        return region
+
+    def get_thumbnail(self, size: tuple):
+        return self.slide.get_thumbnail(size)
+
+    def close(self):
+        self.slide.close()
+
+
+def resident_memory() -> float:
+    """
+    Resident memory of the process and its child processes, e.g. the decode workers of a ProcessTileReader, in MiB
+    :return: the memory or nan if it cannot be measured (needs /proc)
+    """
+    pids = [os.getpid()]
+    try:
+        for task in os.listdir('/proc/self/task'):
+            with open(f'/proc/self/task/{task}/children') as file:
+                pids.extend(int(pid) for pid in file.read().split())
+    except OSError:
+        return float('nan')
+    pages = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/statm') as file:
+                pages += int(file.read().split()[1])
+        except (OSError, IndexError, ValueError):  # the child exited in between
+            pass
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+
+
+class MemorySampler:
+    """
+    Samples the resident memory of the process and its children in a thread while a run is measured. ru_maxrss is the
+    peak over the whole lifetime of the process and does not include the children, so it cannot be compared per run.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.baseline = resident_memory()  # Memory at the start of the run
+        self.peak = self.baseline  # Highest sampled memory
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, resident_memory())
+
+    def stop(self) -> tuple:
+        """
+        Stops sampling
+        :return: the peak memory of the run and its growth over the start of the run in MiB
+        """
+        self.stopped.set()
+        self.thread.join()
+        self.peak = max(self.peak, resident_memory())
+        return self.peak, self.peak - self.baseline
+
+
+def wheel_event(pos: QPointF, zoom_in: bool) -> QWheelEvent:
+    return QWheelEvent(pos, pos, QPoint(0, 0), QPoint(0, 120 if zoom_in else -120), Qt.MouseButton.NoButton,
+                       Qt.KeyboardModifier.NoModifier, Qt.ScrollPhase.NoScrollPhase, False)
+
+
+def mouse_event(event_type: QMouseEvent.Type, pos: QPointF) -> QMouseEvent:
+    released = event_type == QMouseEvent.Type.MouseButtonRelease
+    buttons = Qt.MouseButton.NoButton if released else Qt.MouseButton.LeftButton
+    return QMouseEvent(event_type, pos, pos, Qt.MouseButton.LeftButton, buttons, Qt.KeyboardModifier.NoModifier)
+
+
+def trajectory(name: str, width: int, height: int, frames: int) -> list:
+    """
+    Scripts the input events of a trajectory, one event per frame
+    :param name: 'pan', 'zoom' or 'mixed'
+    :type name: str
+    :param width: width of the viewport
+    :type width: int
+    :param height: height of the viewport
+    :type height: int
+    :param frames: number of frames of each pan and zoom segment
+    :type frames: int
+    :return: list of (method name, event) tuples; None as event marks the end of a segment
+    """
+    center = QPointF(width / 2, height / 2)
+
+    def zoom(zoom_in, anchor):
+        return [('wheelEvent', wheel_event(anchor, zoom_in)) for _ in range(frames)] + [(None, None)]
+
+    def pan(dx, dy):
+        events = [('mousePressEvent', mouse_event(QMouseEvent.Type.MouseButtonPress, center))]
+        for frame in range(1, frames + 1):
+            pos = center - QPointF(dx * frame, dy * frame)
+            events.append(('mouseMoveEvent', mouse_event(QMouseEvent.Type.MouseMove, pos)))
+        events.append(('mouseReleaseEvent', mouse_event(QMouseEvent.Type.MouseButtonRelease, pos)))
+        return events + [(None, None)]
+
+    step = max(width, height) / 60
+    if name == 'pan':
+        return zoom(True, center) + pan(step, 0) + pan(0, step) + pan(-step, -step)
+    if name == 'zoom':
+        anchor = QPointF(width * 0.3, height * 0.6)
+        return zoom(True, anchor) + zoom(False, anchor) + zoom(True, center)
+    if name == 'mixed':
+        return zoom(True, center) + pan(step, step / 2) + zoom(True, QPointF(width * 0.7, height * 0.3)) + \
+            pan(-step, 0) + zoom(False, center)
+    raise ValueError(f'An incorrect trajectory: {name} was chosen!')
+
+
+def process_until(condition, timeout: float) -> float:
+    """
+    Processes events until the condition is met
+    :return: the elapsed time in seconds or nan if the timeout is reached
+    """
+    start = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - start > timeout:
+            return float('nan')
+        QCoreApplication.processEvents()
+        time.sleep(0.0005)
+    return time.perf_counter() - start
+
+
+def run(slide: str, name: str, width: int, height: int, frames: int, fps: float, threads: int, prefetch: bool,
+        timeout: float, reader: ProcessTileReader = None) -> dict:
+    """
+    Drives a fresh SlideView through a trajectory and measures it
+    :return: dictionary of the results
+    """
+    counter = {'reads': 0}
+    mutex = QMutex()
+    opener = open_backend if reader is None else reader.open
+    pool = SlideHandlePool(opener=lambda path: CountingSlide(opener(path), counter, mutex))
+    if threads is None and reader is not None:
+        threads = len(reader.slots)
+    memory = MemorySampler()
+    view = SlideView(max_threads=threads, prefetch=prefetch, slide_pool=pool)
+    scene = QGraphicsScene()
+    view.setScene(scene)
+    view.sendPixmap.connect(scene.addItem)
+    view.resize(width, height)
+    view.show()
+    QCoreApplication.processEvents()
+
+    # loading: time to the first displayed tile and to the complete viewport
+    view.load_slide(slide, view.width, view.height)
+    first_tile = process_until(lambda: bool(view.tile_items) or view.image_job is None, timeout)
+    complete = first_tile + process_until(lambda: view.image_job is None, timeout)
+    view.viewport().repaint()
+
+    # trajectory: one input event per frame, the frame latency covers the input handling and the repaint
+    frame_time = 1 / fps
+    latencies = []
+    settle_times = []
+    reads_before = counter['reads']
+    trajectory_start = time.perf_counter()
+    for method, event in trajectory(name, view.width, view.height, frames):
+        if method is None:
+            settle_times.append(process_until(lambda: view.image_job is None and not view.is_zooming(), timeout))
+            continue
+        frame_start = time.perf_counter()
+        getattr(view, method)(event)
+        QCoreApplication.processEvents()
+        view.viewport().repaint()
+        latencies.append(time.perf_counter() - frame_start)
+        process_until(lambda: time.perf_counter() - frame_start >= frame_time, timeout)
+    trajectory_time = time.perf_counter() - trajectory_start
+    peak_memory, memory_growth = memory.stop()
+
+    view.scheduler.cancel_all()
+    view.thread_pool.waitForDone()
+    view.tile_cache.clear()
+    pool.close_all()
+    view.deleteLater()
+    QCoreApplication.sendPostedEvents(None, QEvent.Type.DeferredDelete)
+
+    latencies = np.asarray(latencies) * 1000
+    return {
+        'trajectory': name,
+        'viewport': f'{width}x{height}',
+        'first_tile_ms': first_tile * 1000,
+        'complete_ms': complete * 1000,
+        'settle_ms': float(np.nanmean(settle_times) * 1000) if settle_times else float('nan'),
+        'frame_p50_ms': float(np.percentile(latencies, 50)),
+        'frame_p95_ms': float(np.percentile(latencies, 95)),
+        'frame_p99_ms': float(np.percentile(latencies, 99)),
+        'tiles_per_s': (counter['reads'] - reads_before) / trajectory_time,
+        'peak_memory_mib': peak_memory,
+        'memory_growth_mib': memory_growth,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Drives the SlideView offscreen through scripted pan and zoom '
+                                                 'trajectories and reports its latencies and throughput.')
+    parser.add_argument('--slide', default=DEFAULT_SLIDE, help='slide file or backend url')
+    parser.add_argument('--viewport', nargs='+', default=['1920x1080'], help='viewport sizes, e.g. 1920x1080')
+    parser.add_argument('--trajectory', nargs='+', default=TRAJECTORIES, choices=TRAJECTORIES)
+    parser.add_argument('--frames', type=int, default=30, help='frames per pan and zoom segment')
+    parser.add_argument('--fps', type=float, default=60, help='rate of the input events')
+    parser.add_argument('--threads', type=int, default=None, help='reading threads, defaults to the cpu count')
+    parser.add_argument('--no-prefetch', action='store_true', help='disables prefetching')
+    parser.add_argument('--processes', type=int, default=0, help='decodes the tiles in worker processes')
+    parser.add_argument('--timeout', type=float, default=60, help='maximal wait for a viewport in seconds')
+    parser.add_argument('--json', help='writes the results to this file')
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    reader = ProcessTileReader(args.processes) if args.processes else None
+
+    results = []
+    print(f"{'trajectory':>10} {'viewport':>10} {'first tile':>11} {'complete':>10} {'settle':>10} {'p50':>8} "
+          f"{'p95':>8} {'p99':>8} {'tiles/s':>8} {'peak MiB':>9} {'+MiB':>7}")
+    for viewport in args.viewport:
+        width, height = (int(size) for size in viewport.lower().split('x'))
+        for name in args.trajectory:
+            result = run(args.slide, name, width, height, args.frames, args.fps, args.threads, not args.no_prefetch,
+                         args.timeout, reader)
+            results.append(result)
+            print(f"{name:>10} {result['viewport']:>10} {result['first_tile_ms']:>8.1f} ms "
+                  f"{result['complete_ms']:>7.1f} ms {result['settle_ms']:>7.1f} ms {result['frame_p50_ms']:>5.1f} ms "
+                  f"{result['frame_p95_ms']:>5.1f} ms {result['frame_p99_ms']:>5.1f} ms {result['tiles_per_s']:>8.0f} "
+                  f"{result['peak_memory_mib']:>9.0f} {result['memory_growth_mib']:>7.0f}")
+
+    if reader is not None:
+        reader.close()
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'slide': args.slide, 'results': results}, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -20,6 +20,7 @@ setup(
         "License :: OSI Approved :: GNU GENERAL PUBLIC LICENSE",
         "Operating System :: OS Independent",
     ],
+    entry_points={'console_scripts': ['slide2dzi=widgets.dzi_export:main']},
     python_requires='>=3',
     install_requires=['numpy',
                       'PyQt6',
@@ -0,0 +1,61 @@
+import os
+import sys
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PySide6.QtCore import QRectF
+import numpy as np
+from widgets.annotation_layer import AnnotationStore
+
+
+def random_polygons(count: int, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(0, 50000, (count, 2))
+    radii = rng.uniform(5, 3000, count)
+    angles = np.linspace(0, 2 * np.pi, 8, endpoint=False)
+    return [center + radius * np.stack([np.cos(angles), np.sin(angles)], axis=1)
+            for center, radius in zip(centers, radii)]
+
+
+def brute_force(polygons: list, rect: QRectF) -> np.ndarray:
+    return np.array([i for i, polygon in enumerate(polygons)
+                     if polygon[:, 0].min() <= rect.right() and polygon[:, 0].max() >= rect.left() and
+                     polygon[:, 1].min() <= rect.bottom() and polygon[:, 1].max() >= rect.top()], np.int64)
+
+
+def test_query_matches_a_brute_force_search():
+    # float32 vertices, so the brute force uses the stored coordinates
+    polygons = [polygon.astype(np.float32) for polygon in random_polygons(2000)]
+    store = AnnotationStore.from_polygons(polygons, cell_size=1024)
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        x, y = rng.uniform(-5000, 50000, 2)
+        width, height = rng.uniform(1, 20000, 2)
+        rect = QRectF(x, y, width, height)
+        assert np.array_equal(store.query(rect), brute_force(polygons, rect))
+
+
+def test_polygons_larger_than_a_cell_are_found_in_all_cells():
+    polygon = np.array([[100, 100], [9000, 100], [9000, 9000], [100, 9000]], np.float32)
+    store = AnnotationStore.from_polygons([polygon], cell_size=1024)
+    for x, y in [(150, 150), (5000, 5000), (8900, 8900), (8900, 150)]:
+        assert store.query(QRectF(x, y, 10, 10)).tolist() == [0]
+    assert len(store.query(QRectF(9500, 9500, 100, 100))) == 0
+
+
+def test_added_polygons_keep_their_indices_and_classes():
+    store = AnnotationStore(cell_size=512)
+    first, second = random_polygons(10, 2), random_polygons(10, 3)
+    store.add(first)
+    store.add(second, classes=np.full(10, 3))
+    assert len(store) == 20
+    everything = store.query(QRectF(-10000, -10000, 100000, 100000))
+    assert everything.tolist() == list(range(20))
+    assert store.classes.tolist() == [0] * 10 + [3] * 10
+
+
+def test_empty_store_and_rectangles_outside_the_grid():
+    assert len(AnnotationStore().query(QRectF(0, 0, 100, 100))) == 0
+    store = AnnotationStore.from_polygons(random_polygons(10), cell_size=1024)
+    assert len(store.query(QRectF(-5000, -5000, 100, 100))) == 0
+    assert len(store.query(QRectF(1e6, 1e6, 100, 100))) == 0
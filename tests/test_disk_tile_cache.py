@@ -0,0 +1,85 @@
+import os
+import sys
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from widgets.disk_tile_cache import DiskTileCache
+from widgets.slide_backends import open_backend
+from widgets.tile_cache import TileCache, read_tile
+
+SLIDE = 'synthetic://20000x16000?levels=3'
+
+
+def slide_file(tmp_path, content: bytes = b'slide') -> str:
+    """
+    Creates a file that stands in for the slide file, whose identity keys the cached tiles
+    """
+    path = str(tmp_path / 'slide.svs')
+    with open(path, 'wb') as file:
+        file.write(content)
+    return path
+
+
+def tile(value: int) -> np.ndarray:
+    array = np.full((64, 64, 4), value, np.uint8)
+    array[..., 3] = 255
+    return array
+
+
+def test_tiles_persist_across_sessions(tmp_path):
+    path = slide_file(tmp_path)
+    cache = DiskTileCache(str(tmp_path / 'cache'), compression='raw')
+    cache.put(path, 0, 64, 1, 2, tile(7))
+    assert np.array_equal(cache.get(path, 0, 64, 1, 2), tile(7))
+    assert cache.get(path, 0, 64, 2, 1) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    cache = DiskTileCache(str(tmp_path / 'cache'), compression='raw')
+    assert np.array_equal(cache.get(path, 0, 64, 1, 2), tile(7))
+
+
+def test_a_changed_slide_file_invalidates_its_tiles(tmp_path):
+    path = slide_file(tmp_path)
+    cache = DiskTileCache(str(tmp_path / 'cache'), compression='raw')
+    cache.put(path, 0, 64, 0, 0, tile(1))
+    slide_file(tmp_path, b'another slide')
+    assert cache.get(path, 0, 64, 0, 0) is not None  # the token is computed once per session
+    cache.slide_token(path, refresh=True)
+    assert cache.get(path, 0, 64, 0, 0) is None
+
+    cache = DiskTileCache(str(tmp_path / 'cache'), compression='raw')
+    assert cache.get(path, 0, 64, 0, 0) is None
+
+
+def test_the_size_limit_deletes_the_least_recently_used_tiles(tmp_path):
+    path = slide_file(tmp_path)
+    cache = DiskTileCache(str(tmp_path / 'cache'), compression='raw')
+    cache.put(path, 0, 64, 0, 0, tile(0))
+    cache.max_bytes = 2 * cache.cur_bytes
+    cache.put(path, 0, 64, 1, 0, tile(1))
+    assert cache.get(path, 0, 64, 0, 0) is not None
+    cache.put(path, 0, 64, 2, 0, tile(2))
+    assert cache.cur_bytes <= cache.max_bytes
+    assert cache.get(path, 0, 64, 1, 0) is None
+    assert cache.get(path, 0, 64, 0, 0) is not None
+    assert len(os.listdir(os.path.dirname(cache.tile_path(path, 0, 64, 0, 0, '.npy')))) == 2
+
+
+def test_slides_that_are_not_files_are_not_cached(tmp_path):
+    cache = DiskTileCache(str(tmp_path / 'cache'))
+    assert cache.slide_token(SLIDE, refresh=True) is None
+    cache.put(SLIDE, 0, 64, 0, 0, tile(0))
+    assert cache.get(SLIDE, 0, 64, 0, 0) is None
+    assert len(cache.files) == 0
+
+
+def test_read_tile_fills_and_uses_the_disk_cache(tmp_path):
+    path = slide_file(tmp_path)
+    slide = open_backend(SLIDE)
+    cache = DiskTileCache(str(tmp_path / 'cache'), compression='png')
+    tile = read_tile(slide, path, TileCache(), 1, 3, 2, 256, cache)
+    assert len(cache.files) == 1
+    cached = read_tile(slide, path, TileCache(), 1, 3, 2, 256, cache)
+    assert cache.hits == 1
+    assert np.array_equal(cached, tile)
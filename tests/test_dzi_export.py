@@ -0,0 +1,51 @@
+import os
+import sys
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PIL import Image
+from widgets.dzi_export import DeepZoomPyramid, export_dzi
+from widgets.slide_backends import open_backend
+
+SLIDE = 'synthetic://3000x2000?levels=3'
+
+
+def tile_files(directory) -> list:
+    return sorted(os.path.relpath(os.path.join(root, name), directory)
+                  for root, _, names in os.walk(directory) for name in names if name.endswith('.png'))
+
+
+def test_export_writes_every_tile_of_the_pyramid(tmp_path):
+    stats = export_dzi(SLIDE, str(tmp_path), 'slide', tile_size=510, tile_format='png')
+    pyramid = DeepZoomPyramid(open_backend(SLIDE), 510)
+    assert stats['written'] == pyramid.tile_count and stats['skipped'] == 0
+    assert len(tile_files(tmp_path)) == pyramid.tile_count
+    with Image.open(tmp_path / 'slide_files' / str(pyramid.level_count - 1) / '1_1.png') as tile:
+        assert tile.size == (512, 512)  # overlap on both sides
+    with Image.open(tmp_path / 'slide_files' / '0' / '0_0.png') as tile:
+        assert tile.size == (1, 1)
+
+
+def test_resume_skips_the_existing_tiles(tmp_path):
+    first = export_dzi(SLIDE, str(tmp_path), 'slide', tile_size=510, tile_format='png')
+    removed = tmp_path / 'slide_files' / '11' / '2_1.png'
+    os.remove(removed)
+    stats = export_dzi(SLIDE, str(tmp_path), 'slide', tile_size=510, tile_format='png')
+    assert stats['written'] == 1 and stats['skipped'] == first['tiles'] - 1
+    assert removed.exists()
+
+
+def test_other_parameters_replace_the_existing_tiles(tmp_path):
+    export_dzi(SLIDE, str(tmp_path), 'slide', tile_size=254, tile_format='png')
+    stats = export_dzi(SLIDE, str(tmp_path), 'slide', tile_size=510, tile_format='png')
+    assert stats['skipped'] == 0
+    assert 'TileSize="510"' in (tmp_path / 'slide.dzi').read_text()
+    assert len(tile_files(tmp_path)) == stats['tiles']
+    with Image.open(tmp_path / 'slide_files' / '11' / '0_0.png') as tile:
+        assert tile.size == (511, 511)
+
+    # the quality is not part of the descriptor, but changes the tiles of the lossy formats
+    export_dzi(SLIDE, str(tmp_path), 'slide', tile_size=510, quality=90)
+    stats = export_dzi(SLIDE, str(tmp_path), 'slide', tile_size=510, quality=50)
+    assert stats['skipped'] == 0
+    assert tile_files(tmp_path) == []
@@ -0,0 +1,82 @@
+import os
+import sys
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PySide6.QtWidgets import QApplication
+import numpy as np
+from widgets.disk_tile_cache import DiskTileCache
+from widgets.region_export import RegionExporter
+from widgets.slide_backends import open_backend
+from widgets.slide_viewer import SlideView
+from widgets.tile_cache import TileCache, UniformTile
+
+SLIDE = 'synthetic://20000x16000?levels=3'
+REGIONS = [(x, y, level, (300, 200)) for level in (0, 1) for x in range(0, 20000, 3100) for y in range(0, 16000, 3900)]
+
+app = QApplication.instance() or QApplication([])
+
+
+def direct_read(region) -> np.ndarray:
+    x, y, level, size = region
+    return np.asarray(open_backend(SLIDE).read_region((x, y), level, size))
+
+
+def test_regions_are_read_in_order_and_equal_the_slide():
+    exporter = RegionExporter()
+    regions = list(exporter.regions(SLIDE, REGIONS))
+    assert [region for region, _ in regions] == [(x, y, level, 300, 200) for x, y, level, _ in REGIONS]
+    for region, (_, array) in zip(REGIONS, regions):
+        assert np.array_equal(array, direct_read(region))
+
+
+def test_regions_composed_from_tiles_equal_the_slide():
+    exporter = RegionExporter(tile_cache=TileCache(), tile_size=256)
+    for region, (_, array) in zip(REGIONS, exporter.regions(SLIDE, REGIONS)):
+        assert np.array_equal(array, direct_read(region))
+
+
+def test_the_shared_cache_is_only_looked_up():
+    shared = TileCache()
+    slide = open_backend(SLIDE)
+    # a pixel tile that differs from the slide is reused, a uniform tile (e.g. predicted by a background mask) is not
+    shared.put(TileCache.key(SLIDE, 0, 0, 0), np.full((256, 256, 4), 7, np.uint8))
+    shared.put(TileCache.key(SLIDE, 0, 1, 0), UniformTile(np.array([1, 2, 3, 255], np.uint8), (256, 256, 4)))
+    shared.put(TileCache.key(SLIDE, 0, 2, 0), np.zeros((256, 256, 4), np.uint8))
+    before = list(shared.tiles)
+
+    exporter = RegionExporter(tile_cache=TileCache(), tile_size=256, shared_cache=shared)
+    (_, array), = exporter.regions(SLIDE, [(0, 0, 0, (512, 256))])
+    assert np.all(array[:, :256] == 7)
+    assert np.array_equal(array[:, 256:], np.asarray(slide.read_region((256, 0), 0, (256, 256))))
+    assert list(shared.tiles) == before
+    assert len(exporter.tile_cache) == 1
+
+
+def test_for_view_shares_neither_the_disk_cache_nor_lossy_tiles(tmp_path):
+    view = SlideView(tile_size=256)
+    exporter = RegionExporter.for_view(view)
+    assert exporter.shared_cache is view.tile_cache
+    assert exporter.tile_cache is not view.tile_cache
+    assert exporter.disk_cache is None
+
+    view = SlideView(tile_size=256, disk_cache=DiskTileCache(str(tmp_path / 'jpeg')))
+    exporter = RegionExporter.for_view(view)
+    assert exporter.disk_cache is None and exporter.shared_cache is None
+
+    view = SlideView(tile_size=256, disk_cache=DiskTileCache(str(tmp_path / 'png'), compression='png'))
+    exporter = RegionExporter.for_view(view)
+    assert exporter.disk_cache is None and exporter.shared_cache is view.tile_cache
+
+
+def test_export_writes_shards(tmp_path):
+    exporter = RegionExporter()
+    count = exporter.export(SLIDE, REGIONS, str(tmp_path), shard_size=10)
+    assert count == len(REGIONS)
+    shards = sorted(name for name in os.listdir(tmp_path) if not name.endswith('_regions.npy'))
+    assert len(shards) == -(-len(REGIONS) // 10)
+    first = np.load(tmp_path / shards[0])
+    assert first.shape == (10, 200, 300, 3)
+    assert np.array_equal(first[0], direct_read(REGIONS[0])[..., :3])
+    rows = np.load(tmp_path / shards[0].replace('.npy', '_regions.npy'))
+    assert rows[0].tolist() == [0, 0, 0, 300, 200]
@@ -0,0 +1,93 @@
+import os
+import sys
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from widgets.slide_backends import open_backend
+from widgets.tile_cache import TileCache, UniformTile, read_tile
+
+SLIDE = 'synthetic://20000x16000?levels=3'
+
+
+def tile(value: int) -> np.ndarray:
+    return np.full((16, 16, 4), value, np.uint8)
+
+
+def test_eviction_keeps_the_byte_budget():
+    cache = TileCache(max_bytes=3 * 1024)
+    for i in range(5):
+        cache.put(('slide', 0, i, 0), tile(i))
+    assert cache.cur_bytes <= cache.max_bytes
+    assert list(cache.tiles) == [('slide', 0, 2, 0), ('slide', 0, 3, 0), ('slide', 0, 4, 0)]
+
+
+def test_get_marks_tiles_as_recently_used():
+    cache = TileCache(max_bytes=3 * 1024)
+    for i in range(3):
+        cache.put(('slide', 0, i, 0), tile(i))
+    assert cache.get(('slide', 0, 0, 0)) is not None
+    cache.put(('slide', 0, 3, 0), tile(3))
+    assert ('slide', 0, 0, 0) in cache
+    assert ('slide', 0, 1, 0) not in cache
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_peek_does_not_change_the_order():
+    cache = TileCache(max_bytes=3 * 1024)
+    for i in range(3):
+        cache.put(('slide', 0, i, 0), tile(i))
+    assert cache.peek(('slide', 0, 0, 0)) is not None
+    assert cache.peek(('slide', 0, 9, 0)) is None
+    cache.put(('slide', 0, 3, 0), tile(3))
+    assert ('slide', 0, 0, 0) not in cache
+    assert (cache.hits, cache.misses) == (0, 0)
+
+
+def test_replacing_a_tile_updates_its_size():
+    cache = TileCache()
+    cache.put(('slide', 0, 0, 0), tile(0))
+    cache.put(('slide', 0, 0, 0), np.zeros((32, 32, 4), np.uint8))
+    assert len(cache) == 1
+    assert cache.cur_bytes == 32 * 32 * 4
+
+
+def test_tiles_larger_than_the_budget_are_not_cached():
+    cache = TileCache(max_bytes=512)
+    cache.put(('slide', 0, 0, 0), tile(0))
+    assert len(cache) == 0 and cache.cur_bytes == 0
+
+
+def test_remove_slide():
+    cache = TileCache()
+    cache.put(('a', 0, 0, 0), tile(0))
+    cache.put(('b', 0, 0, 0), tile(1))
+    cache.remove_slide('a')
+    assert list(cache.tiles) == [('b', 0, 0, 0)]
+    assert cache.cur_bytes == 16 * 16 * 4
+
+
+def test_read_tile_crops_the_border_and_caches_read_only_arrays():
+    slide = open_backend(SLIDE)
+    cache = TileCache()
+    cols = -(-slide.level_dimensions[1][0] // 256)
+    border = read_tile(slide, SLIDE, cache, 1, cols - 1, 0, 256)
+    assert border.shape == (256, slide.level_dimensions[1][0] - (cols - 1) * 256, 4)
+    assert not border.flags.writeable
+    assert read_tile(slide, SLIDE, cache, 1, cols - 1, 0, 256) is border
+
+
+def test_read_tile_detects_exactly_uniform_tiles():
+    slide = open_backend(SLIDE)
+    cache = TileCache()
+    cols, rows = (-(-size // 256) for size in slide.level_dimensions[1])
+    uniform = 0
+    for row in range(rows):
+        for col in range(cols):
+            cached = read_tile(slide, SLIDE, cache, 1, col, row, 256, uniform_tolerance=0)
+            array = cached.to_array() if isinstance(cached, UniformTile) else cached
+            region = slide.read_region((col * 1024, row * 1024), 1, (array.shape[1], array.shape[0]))
+            assert np.array_equal(array, region)
+            assert isinstance(cached, UniformTile) == bool(np.all(region == region[0, 0]))
+            uniform += isinstance(cached, UniformTile)
+    assert 0 < uniform < cols * rows
@@ -0,0 +1,165 @@
+import os
+import sys
+import threading
+import time
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PySide6.QtCore import QThreadPool
+import numpy as np
+from widgets.slide_backends import open_backend
+from widgets.tile_cache import TileCache, UniformTile
+from widgets.tile_scheduler import TileScheduler
+
+SLIDE = 'synthetic://20000x16000?levels=3'
+
+
+class GatedSlide:
+    """
+    Wraps a slide, blocks all reads until the gate is opened and records the read regions
+    """
+
+    def __init__(self, slide, noise: int = 0):
+        self.slide = slide
+        self.noise = noise
+        self.gate = threading.Event()
+        self.reads = []
+
+    def __getattr__(self, name):
+        return getattr(self.slide, name)
+
+    def read_region(self, location, level, size):
+        self.gate.wait(10)
+        self.reads.append((location, level))
+        region = np.array(self.slide.read_region(location, level, size))
+        if self.noise:
+            # blank glass with sensor noise: every channel varies by up to the noise
+            region[..., :3] = np.full(region.shape[:2] + (3,), 200, np.uint8) + \
+                np.random.default_rng(0).integers(0, self.noise + 1, region.shape[:2] + (3,), np.uint8)
+            region[..., 3] = 255
+        return region
+
+
+class Collector:
+    """
+    Collects the finished requests of the scheduler
+    """
+
+    def __init__(self):
+        self.finished = []
+        self.lock = threading.Lock()
+
+    def __call__(self, request, tile):
+        with self.lock:
+            self.finished.append((request.key, tile))
+
+
+def create_scheduler(threads: int = 1) -> TileScheduler:
+    thread_pool = QThreadPool()
+    thread_pool.setMaxThreadCount(threads)
+    return TileScheduler(thread_pool, TileCache())
+
+
+def key(col: int, row: int = 0) -> tuple:
+    return TileCache.key(SLIDE, 1, col, row)
+
+
+def wait_running(request):
+    end = time.perf_counter() + 10
+    while not request.running and time.perf_counter() < end:
+        time.sleep(0.001)
+    assert request.running
+
+
+def test_requests_are_read_in_order_of_priority_and_distance():
+    scheduler = create_scheduler()
+    slide = GatedSlide(open_backend(SLIDE))
+    collector = Collector()
+    # the first request occupies the only thread until the gate is opened, the others are queued
+    scheduler.request(key(0), slide, 256, TileScheduler.VISIBLE, 0, collector)
+    scheduler.request(key(1), slide, 256, TileScheduler.PREFETCH, 0, collector)
+    scheduler.request(key(2), slide, 256, TileScheduler.MARGIN, 1, collector)
+    scheduler.request(key(3), slide, 256, TileScheduler.VISIBLE, 2, collector)
+    scheduler.request(key(4), slide, 256, TileScheduler.VISIBLE, 1, collector)
+    slide.gate.set()
+    scheduler.thread_pool.waitForDone()
+    assert [finished_key for finished_key, _ in collector.finished] == [key(0), key(4), key(3), key(2), key(1)]
+
+
+def test_a_more_urgent_request_moves_a_queued_tile_up():
+    scheduler = create_scheduler()
+    slide = GatedSlide(open_backend(SLIDE))
+    collector = Collector()
+    scheduler.request(key(0), slide, 256, TileScheduler.VISIBLE, 0, collector)
+    scheduler.request(key(1), slide, 256, TileScheduler.VISIBLE, 1, collector)
+    scheduler.request(key(2), slide, 256, TileScheduler.PREFETCH, 0, collector)
+    scheduler.request(key(2), slide, 256, TileScheduler.VISIBLE, 0, collector)
+    slide.gate.set()
+    scheduler.thread_pool.waitForDone()
+    keys = [finished_key for finished_key, _ in collector.finished]
+    assert keys[:2] == [key(0), key(2)]
+    assert keys.count(key(2)) == 2  # both callbacks of the coalesced request
+
+
+def test_requests_of_the_same_tile_are_coalesced():
+    scheduler = create_scheduler()
+    slide = GatedSlide(open_backend(SLIDE))
+    collector = Collector()
+    scheduler.request(key(0), slide, 256, TileScheduler.VISIBLE, 0, collector)
+    first = scheduler.request(key(1), slide, 256, TileScheduler.MARGIN, 0, collector, owner='a')
+    second = scheduler.request(key(1), slide, 256, TileScheduler.VISIBLE, 0, collector, owner='b')
+    assert first is second
+    slide.gate.set()
+    scheduler.thread_pool.waitForDone()
+    assert len(slide.reads) == 2
+    tiles = [tile for finished_key, tile in collector.finished if finished_key == key(1)]
+    assert len(tiles) == 2 and tiles[0] is tiles[1]
+    assert key(1) in scheduler.tile_cache
+
+
+def test_obsolete_generations_are_cancelled_per_owner():
+    scheduler = create_scheduler()
+    slide = GatedSlide(open_backend(SLIDE))
+    collector = Collector()
+    old = scheduler.next_generation()
+    wait_running(scheduler.request(key(0), slide, 256, TileScheduler.VISIBLE, 0, collector, old, 'a'))
+    scheduler.request(key(1), slide, 256, TileScheduler.VISIBLE, 0, collector, old, 'a')
+    scheduler.request(key(2), slide, 256, TileScheduler.VISIBLE, 0, collector, old, 'a')
+    scheduler.request(key(2), slide, 256, TileScheduler.VISIBLE, 0, collector, old, 'b')
+    prefetch = scheduler.request(key(3), slide, 256, TileScheduler.PREFETCH, 0, collector, old, 'a')
+    new = scheduler.next_generation()
+    scheduler.request(key(4), slide, 256, TileScheduler.VISIBLE, 0, collector, new, 'a')
+    scheduler.cancel_obsolete(new, 'a')
+    slide.gate.set()
+    scheduler.thread_pool.waitForDone()
+
+    # key 0 was already running, key 2 is still needed by b and prefetches are kept
+    finished = {finished_key for finished_key, _ in collector.finished}
+    assert finished == {key(0), key(2), key(3), key(4)}
+    assert not prefetch.cancelled
+
+
+def test_cancel_all_of_an_owner_keeps_the_requests_of_others():
+    scheduler = create_scheduler()
+    slide = GatedSlide(open_backend(SLIDE))
+    collector = Collector()
+    wait_running(scheduler.request(key(0), slide, 256, TileScheduler.VISIBLE, 0, collector, owner='a'))
+    scheduler.request(key(1), slide, 256, TileScheduler.VISIBLE, 0, collector, owner='a')
+    scheduler.request(key(2), slide, 256, TileScheduler.VISIBLE, 0, collector, owner='b')
+    scheduler.cancel_all('a')
+    slide.gate.set()
+    scheduler.thread_pool.waitForDone()
+    assert {finished_key for finished_key, _ in collector.finished} == {key(0), key(2)}
+
+
+def test_noisy_tiles_are_only_collapsed_with_a_tolerance():
+    scheduler = create_scheduler(threads=2)
+    slide = GatedSlide(open_backend(SLIDE), noise=4)
+    slide.gate.set()
+    collector = Collector()
+    scheduler.request(key(0), slide, 256, TileScheduler.VISIBLE, 0, collector)
+    scheduler.request(key(1), slide, 256, TileScheduler.VISIBLE, 0, collector, uniform_tolerance=6)
+    scheduler.thread_pool.waitForDone()
+    tiles = dict(collector.finished)
+    assert isinstance(tiles[key(0)], np.ndarray)
+    assert isinstance(tiles[key(1)], UniformTile)
@@ -0,0 +1,81 @@
+import os
+import sys
+import time
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PySide6.QtCore import QCoreApplication, QMutex, QMutexLocker, QPoint, QPointF, Qt
+from PySide6.QtGui import QWheelEvent
+from PySide6.QtWidgets import QApplication, QGraphicsScene
+from widgets.slide_backends import open_backend
+from widgets.slide_handles import SlideHandlePool
+from widgets.view_link import ViewLink
+
+SLIDE = 'synthetic://100000x80000?levels=5&downsample=2&latency=0.002'
+
+app = QApplication.instance() or QApplication([])
+
+
+class LevelCountingSlide:
+    """
+    Wraps a slide and counts the reads per level
+    """
+
+    def __init__(self, slide, counts: dict, mutex: QMutex):
+        self.slide = slide
+        self.counts = counts
+        self.mutex = mutex
+
+    def __getattr__(self, name):
+        return getattr(self.slide, name)
+
+    def read_region(self, location, level, size):
+        with QMutexLocker(self.mutex):
+            self.counts[level] = self.counts.get(level, 0) + 1
+        return self.slide.read_region(location, level, size)
+
+
+def process_until(condition, timeout: float = 30):
+    end = time.perf_counter() + timeout
+    while time.perf_counter() < end and not condition():
+        QCoreApplication.processEvents()
+        time.sleep(0.005)
+
+
+def zoom_in(linked_views: int, ticks: int = 40) -> dict:
+    """
+    Zooms the first of several linked views in by one wheel tick per frame
+    :return: number of reads per level during the zoom
+    """
+    counts, mutex = {}, QMutex()
+    pool = SlideHandlePool(opener=lambda path: LevelCountingSlide(open_backend(path), counts, mutex))
+    link = ViewLink(max_threads=4, slide_pool=pool)
+    # the settle time exceeds the time the zoom spends on each level, so only the final level has to be read
+    views = [link.create_view(zoom_settle_ms=1000) for _ in range(linked_views)]
+    for view in views:
+        scene = QGraphicsScene(view)
+        view.setScene(scene)
+        view.sendPixmap.connect(scene.addItem)
+        view.resize(800, 600)
+        view.load_slide(SLIDE, 800, 600)
+    process_until(lambda: all(view.image_job is None and not view.is_zooming() for view in views))
+
+    with QMutexLocker(mutex):
+        counts.clear()
+    center = QPointF(400, 300)
+    for _ in range(ticks):
+        views[0].wheelEvent(QWheelEvent(center, center, QPoint(0, 0), QPoint(0, 120), Qt.MouseButton.NoButton,
+                                        Qt.KeyboardModifier.NoModifier, Qt.ScrollPhase.NoScrollPhase, False))
+        process_until(lambda: False, 1 / 60)
+    process_until(lambda: all(view.image_job is None and not view.is_zooming() for view in views))
+    return dict(counts)
+
+
+def test_linked_views_read_only_settled_levels():
+    single = zoom_in(1)
+    linked = zoom_in(2)
+
+    # the linked view follows the zoom like the zoomed view: it scales its tiles instead of reading the levels the
+    # zoom passes through
+    assert set(linked) <= set(single)
+    assert sum(linked.values()) <= 1.5 * sum(single.values())
@@ -2,3 +2,8 @@ from .slide_viewer import SlideView
 from .video_viewer import VideoPlayer
 from .image_viewer import ImageViewer
 
+from .slide_minimap import SlideMinimap
+from .annotation_layer import AnnotationStore, AnnotationLayer
+from .region_export import RegionExporter
+from .color_transform import CurvesTransform, Lut3DTransform, StainNormalization, TransformChain
+from .heatmap_layer import HeatmapLayer
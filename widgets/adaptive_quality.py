@@ -0,0 +1,89 @@
+import math
+import time
+from PySide6.QtCore import QPointF
+
+
+class AdaptiveQuality:
+    """
+    Decides when a SlideView reads a coarser level than the zoom needs. While the viewport moves fast and the tile
+    reads are slow, the detail of the full level cannot be seen anyway; reading one level coarser reads a fraction of
+    the pixels and the tiles are upscaled for display. Once the motion stops for refine_delay_ms, the view reads the
+    full level again. The thresholds depend on the storage: a local SSD rarely needs coarser reads, e.g.
+    AdaptiveQuality(max_read_ms=80), while a network share benefits from lower ones, e.g.
+    AdaptiveQuality(max_read_ms=20, min_speed=500).
+    """
+
+    def __init__(self, max_read_ms: float = 40, min_speed: float = 1000, max_level_offset: int = 1,
+                 refine_delay_ms: int = 200):
+        """
+        Initialization of the AdaptiveQuality
+        :param max_read_ms: read latency in milliseconds (queue wait and read) above which coarser levels are read.
+                            Every doubling of the latency reads one more level coarser, up to max_level_offset.
+        :type max_read_ms: float
+        :param min_speed: speed of the viewport in screen pixels per second above which coarser levels are read;
+                          zooming by a factor of two counts as moving by half the viewport diagonal
+        :type min_speed: float
+        :param max_level_offset: maximal number of levels read coarser than needed
+        :type max_level_offset: int
+        :param refine_delay_ms: time in milliseconds without motion after which the full level is read
+        :type refine_delay_ms: int
+        """
+        self.max_read_ms = max_read_ms
+        self.min_speed = min_speed
+        self.max_level_offset = max_level_offset
+        self.refine_delay_ms = refine_delay_ms
+
+        self.latency_ms = 0.0  # Smoothed read latency, updated by the reading threads
+        self.speed = 0.0  # Smoothed speed of the viewport in screen pixels per second
+        self.last_center: QPointF = None  # Viewport center in slide coordinates at the last update
+        self.last_downsample = 0.0
+        self.last_time = 0.0
+        self.last_motion = 0.0  # Time of the last motion
+
+    def record_latency(self, seconds: float):
+        """
+        Updates the read latency, called by the reading threads for every tile
+        :param seconds: time from the request of the tile to its delivery
+        :type seconds: float
+        :return: /
+        """
+        self.latency_ms = self.latency_ms * 0.8 + seconds * 1000 * 0.2
+
+    def track(self, center: QPointF, downsample: float, width: int, height: int):
+        """
+        Updates the speed of the viewport, called with every update of the view
+        :param center: center of the viewport in slide coordinates
+        :type center: QPointF
+        :param downsample: slide pixels per screen pixel
+        :type downsample: float
+        :param width: width of the viewport
+        :type width: int
+        :param height: height of the viewport
+        :type height: int
+        :return: /
+        """
+        now = time.perf_counter()
+        if self.last_center is not None and now > self.last_time:
+            move = center - self.last_center
+            distance = math.hypot(move.x(), move.y()) / downsample + \
+                abs(math.log2(downsample / self.last_downsample)) * math.hypot(width, height) / 2
+            if distance:
+                speed = distance / (now - self.last_time)
+                idle = (now - self.last_motion) * 1000 > self.refine_delay_ms
+                self.speed = speed if idle else self.speed * 0.5 + speed * 0.5
+                self.last_motion = now
+        self.last_center = QPointF(center)
+        self.last_downsample = downsample
+        self.last_time = now
+
+    def is_moving(self) -> bool:
+        return (time.perf_counter() - self.last_motion) * 1000 <= self.refine_delay_ms
+
+    def level_offset(self) -> int:
+        """
+        Decides how many levels coarser than needed are read
+        :return: the number of levels, 0 reads the full level
+        """
+        if not self.is_moving() or self.speed < self.min_speed or self.latency_ms < self.max_read_ms:
+            return 0
+        return min(self.max_level_offset, int(math.log2(self.latency_ms / self.max_read_ms)) + 1)
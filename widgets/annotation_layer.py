@@ -0,0 +1,263 @@
+from PySide6.QtCore import QPointF, QRectF
+from PySide6.QtGui import QColor, QPainter, QPainterPath, QPen, QPolygonF
+from PySide6.QtWidgets import QGraphicsItem, QStyleOptionGraphicsItem, QWidget
+import math
+import numpy as np
+
+
+class AnnotationStore:
+    """
+    Compact storage of polygon annotations, e.g. cell or region outlines of a segmentation model. All vertices are kept
+    in one float32 array in slide coordinates (level 0) with an offset array per polygon. A uniform grid indexes the
+    bounding boxes, so a query only touches the polygons near the queried rectangle. Simplified geometries are computed
+    once per tolerance and cached.
+    """
+
+    def __init__(self, cell_size: float = 2048):
+        """
+        Initialization of the AnnotationStore
+        :param cell_size: edge length of the cells of the spatial grid in slide coordinates
+        :type cell_size: float
+        """
+        self.cell_size = cell_size
+
+        self.vertices = np.zeros((0, 2), np.float32)  # vertices of all polygons
+        self.offsets = np.zeros(1, np.int64)  # polygon i consists of the vertices offsets[i]:offsets[i + 1]
+        self.bboxes = np.zeros((0, 4), np.float32)  # (x_min, y_min, x_max, y_max) of all polygons
+        self.classes = np.zeros(0, np.int32)  # class of all polygons
+        self.extent = QRectF()  # bounding rectangle of all polygons
+
+        self.grid_cols = 0
+        self.cell_keys = np.zeros(0, np.int64)  # sorted keys (row * grid_cols + col) of the grid cells
+        self.cell_polygons = np.zeros(0, np.int64)  # polygon in the cell of the same position in cell_keys
+        self.simplified_cache = {}  # tolerance -> (vertices, offsets)
+
+    @classmethod
+    def from_polygons(cls, polygons: list, classes=None, cell_size: float = 2048):
+        """
+        Creates a store from a list of polygons
+        :param polygons: arrays of shape (n, 2) with the vertices of the polygons in slide coordinates
+        :type polygons: list
+        :param classes: class of each polygon, defaults to 0
+        :param cell_size: edge length of the cells of the spatial grid in slide coordinates
+        :type cell_size: float
+        :return: the store
+        """
+        store = cls(cell_size)
+        store.add(polygons, classes)
+        return store
+
+    def add(self, polygons: list, classes=None):
+        """
+        Adds polygons and rebuilds the index
+        :param polygons: arrays of shape (n, 2) with the vertices of the polygons in slide coordinates
+        :type polygons: list
+        :param classes: class of each polygon, defaults to 0
+        :return: /
+        """
+        if not len(polygons):
+            return
+        counts = np.array([len(polygon) for polygon in polygons], np.int64)
+        vertices = np.concatenate([np.asarray(polygon, np.float32).reshape(-1, 2) for polygon in polygons])
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+        bboxes = np.empty((len(polygons), 4), np.float32)
+        bboxes[:, :2] = np.minimum.reduceat(vertices, starts)
+        bboxes[:, 2:] = np.maximum.reduceat(vertices, starts)
+
+        self.offsets = np.concatenate([self.offsets, self.offsets[-1] + np.cumsum(counts)])
+        self.vertices = np.concatenate([self.vertices, vertices])
+        self.bboxes = np.concatenate([self.bboxes, bboxes])
+        classes = np.zeros(len(polygons), np.int32) if classes is None else np.asarray(classes, np.int32)
+        self.classes = np.concatenate([self.classes, classes])
+
+        x_min, y_min = self.bboxes[:, :2].min(axis=0)
+        x_max, y_max = self.bboxes[:, 2:].max(axis=0)
+        self.extent = QRectF(float(x_min), float(y_min), float(x_max - x_min), float(y_max - y_min))
+        self.simplified_cache = {}
+        self.build_index()
+
+    def __len__(self) -> int:
+        return len(self.bboxes)
+
+    def build_index(self):
+        """
+        Builds the grid index: every polygon is listed in all cells overlapped by its bounding box
+        :return: /
+        """
+        cells = np.floor(np.maximum(self.bboxes, 0) / self.cell_size).astype(np.int64)
+        first_col, first_row, last_col, last_row = cells.T
+        self.grid_cols = int(last_col.max()) + 1 if len(cells) else 0
+
+        widths = last_col - first_col + 1
+        counts = widths * (last_row - first_row + 1)
+        polygons = np.repeat(np.arange(len(cells)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        widths = np.repeat(widths, counts)
+        keys = (np.repeat(first_row, counts) + local // widths) * self.grid_cols + np.repeat(first_col, counts) + \
+            local % widths
+
+        order = np.argsort(keys, kind='stable')
+        self.cell_keys = keys[order]
+        self.cell_polygons = polygons[order]
+
+    def query(self, rect: QRectF) -> np.ndarray:
+        """
+        Finds the polygons whose bounding box intersects a rectangle
+        :param rect: the rectangle in slide coordinates
+        :type rect: QRectF
+        :return: sorted indices of the polygons
+        """
+        if not len(self):
+            return np.zeros(0, np.int64)
+        first_col = max(int(rect.left() // self.cell_size), 0)
+        first_row = max(int(rect.top() // self.cell_size), 0)
+        last_col = min(int(rect.right() // self.cell_size), self.grid_cols - 1)
+        last_row = int(rect.bottom() // self.cell_size)
+        if last_col < first_col or last_row < first_row:
+            return np.zeros(0, np.int64)
+
+        rows = np.arange(first_row, last_row + 1, dtype=np.int64) * self.grid_cols
+        starts = np.searchsorted(self.cell_keys, rows + first_col, 'left')
+        ends = np.searchsorted(self.cell_keys, rows + last_col, 'right')
+        candidates = np.unique(np.concatenate([self.cell_polygons[start:end] for start, end in zip(starts, ends)]))
+
+        bboxes = self.bboxes[candidates]
+        inside = (bboxes[:, 0] <= rect.right()) & (bboxes[:, 2] >= rect.left()) & \
+                 (bboxes[:, 1] <= rect.bottom()) & (bboxes[:, 3] >= rect.top())
+        return candidates[inside]
+
+    def simplified(self, tolerance: float) -> tuple:
+        """
+        Simplifies all polygons by snapping their vertices to a grid of the given size and removing consecutive
+        vertices in the same grid cell. The result is cached per tolerance.
+        :param tolerance: edge length of the grid in slide coordinates, e.g. the size of a screen pixel
+        :type tolerance: float
+        :return: vertices and offsets of the simplified polygons, same layout as vertices and offsets of the store
+        """
+        result = self.simplified_cache.get(tolerance)
+        if result is not None:
+            return result
+        if tolerance <= 1 or not len(self):
+            return self.vertices, self.offsets
+
+        snapped = np.floor(self.vertices / tolerance).astype(np.int64)
+        keep = np.ones(len(snapped), bool)
+        keep[1:] = np.any(snapped[1:] != snapped[:-1], axis=1)
+        keep[self.offsets[:-1]] = True  # the first vertex of each polygon
+
+        counts = np.add.reduceat(keep, self.offsets[:-1]) if len(keep) else np.zeros(0, np.int64)
+        result = (self.vertices[keep], np.concatenate([[0], np.cumsum(counts)]))
+        self.simplified_cache[tolerance] = result
+        return result
+
+
+class AnnotationLayer(QGraphicsItem):
+    """
+    Overlay of the polygons of an AnnotationStore. Add the layer to a SlideView with add_overlay; its coordinates are
+    slide coordinates (level 0). Only the polygons intersecting the viewport (plus a margin) are drawn, simplified to
+    the current zoom and batched into one path per class. The batches are reused while the viewport stays inside the
+    margin and the zoom level does not change.
+    """
+    default_colors = [QColor(0, 200, 0), QColor(220, 0, 0), QColor(0, 90, 255), QColor(240, 200, 0),
+                      QColor(200, 0, 200), QColor(0, 200, 200)]
+
+    def __init__(self, store: AnnotationStore, colors: dict = None, line_width: float = 1,
+                 max_polygons: int = 50000, parent: QGraphicsItem = None):
+        """
+        Initialization of the AnnotationLayer
+        :param store: the annotations
+        :type store: AnnotationStore
+        :param colors: class -> QColor of the polygons, defaults to a fixed palette
+        :type colors: dict
+        :param line_width: width of the outlines in screen pixels, wider lines are drawn considerably slower
+        :type line_width: float
+        :param max_polygons: polygons drawn as outline at most, more visible polygons are drawn as points
+        :type max_polygons: int
+        :param parent: the parent item
+        :type parent: QGraphicsItem
+        """
+        super().__init__(parent)
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption)
+        self.setZValue(1)  # above all tiles
+
+        self.store = store
+        self.colors = colors or {}
+        self.line_width = line_width
+        self.max_polygons = max_polygons
+
+        self.batch_rect = QRectF()  # area covered by the batches in slide coordinates
+        self.batch_tolerance = 0.0  # simplification of the batches
+        self.batches = []  # (class, QPainterPath of the outlines, QPolygonF of the points)
+
+    def color(self, cls: int) -> QColor:
+        return self.colors.get(cls, self.default_colors[cls % len(self.default_colors)])
+
+    def set_store(self, store: AnnotationStore):
+        """
+        Displays other annotations
+        :param store: the annotations
+        :type store: AnnotationStore
+        :return: /
+        """
+        self.prepareGeometryChange()
+        self.store = store
+        self.batch_rect = QRectF()
+        self.update()
+
+    def boundingRect(self) -> QRectF:
+        return self.store.extent
+
+    def build_batches(self, rect: QRectF, tolerance: float):
+        """
+        Collects the polygons of a rectangle into one path per class. Polygons that collapse to less than three
+        vertices, or all polygons if there are more than max_polygons, are collected as points.
+        :param rect: the area in slide coordinates
+        :type rect: QRectF
+        :param tolerance: the simplification
+        :type tolerance: float
+        :return: /
+        """
+        polygons = self.store.query(rect)
+        vertices, offsets = self.store.simplified(tolerance)
+        starts, ends = offsets[polygons], offsets[polygons + 1]
+        as_points = (ends - starts < 3) | (len(polygons) > self.max_polygons)
+
+        self.batches = []
+        for cls in np.unique(self.store.classes[polygons]):
+            of_class = self.store.classes[polygons] == cls
+            path = QPainterPath()
+            for start, end in zip(starts[of_class & ~as_points], ends[of_class & ~as_points]):
+                path.addPolygon(QPolygonF([QPointF(x, y) for x, y in vertices[start:end].tolist()]))
+                path.closeSubpath()
+            centers = self.store.bboxes[polygons[of_class & as_points]]
+            centers = (centers[:, :2] + centers[:, 2:]) / 2
+            if tolerance > 1:  # one point per screen pixel is enough
+                centers = (np.unique(np.floor(centers / tolerance), axis=0) + 0.5) * tolerance
+            points = QPolygonF([QPointF(x, y) for x, y in centers.tolist()])
+            self.batches.append((int(cls), path, points))
+
+        self.batch_rect = rect
+        self.batch_tolerance = tolerance
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: QWidget = None):
+        scale = painter.worldTransform().m11()
+        if scale <= 0 or not len(self.store):
+            return
+        # simplify to the power of two below the size of a screen pixel, so the cache is hit at all zooms of a level
+        tolerance = 2.0 ** math.floor(math.log2(1 / scale)) if scale < 1 else 0.0
+        exposed = option.exposedRect
+        if tolerance != self.batch_tolerance or not self.batch_rect.contains(exposed):
+            margin = max(exposed.width(), exposed.height()) / 4
+            self.build_batches(exposed.adjusted(-margin, -margin, margin, margin), tolerance)
+
+        painter.setBrush(QColor(0, 0, 0, 0))
+        for cls, path, points in self.batches:
+            pen = QPen(self.color(cls), self.line_width)
+            pen.setCosmetic(True)
+            painter.setPen(pen)
+            painter.drawPath(path)
+            if not points.isEmpty():
+                pen.setWidthF(self.line_width * 2)
+                painter.setPen(pen)
+                painter.drawPoints(points)
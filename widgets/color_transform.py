@@ -0,0 +1,337 @@
+from abc import ABC, abstractmethod
+import hashlib
+import time
+from PySide6.QtCore import QObject, QRunnable, Signal
+import numpy as np
+from .tile_cache import TileCache, UniformTile
+
+
+class ColorTransform(ABC):
+    """
+    Base class of the display transforms of the tiles. A transform maps the RGB channels of an RGBA array with numpy
+    operations on whole tiles and keeps the alpha channel. Transforms are applied in the reading threads; the
+    transformed tiles are cached under the key of the raw tile extended by the transform_id, so the id has to change
+    whenever the result changes. Transforms with equal parameters have equal ids and share their cached tiles.
+    """
+    name = 'transform'
+
+    def __init__(self, parameters: bytes):
+        """
+        Initialization of the ColorTransform
+        :param parameters: all parameters of the transform, the transform_id is a hash of them
+        :type parameters: bytes
+        """
+        self.transform_id = f'{self.name}:{hashlib.sha1(parameters).hexdigest()[:16]}'
+
+    @abstractmethod
+    def apply_rgb(self, rgb: np.ndarray) -> np.ndarray:
+        """
+        Transforms pixels, implemented by the subclasses
+        :param rgb: array of shape (n, 3) and type uint8
+        :type rgb: np.ndarray
+        :return: the transformed pixels of shape (n, 3), of type uint8 or of a float type in the range [0, 255]
+        """
+
+    def apply(self, array: np.ndarray) -> np.ndarray:
+        """
+        Transforms an RGBA array
+        :param array: array of shape (height, width, 4) and type uint8
+        :type array: np.ndarray
+        :return: read-only RGBA array of the same shape
+        """
+        rgb = self.apply_rgb(array[..., :3].reshape(-1, 3))
+        result = np.empty(array.shape, np.uint8)
+        if rgb.dtype == np.uint8:
+            result[..., :3] = rgb.reshape(array.shape[:2] + (3,))
+        else:
+            result[..., :3] = np.clip(rgb + 0.5, 0, 255).reshape(array.shape[:2] + (3,))
+        result[..., 3] = array[..., 3]
+        result.flags.writeable = False
+        return result
+
+    def apply_tile(self, tile):
+        """
+        Transforms a tile of the TileCache
+        :param tile: the tile as RGBA array or UniformTile
+        :return: the transformed tile of the same type
+        """
+        if isinstance(tile, UniformTile):
+            return UniformTile(self.apply(tile.color.reshape(1, 1, 4)).reshape(4), tile.shape)
+        return self.apply(tile)
+
+
+class CurvesTransform(ColorTransform):
+    """
+    Per-channel curves, e.g. brightness, contrast and gamma. Each channel is mapped by a lookup table of 256 entries,
+    which costs one indexing operation per channel.
+    """
+    name = 'curves'
+
+    def __init__(self, curves: np.ndarray):
+        """
+        Initialization of the CurvesTransform
+        :param curves: lookup tables of shape (256,) for all channels or (3, 256) for the red, green and blue channel,
+                       values in the range [0, 255]
+        :type curves: np.ndarray
+        """
+        curves = np.clip(np.round(np.asarray(curves, np.float64)), 0, 255).astype(np.uint8)
+        self.curves = np.ascontiguousarray(np.broadcast_to(curves, (3, 256)))
+        super().__init__(self.curves.tobytes())
+
+    @classmethod
+    def levels(cls, brightness: float = 0.0, contrast: float = 1.0, gamma=1.0):
+        """
+        Creates the curves of the usual display adjustments, applied in this order
+        :param brightness: offset in the range [-1, 1]
+        :type brightness: float
+        :param contrast: slope around the mid gray, 1 keeps the contrast
+        :type contrast: float
+        :param gamma: gamma of all channels or of the red, green and blue channel, values above 1 brighten the image
+        :type gamma: float or tuple
+        :return: the transform
+        """
+        values = np.linspace(0, 1, 256)
+        values = np.clip((values - 0.5) * contrast + 0.5 + brightness, 0, 1)
+        gamma = np.asarray(gamma, np.float64).reshape(-1, 1)
+        return cls(values ** (1 / gamma) * 255)
+
+    def apply_rgb(self, rgb: np.ndarray) -> np.ndarray:
+        result = np.empty_like(rgb)
+        for channel in range(3):
+            np.take(self.curves[channel], rgb[:, channel], out=result[:, channel])
+        return result
+
+
+class Lut3DTransform(ColorTransform):
+    """
+    3D lookup table, which maps every color to another one, e.g. a color calibration of a scanner. The table samples
+    the RGB cube on a regular grid; colors between the samples are interpolated trilinearly.
+    """
+    name = 'lut3d'
+
+    def __init__(self, lut: np.ndarray):
+        """
+        Initialization of the Lut3DTransform
+        :param lut: table of shape (n, n, n, 3) indexed by red, green and blue, values in the range [0, 255]
+        :type lut: np.ndarray
+        """
+        lut = np.asarray(lut, np.float32)
+        self.size = lut.shape[0]
+        self.lut = np.ascontiguousarray(lut.reshape(-1, 3).T)  # one flat table per output channel
+        super().__init__(self.lut.tobytes())
+
+    @classmethod
+    def from_cube(cls, path: str):
+        """
+        Reads a 3D lookup table in the Adobe/Resolve .cube format with values in the range [0, 1]
+        :param path: path of the file
+        :type path: str
+        :return: the transform
+        """
+        size, values = 0, []
+        with open(path) as file:
+            for line in file:
+                fields = line.split()
+                if not fields or line.startswith('#'):
+                    continue
+                if fields[0] == 'LUT_3D_SIZE':
+                    size = int(fields[1])
+                elif fields[0][0].isdigit() or fields[0][0] in '-.':
+                    values.append([float(value) for value in fields[:3]])
+        if not size or len(values) != size ** 3:
+            raise ValueError(f'{path} is not a 3D lookup table')
+        # the red index changes fastest in the file
+        lut = np.array(values, np.float32).reshape(size, size, size, 3).transpose(2, 1, 0, 3)
+        return cls(lut * 255)
+
+    def apply_rgb(self, rgb: np.ndarray) -> np.ndarray:
+        size = self.size
+        position = rgb.astype(np.float32) * np.float32((size - 1) / 255)
+        low = np.minimum(position.astype(np.int32), size - 2)
+        red, green, blue = (position - low).T
+        base = (low[:, 0] * size + low[:, 1]) * size + low[:, 2]
+        corners = [base + offset for offset in (0, 1, size, size + 1, size ** 2, size ** 2 + 1, size ** 2 + size,
+                                                size ** 2 + size + 1)]
+
+        # flat gathers per channel are considerably faster than gathers of rows
+        result = np.empty(rgb.shape, np.float32)
+        for channel in range(3):
+            values = [self.lut[channel].take(corner) for corner in corners]
+            blue_lerp = [low_value + (high_value - low_value) * blue
+                         for low_value, high_value in zip(values[::2], values[1::2])]
+            green_lerp = [low_value + (high_value - low_value) * green
+                          for low_value, high_value in zip(blue_lerp[::2], blue_lerp[1::2])]
+            result[:, channel] = green_lerp[0] + (green_lerp[1] - green_lerp[0]) * red
+        return result
+
+
+def estimate_stains(image: np.ndarray, luminosity: float = 0.15, percentile: float = 1, max_pixels: int = 1000000,
+                    white: float = 240) -> tuple:
+    """
+    Estimates the hematoxylin and eosin stain vectors of an H&E image with the method of Macenko et al., e.g. of the
+    overview of a slide
+    :param image: RGB or RGBA array of the image
+    :type image: np.ndarray
+    :param luminosity: smallest optical density of the tissue pixels, lower densities are background
+    :type luminosity: float
+    :param percentile: percentile of the angles of the extreme stain vectors
+    :type percentile: float
+    :param max_pixels: the tissue pixels are subsampled to this number
+    :type max_pixels: int
+    :param white: intensity of the background light
+    :type white: float
+    :return: stain vectors as rows of an array of shape (2, 3) and the 99th percentile of the concentrations of both
+             stains
+    """
+    density = -np.log((image[..., :3].reshape(-1, 3).astype(np.float64) + 1) / white)
+    density = density[np.all(density > luminosity, axis=1)]
+    if len(density) < 10:
+        raise ValueError('the image contains no stained tissue')
+    density = density[::max(1, len(density) // max_pixels)]
+
+    # the plane of the two main directions contains both stains, which are the extreme directions within the plane
+    _, vectors = np.linalg.eigh(np.cov(density.T))
+    plane = vectors[:, 1:3]
+    projected = density @ plane
+    angles = np.arctan2(projected[:, 1], projected[:, 0])
+    low, high = np.percentile(angles, [percentile, 100 - percentile])
+    stains = np.array([plane @ [np.cos(low), np.sin(low)], plane @ [np.cos(high), np.sin(high)]])
+    stains *= np.sign(stains.sum(axis=1, keepdims=True))
+    if stains[0, 0] < stains[1, 0]:  # hematoxylin absorbs more red light than eosin
+        stains = stains[::-1]
+    stains /= np.linalg.norm(stains, axis=1, keepdims=True)
+
+    concentrations = np.linalg.lstsq(stains.T, density.T, rcond=None)[0]
+    return stains, np.percentile(concentrations, 99, axis=1)
+
+
+class StainNormalization(Lut3DTransform):
+    """
+    Stain normalization of H&E slides of different scanners and labs (Macenko et al.): the colors of a slide are
+    decomposed into the concentrations of its stains, which are scaled to the concentrations of a reference and
+    recomposed with the stain vectors of the reference. The mapping only depends on the color, so it is sampled once
+    into a 3D lookup table and applied to the tiles by interpolation.
+    """
+    name = 'stain'
+
+    def __init__(self, stains: np.ndarray, max_concentrations: np.ndarray, target_stains: np.ndarray,
+                 target_max_concentrations: np.ndarray, size: int = 33, white: float = 240):
+        """
+        Initialization of the StainNormalization, see estimate_stains for the parameters of the slide and the reference
+        :param stains: stain vectors of the slide
+        :type stains: np.ndarray
+        :param max_concentrations: concentrations of the stains of the slide
+        :type max_concentrations: np.ndarray
+        :param target_stains: stain vectors of the reference
+        :type target_stains: np.ndarray
+        :param target_max_concentrations: concentrations of the stains of the reference
+        :type target_max_concentrations: np.ndarray
+        :param size: number of samples of the lookup table along each axis
+        :type size: int
+        :param white: intensity of the background light
+        :type white: float
+        """
+        samples = np.linspace(0, 255, size)
+        colors = np.stack(np.meshgrid(samples, samples, samples, indexing='ij'), axis=-1).reshape(-1, 3)
+        density = -np.log((colors + 1) / white)
+        concentrations = density @ np.linalg.pinv(np.asarray(stains))
+        concentrations *= np.asarray(target_max_concentrations) / np.asarray(max_concentrations)
+        normalized = white * np.exp(-np.maximum(concentrations, 0) @ np.asarray(target_stains))
+        # background and unstained colors keep their color
+        unstained = np.all(density <= 0, axis=1)
+        normalized[unstained] = colors[unstained]
+        super().__init__(np.clip(normalized, 0, 255).reshape(size, size, size, 3))
+
+    @classmethod
+    def fit(cls, image: np.ndarray, reference: np.ndarray, size: int = 33):
+        """
+        Creates the normalization of a slide to a reference image
+        :param image: image of the slide, e.g. its overview (SlideView.overview)
+        :type image: np.ndarray
+        :param reference: RGB or RGBA array of a reference image of the desired staining
+        :type reference: np.ndarray
+        :param size: number of samples of the lookup table along each axis
+        :type size: int
+        :return: the transform
+        """
+        return cls(*estimate_stains(image), *estimate_stains(reference), size=size)
+
+
+class TransformChain(ColorTransform):
+    """
+    Several transforms applied one after the other, e.g. a stain normalization followed by a gamma adjustment
+    """
+    name = 'chain'
+
+    def __init__(self, transforms: list):
+        """
+        Initialization of the TransformChain
+        :param transforms: the transforms in the order of application
+        :type transforms: list
+        """
+        self.transforms = list(transforms)
+        super().__init__(' '.join(transform.transform_id for transform in self.transforms).encode())
+
+    def apply_rgb(self, rgb: np.ndarray) -> np.ndarray:
+        for transform in self.transforms:
+            rgb = transform.apply_rgb(rgb)
+            if rgb.dtype != np.uint8:
+                rgb = np.clip(rgb + 0.5, 0, 255).astype(np.uint8)
+        return rgb
+
+
+def transform_tile(tile, transform: ColorTransform, tile_cache: TileCache, key: tuple, metrics=None):
+    """
+    Transforms a raw tile and caches the result
+    :param tile: the raw tile as RGBA array or UniformTile
+    :param transform: the transform
+    :type transform: ColorTransform
+    :param tile_cache: the cache of the transformed tiles
+    :type tile_cache: TileCache
+    :param key: key of the transformed tile, i.e. the key of the raw tile extended by the transform_id
+    :type key: tuple
+    :param metrics: optional instrumentation, which records the durations of the transforms
+    :type metrics: ViewMetrics
+    :return: the transformed tile
+    """
+    start = time.perf_counter()
+    tile = transform.apply_tile(tile)
+    if metrics is not None:
+        metrics.record('color_transform', time.perf_counter() - start)
+    tile_cache.put(key, tile)
+    return tile
+
+
+class TransformLoader(QObject):
+    transformed = Signal(str, object)
+
+    def __init__(self, image: np.ndarray, transform: ColorTransform):
+        """
+        Initialization of the TransformLoader, which transforms an image in the background, e.g. the overview of a
+        slide
+        :param image: the RGBA array
+        :type image: np.ndarray
+        :param transform: the transform, its transform_id is emitted with the transformed image
+        :type transform: ColorTransform
+        """
+        super().__init__()
+        self.worker = TransformWorker(self, image, transform)
+
+
+class TransformWorker(QRunnable):
+
+    def __init__(self, loader: TransformLoader, image: np.ndarray, transform: ColorTransform):
+        super().__init__()
+        self.loader = loader
+        self.image = image
+        self.transform = transform
+
+    def run(self):
+        try:
+            image = self.transform.apply(self.image)
+        except Exception:  # a broken transform must not break the viewer, the raw image is displayed instead
+            image = None
+        try:
+            self.loader.transformed.emit(self.transform.transform_id, image)
+        except RuntimeError:  # the loader is deleted if the application quits while transforming
+            pass
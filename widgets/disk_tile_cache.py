@@ -0,0 +1,264 @@
+from collections import OrderedDict
+from PySide6.QtCore import QMutex, QMutexLocker
+from PIL import Image
+from stat import S_ISREG
+import hashlib
+import io
+import numpy as np
+import os
+
+
+class DiskTileCache:
+    """
+    Persistent tile cache in a local directory, so slides on slow or network-mounted storage render from local disk
+    in later sessions. Tiles are keyed by the identity of the slide file (path, size and modification time), the
+    level, the tile size and the tile position; a changed file therefore never returns stale tiles. The size of the
+    directory is bounded, the least recently used tiles are deleted first.
+    """
+    extensions = {'jpeg': '.jpg', 'webp': '.webp', 'png': '.png', 'raw': '.npy'}
+
+    def __init__(self, directory: str, max_bytes: int = 2 * 1024 ** 3, compression: str = 'jpeg', quality: int = 90):
+        """
+        Initialization of the DiskTileCache
+        :param directory: the cache directory, created if it does not exist
+        :type directory: str
+        :param max_bytes: maximal size of all cached tiles in bytes
+        :type max_bytes: int
+        :param compression: 'jpeg', 'webp', 'png' or 'raw' (uncompressed numpy files). Lossy formats store tiles with
+                            transparent pixels as png, since the transparency would be lost.
+        :type compression: str
+        :param quality: quality of the lossy formats
+        :type quality: int
+        """
+        if compression not in self.extensions:
+            raise ValueError(f'An incorrect compression: {compression} was chosen!')
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.quality = quality
+
+        self.cur_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        self.files = OrderedDict()  # path -> size in bytes, ordered from least to most recently used
+        self.slide_tokens = {}  # filepath -> token of the slide file
+        self.mutex = QMutex()
+
+        os.makedirs(directory, exist_ok=True)
+        self.scan()
+
+    def scan(self):
+        """
+        Indexes the tiles of previous sessions, ordered by their last use
+        :return: /
+        """
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                if os.path.splitext(name)[1] not in self.extensions.values():
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, path, stat.st_size))
+
+        with QMutexLocker(self.mutex):
+            self.files.clear()
+            self.cur_bytes = 0
+            for _, path, size in sorted(entries):
+                self.files[path] = size
+                self.cur_bytes += size
+
+    def slide_token(self, filepath: str, refresh: bool = False) -> str:
+        """
+        Returns the token identifying a slide file. The token is computed once per file and session. Slides that are
+        not files, e.g. backend urls, have no token and are not cached.
+        :param filepath: path of the slide
+        :type filepath: str
+        :param refresh: recomputes the token, e.g. if the slide is loaded again
+        :type refresh: bool
+        :return: the token or None if the slide is not a file
+        """
+        if filepath not in self.slide_tokens or refresh:
+            token = None
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                stat = None
+            if stat is not None and S_ISREG(stat.st_mode):
+                path = os.path.abspath(filepath)
+                token = hashlib.sha1(f'{path}|{stat.st_size}|{stat.st_mtime_ns}'.encode()).hexdigest()
+            self.slide_tokens[filepath] = token
+        return self.slide_tokens[filepath]
+
+    def tile_path(self, filepath: str, level: int, tile_size: int, col: int, row: int, extension: str) -> str:
+        """
+        Utility method to get the path of a cached tile
+        :return: path of the tile or None if the slide is not a file
+        """
+        token = self.slide_token(filepath)
+        if token is None:
+            return None
+        return os.path.join(self.directory, token[:2], token, f'{level}_{tile_size}', f'{col}_{row}{extension}')
+
+    def get(self, filepath: str, level: int, tile_size: int, col: int, row: int) -> np.ndarray:
+        """
+        Loads a cached tile and marks it as most recently used
+        :param filepath: path of the slide
+        :type filepath: str
+        :param level: level of the tile
+        :type level: int
+        :param tile_size: edge length of the tiles in pixels of their level
+        :type tile_size: int
+        :param col: column of the tile in the tile grid of the level
+        :type col: int
+        :param row: row of the tile in the tile grid of the level
+        :type row: int
+        :return: the tile as RGBA array or None if it is not cached
+        """
+        try:
+            token_path = self.tile_path(filepath, level, tile_size, col, row, '')
+        except OSError:
+            return None
+        if token_path is None:
+            return None
+
+        for extension in (self.extensions[self.compression], '.png'):
+            path = token_path + extension
+            with QMutexLocker(self.mutex):
+                if path not in self.files:
+                    continue
+                self.files.move_to_end(path)
+            try:
+                tile = self.decode(path)
+                os.utime(path)
+            except (OSError, ValueError):
+                self.remove(path)
+                continue
+            with QMutexLocker(self.mutex):
+                self.hits += 1
+            return tile
+
+        with QMutexLocker(self.mutex):
+            self.misses += 1
+        return None
+
+    def put(self, filepath: str, level: int, tile_size: int, col: int, row: int, tile: np.ndarray):
+        """
+        Stores a tile and deletes the least recently used tiles until the size limit is met
+        :param filepath: path of the slide
+        :type filepath: str
+        :param level: level of the tile
+        :type level: int
+        :param tile_size: edge length of the tiles in pixels of their level
+        :type tile_size: int
+        :param col: column of the tile in the tile grid of the level
+        :type col: int
+        :param row: row of the tile in the tile grid of the level
+        :type row: int
+        :param tile: the tile as RGBA array
+        :type tile: np.ndarray
+        :return: /
+        """
+        extension = self.extensions[self.compression]
+        if self.compression in ('jpeg', 'webp') and not np.all(tile[..., 3] == 255):
+            extension = '.png'
+
+        try:
+            path = self.tile_path(filepath, level, tile_size, col, row, extension)
+            if path is None:
+                return
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            data = self.encode(tile, extension)
+            # write to a temporary file first, so other sessions never read a partially written tile
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+
+        with QMutexLocker(self.mutex):
+            self.cur_bytes -= self.files.pop(path, 0)
+            self.files[path] = len(data)
+            self.cur_bytes += len(data)
+            evicted = []
+            while self.cur_bytes > self.max_bytes and self.files:
+                evicted_path, evicted_bytes = self.files.popitem(last=False)
+                self.cur_bytes -= evicted_bytes
+                evicted.append(evicted_path)
+
+        for evicted_path in evicted:
+            try:
+                os.remove(evicted_path)
+            except OSError:
+                pass
+
+    def remove(self, path: str):
+        """
+        Deletes a cached tile, e.g. if it cannot be decoded
+        :param path: path of the tile
+        :type path: str
+        :return: /
+        """
+        with QMutexLocker(self.mutex):
+            self.cur_bytes -= self.files.pop(path, 0)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def encode(self, tile: np.ndarray, extension: str) -> bytes:
+        """
+        Encodes a tile for the given file extension
+        :param tile: the tile as RGBA array
+        :type tile: np.ndarray
+        :param extension: file extension of the format
+        :type extension: str
+        :return: the encoded tile
+        """
+        buffer = io.BytesIO()
+        if extension == '.npy':
+            np.save(buffer, tile)
+        elif extension == '.png':
+            Image.fromarray(tile, 'RGBA').save(buffer, format='PNG', compress_level=1)
+        else:
+            Image.fromarray(tile[..., :3], 'RGB').save(buffer, format='JPEG' if extension == '.jpg' else 'WEBP',
+                                                      quality=self.quality)
+        return buffer.getvalue()
+
+    @staticmethod
+    def decode(path: str) -> np.ndarray:
+        """
+        Decodes a cached tile
+        :param path: path of the tile
+        :type path: str
+        :return: the tile as read-only RGBA array
+        """
+        if path.endswith('.npy'):
+            tile = np.load(path)
+        else:
+            with Image.open(path) as image:
+                tile = np.asarray(image.convert('RGBA'))
+        tile = np.ascontiguousarray(tile, dtype=np.uint8)
+        tile.flags.writeable = False
+        return tile
+
+    def clear(self):
+        """
+        Deletes all cached tiles
+        :return: /
+        """
+        with QMutexLocker(self.mutex):
+            paths = list(self.files)
+            self.files.clear()
+            self.cur_bytes = 0
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
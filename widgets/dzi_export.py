@@ -0,0 +1,449 @@
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PySide6.QtCore import QRunnable, QThreadPool
+from PIL import Image
+import argparse
+import io
+import json
+import math
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import numpy as np
+from .slide_handles import SlideHandlePool
+
+FORMATS = {'jpeg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP'}
+VIEWER_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{name}</title>
+<script src="https://cdn.jsdelivr.net/npm/openseadragon@4.1/build/openseadragon/openseadragon.min.js"></script>
+</head><body style="margin:0">
+<div id="viewer" style="width:100vw;height:100vh;background:#fff"></div>
+<script>OpenSeadragon({{id: "viewer", tileSources: "{name}.dzi",
+    prefixUrl: "https://cdn.jsdelivr.net/npm/openseadragon@4.1/build/openseadragon/images/"}});</script>
+</body></html>
+"""
+
+
+def slide_name(filepath: str) -> str:
+    """
+    Utility method to derive a file name from the path or url of a slide
+    :return: the name without extension
+    """
+    name = os.path.splitext(os.path.basename(filepath.rstrip('/')))[0]
+    return re.sub(r'[^\w.-]+', '_', name).strip('_') or 'slide'
+
+
+class DeepZoomPyramid:
+    """
+    Tile geometry of the Deep Zoom (DZI) pyramid of a slide. Deep Zoom levels halve the resolution from the full
+    resolution (highest level) down to a single pixel (level 0); each tile is read from the slide level that is closest
+    to, but not coarser than, its Deep Zoom level and scaled down.
+    """
+
+    def __init__(self, slide, tile_size: int = 254, overlap: int = 1, tile_format: str = 'jpeg', quality: int = 90,
+                 background=(255, 255, 255)):
+        """
+        Initialization of the DeepZoomPyramid
+        :param slide: the slide
+        :type slide: SlideBackend
+        :param tile_size: edge length of the tiles without overlap
+        :type tile_size: int
+        :param overlap: pixels added to each inner edge of a tile
+        :type overlap: int
+        :param tile_format: 'jpeg', 'png' or 'webp'
+        :type tile_format: str
+        :param quality: quality of the lossy formats
+        :type quality: int
+        :param background: color of the transparent pixels outside the slide
+        :type background: tuple
+        """
+        if tile_format not in FORMATS:
+            raise ValueError(f'An incorrect tile format: {tile_format} was chosen!')
+
+        self.slide = slide
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.tile_format = tile_format
+        self.quality = quality
+        self.background = background
+
+        width, height = slide.dimensions
+        self.level_count = math.ceil(math.log2(max(width, height))) + 1
+        self.level_dimensions = [(math.ceil(width / 2 ** (self.level_count - 1 - level)),
+                                  math.ceil(height / 2 ** (self.level_count - 1 - level)))
+                                 for level in range(self.level_count)]
+        self.level_tiles = [(math.ceil(width / tile_size), math.ceil(height / tile_size))
+                            for width, height in self.level_dimensions]
+
+    @property
+    def tile_count(self) -> int:
+        return sum(cols * rows for cols, rows in self.level_tiles)
+
+    def get_dzi(self) -> str:
+        """
+        Creates the descriptor of the pyramid
+        :return: the xml of the .dzi file
+        """
+        width, height = self.slide.dimensions
+        return (f'<?xml version="1.0" encoding="UTF-8"?>\n'
+                f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="{self.tile_format}" '
+                f'Overlap="{self.overlap}" TileSize="{self.tile_size}"><Size Width="{width}" Height="{height}"/>'
+                f'</Image>\n')
+
+    def tiles(self):
+        """
+        Generates the keys of all tiles, from the coarsest level to the full resolution
+        :return: generator of (level, col, row)
+        """
+        for level, (cols, rows) in enumerate(self.level_tiles):
+            for row in range(rows):
+                for col in range(cols):
+                    yield level, col, row
+
+    def get_tile(self, level: int, col: int, row: int) -> Image.Image:
+        """
+        Reads a tile of the pyramid
+        :param level: Deep Zoom level of the tile
+        :type level: int
+        :param col: column of the tile
+        :type col: int
+        :param row: row of the tile
+        :type row: int
+        :return: the tile as RGB image
+        """
+        level_width, level_height = self.level_dimensions[level]
+        left = max(col * self.tile_size - self.overlap, 0)
+        top = max(row * self.tile_size - self.overlap, 0)
+        right = min((col + 1) * self.tile_size + self.overlap, level_width)
+        bottom = min((row + 1) * self.tile_size + self.overlap, level_height)
+        if left >= right or top >= bottom:
+            raise ValueError(f'The tile ({level}, {col}, {row}) is outside the pyramid!')
+
+        downsample = 2 ** (self.level_count - 1 - level)
+        slide_level = self.slide.get_best_level_for_downsample(downsample)
+        slide_downsample = self.slide.level_downsamples[slide_level]
+        size = (math.ceil((right - left) * downsample / slide_downsample),
+                math.ceil((bottom - top) * downsample / slide_downsample))
+        region = self.slide.read_region((left * downsample, top * downsample), slide_level, size)
+        if not isinstance(region, Image.Image):
+            region = Image.fromarray(np.asarray(region), 'RGBA')
+
+        tile = Image.new('RGB', region.size, self.background)
+        tile.paste(region, mask=region.getchannel('A') if region.mode == 'RGBA' else None)
+        if tile.size != (right - left, bottom - top):
+            tile = tile.resize((right - left, bottom - top), Image.Resampling.LANCZOS)
+        return tile
+
+    def encode_tile(self, tile: Image.Image) -> bytes:
+        """
+        Encodes a tile in the tile format of the pyramid
+        :return: the encoded tile
+        """
+        buffer = io.BytesIO()
+        tile.save(buffer, FORMATS[self.tile_format], quality=self.quality)
+        return buffer.getvalue()
+
+
+class DeepZoomStore:
+    """
+    Static Deep Zoom pyramid in a directory: {name}.dzi and {name}_files/{level}/{col}_{row}.{format}. Tiles are
+    written atomically, so an interrupted export is resumed by skipping the existing tiles, and the tile server uses
+    the directory as cache. The parameters of the tiles are stored in {name}_files/parameters.json; existing tiles
+    written with other parameters are deleted, so a pyramid never mixes tiles of different exports.
+    """
+
+    def __init__(self, pyramid: DeepZoomPyramid, directory: str, name: str):
+        """
+        Initialization of the DeepZoomStore
+        :param pyramid: the pyramid
+        :type pyramid: DeepZoomPyramid
+        :param directory: the output directory, created if it does not exist
+        :type directory: str
+        :param name: name of the .dzi file
+        :type name: str
+        """
+        self.pyramid = pyramid
+        self.directory = directory
+        self.name = name
+        os.makedirs(directory, exist_ok=True)
+
+        descriptor = pyramid.get_dzi()
+        parameters = self.parameters()
+        files_directory = os.path.join(directory, f'{name}_files')
+        if os.path.isdir(files_directory) and (self.read(f'{name}.dzi') != descriptor.encode() or
+                                               self.read(f'{name}_files/parameters.json') != parameters):
+            shutil.rmtree(files_directory)
+        self.write(f'{name}_files/parameters.json', parameters)
+        self.write(f'{name}.dzi', descriptor.encode())
+
+    def parameters(self) -> bytes:
+        """
+        Serializes all parameters that change the encoded tiles, including those that are not part of the descriptor
+        :return: the parameters as json
+        """
+        pyramid = self.pyramid
+        return json.dumps({'size': list(pyramid.slide.dimensions), 'tile_size': pyramid.tile_size,
+                           'overlap': pyramid.overlap, 'format': pyramid.tile_format, 'quality': pyramid.quality,
+                           'background': list(pyramid.background)}, sort_keys=True).encode()
+
+    def read(self, path: str) -> bytes:
+        """
+        Reads a file of the store
+        :param path: path relative to the directory
+        :type path: str
+        :return: content of the file or None if it does not exist
+        """
+        try:
+            with open(os.path.join(self.directory, path), 'rb') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def tile_path(self, level: int, col: int, row: int) -> str:
+        return f'{self.name}_files/{level}/{col}_{row}.{self.pyramid.tile_format}'
+
+    def write(self, path: str, data: bytes):
+        """
+        Writes a file atomically
+        :param path: path relative to the directory
+        :type path: str
+        :param data: content of the file
+        :type data: bytes
+        :return: /
+        """
+        path = os.path.join(self.directory, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+
+    def get_tile(self, level: int, col: int, row: int) -> bytes:
+        """
+        Returns an encoded tile, which is read from the slide and stored if it does not exist yet
+        :return: the encoded tile
+        """
+        path = self.tile_path(level, col, row)
+        try:
+            with open(os.path.join(self.directory, path), 'rb') as file:
+                return file.read()
+        except FileNotFoundError:
+            data = self.pyramid.encode_tile(self.pyramid.get_tile(level, col, row))
+            self.write(path, data)
+            return data
+
+
+class DeepZoomWorker(QRunnable):
+
+    def __init__(self, store: DeepZoomStore, key: tuple, future: Future):
+        """
+        Initialization of the DeepZoomWorker, which exports a single tile
+        """
+        super().__init__()
+        self.store = store
+        self.key = key
+        self.future = future
+
+    def run(self):
+        if not self.future.set_running_or_notify_cancel():
+            return
+        try:
+            self.store.get_tile(*self.key)
+            self.future.set_result(self.key)
+        except Exception as e:
+            self.future.set_exception(e)
+
+
+def export_dzi(filepath: str, directory: str, name: str = None, tile_size: int = 254, overlap: int = 1,
+               tile_format: str = 'jpeg', quality: int = 90, slide_pool: SlideHandlePool = None,
+               thread_pool: QThreadPool = None, progress=None) -> dict:
+    """
+    Exports a slide as Deep Zoom pyramid. The tiles are read and encoded in parallel; existing tiles of an export with
+    the same parameters are skipped, so an interrupted export continues where it stopped. Tiles of an export with
+    other parameters are deleted first.
+    :param filepath: path of the slide, any path or url that a SlideView opens
+    :type filepath: str
+    :param directory: the output directory
+    :type directory: str
+    :param name: name of the .dzi file, defaults to the file name of the slide
+    :type name: str
+    :param tile_size: edge length of the tiles without overlap
+    :type tile_size: int
+    :param overlap: pixels added to each inner edge of a tile
+    :type overlap: int
+    :param tile_format: 'jpeg', 'png' or 'webp'
+    :type tile_format: str
+    :param quality: quality of the lossy formats
+    :type quality: int
+    :param slide_pool: pool of open slides, e.g. of a SlideView or with a ProcessTileReader as opener
+    :type slide_pool: SlideHandlePool
+    :param thread_pool: pool that exports the tiles, defaults to a pool of os.cpu_count() threads
+    :type thread_pool: QThreadPool
+    :param progress: function called with the number of finished and of all tiles after each tile
+    :return: statistics: tiles, written, skipped, seconds, tiles_per_second and tiles_per_second_per_thread
+    """
+    slide_pool = SlideHandlePool(per_thread=True) if slide_pool is None else slide_pool
+    if thread_pool is None:
+        thread_pool = QThreadPool()
+        thread_pool.setMaxThreadCount(os.cpu_count() or 1)
+    name = name or slide_name(filepath)
+    store = DeepZoomStore(DeepZoomPyramid(slide_pool.open(filepath), tile_size, overlap, tile_format, quality),
+                          directory, name)
+
+    total = store.pyramid.tile_count
+    done = skipped = 0
+    pending = deque()
+    start = time.perf_counter()
+    try:
+        for key in store.pyramid.tiles():
+            if os.path.exists(os.path.join(directory, store.tile_path(*key))):
+                skipped += 1
+                done += 1
+                continue
+            future = Future()
+            thread_pool.start(DeepZoomWorker(store, key, future))
+            pending.append(future)
+            while len(pending) >= 4 * thread_pool.maxThreadCount() or pending and pending[0].done():
+                pending.popleft().result()
+                done += 1
+                if progress is not None:
+                    progress(done, total)
+        while pending:
+            pending.popleft().result()
+            done += 1
+            if progress is not None:
+                progress(done, total)
+    finally:
+        for future in pending:
+            future.cancel()
+        thread_pool.waitForDone()
+
+    seconds = time.perf_counter() - start
+    written = total - skipped
+    return {'tiles': total, 'written': written, 'skipped': skipped, 'seconds': seconds,
+            'tiles_per_second': written / seconds if seconds else 0.0,
+            'tiles_per_second_per_thread': written / seconds / thread_pool.maxThreadCount() if seconds else 0.0}
+
+
+class DeepZoomHandler(BaseHTTPRequestHandler):
+    """
+    Serves a DeepZoomStore: the viewer page at /, the descriptor and the tiles, which are created on demand
+    """
+    store: DeepZoomStore = None
+    content_types = {'jpeg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp'}
+
+    def do_GET(self):
+        store = self.store
+        path = self.path.split('?')[0]
+        if path in ('/', '/index.html'):
+            self.send(VIEWER_PAGE.format(name=store.name).encode(), 'text/html')
+        elif path == f'/{store.name}.dzi':
+            self.send(store.pyramid.get_dzi().encode(), 'application/xml')
+        else:
+            match = re.fullmatch(rf'/{re.escape(store.name)}_files/(\d+)/(\d+)_(\d+)\.{store.pyramid.tile_format}',
+                                 path)
+            if match is None:
+                self.send_error(404)
+                return
+            try:
+                data = store.get_tile(*map(int, match.groups()))
+            except (ValueError, IndexError):
+                self.send_error(404)
+                return
+            self.send(data, self.content_types[store.pyramid.tile_format])
+
+    def send(self, data: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(store: DeepZoomStore, host: str = '127.0.0.1', port: int = 8000) -> ThreadingHTTPServer:
+    """
+    Creates a local HTTP server of a Deep Zoom pyramid, which reads missing tiles on demand and stores them in the
+    directory of the store. Run it with serve_forever.
+    :param store: the pyramid
+    :type store: DeepZoomStore
+    :param host: the address to listen on
+    :type host: str
+    :param port: the port to listen on, 0 picks a free port
+    :type port: int
+    :return: the server
+    """
+    handler = type('Handler', (DeepZoomHandler,), {'store': store})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description='Exports a slide as Deep Zoom (DZI) tile pyramid and optionally '
+                                                 'serves it to a web viewer.')
+    parser.add_argument('slide', help='slide file or backend url')
+    parser.add_argument('output', help='output directory')
+    parser.add_argument('--name', help='name of the .dzi file, defaults to the file name of the slide')
+    parser.add_argument('--tile-size', type=int, default=254)
+    parser.add_argument('--overlap', type=int, default=1)
+    parser.add_argument('--format', default='jpeg', choices=list(FORMATS))
+    parser.add_argument('--quality', type=int, default=90)
+    parser.add_argument('--threads', type=int, default=None, help='exporting threads, defaults to the cpu count')
+    parser.add_argument('--processes', type=int, default=0, help='decodes the slide in worker processes')
+    parser.add_argument('--serve', action='store_true',
+                        help='serves the pyramid instead of exporting it, missing tiles are created on demand')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    reader = None
+    slide_pool = SlideHandlePool(per_thread=True)
+    threads = args.threads or os.cpu_count() or 1
+    if args.processes:
+        from .process_tile_reader import ProcessTileReader
+        reader = ProcessTileReader(args.processes)
+        slide_pool = SlideHandlePool(opener=reader.open)
+        threads = args.threads or len(reader.slots)
+
+    try:
+        if args.serve:
+            name = args.name or slide_name(args.slide)
+            pyramid = DeepZoomPyramid(slide_pool.open(args.slide), args.tile_size, args.overlap, args.format,
+                                      args.quality)
+            server = create_server(DeepZoomStore(pyramid, args.output, name), args.host, args.port)
+            print(f'Serving http://{args.host}:{server.server_address[1]}/')
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                server.server_close()
+            return
+
+        thread_pool = QThreadPool()
+        thread_pool.setMaxThreadCount(threads)
+        start = time.perf_counter()
+
+        def progress(done, total):
+            if done == total or done % 100 == 0:
+                elapsed = time.perf_counter() - start
+                print(f'\r{done}/{total} tiles ({100 * done / total:.1f} %, {done / elapsed:.0f} tiles/s)', end='',
+                      file=sys.stderr, flush=True)
+
+        stats = export_dzi(args.slide, args.output, args.name, args.tile_size, args.overlap, args.format,
+                           args.quality, slide_pool, thread_pool, progress)
+        print(file=sys.stderr)
+        print(f'{stats["written"]} tiles written, {stats["skipped"]} skipped in {stats["seconds"]:.1f} s: '
+              f'{stats["tiles_per_second"]:.1f} tiles/s, {stats["tiles_per_second_per_thread"]:.1f} tiles/s per '
+              f'thread ({threads} threads)')
+    finally:
+        if reader is not None:
+            reader.close()
+
+
+if __name__ == '__main__':
+    main()
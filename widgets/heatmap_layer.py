@@ -0,0 +1,440 @@
+import hashlib
+import itertools
+import math
+from PySide6.QtCore import QMutex, QMutexLocker, QObject, QPointF, QRectF, Signal, Slot
+from PySide6.QtGui import QColor, QPainter, QPixmap, Qt
+from PySide6.QtWidgets import QGraphicsItem, QGraphicsObject, QGraphicsPixmapItem, QGraphicsRectItem, \
+    QStyleOptionGraphicsItem, QWidget
+import numpy as np
+from .image_conversion import array_to_qimage
+from .slide_backends import SlideBackend
+from .tile_cache import TileCache, UniformTile
+from .tile_scheduler import TileRequest, TileScheduler
+
+# anchor colors of the built-in colormaps, interpolated to 256 entries
+COLORMAPS = {
+    'viridis': [(68, 1, 84), (59, 82, 139), (33, 145, 140), (94, 201, 98), (253, 231, 37)],
+    'inferno': [(0, 0, 4), (87, 16, 110), (188, 55, 84), (249, 142, 9), (252, 255, 164)],
+    'jet': [(0, 0, 128), (0, 0, 255), (0, 255, 255), (255, 255, 0), (255, 0, 0), (128, 0, 0)],
+    'reds': [(255, 245, 240), (252, 146, 114), (203, 24, 29), (103, 0, 13)],
+    'gray': [(0, 0, 0), (255, 255, 255)],
+}
+
+heatmap_ids = itertools.count()  # distinguishes the heatmaps in the tile cache
+
+
+def colormap_lut(colormap) -> np.ndarray:
+    """
+    Creates the lookup table of a colormap
+    :param colormap: name of a colormap of COLORMAPS or an array of shape (n, 3) or (n, 4) with RGB(A) colors
+    :return: array of shape (256, 4) and type uint8
+    """
+    colors = np.asarray(COLORMAPS[colormap] if isinstance(colormap, str) else colormap, np.float64)
+    if colors.shape[1] == 3:
+        colors = np.concatenate([colors, np.full((len(colors), 1), 255.0)], axis=1)
+    positions = np.linspace(0, 1, len(colors))
+    samples = np.linspace(0, 1, 256)
+    lut = np.stack([np.interp(samples, positions, colors[:, channel]) for channel in range(4)], axis=1)
+    return np.round(lut).astype(np.uint8)
+
+
+class HeatmapSource(SlideBackend):
+    """
+    Slide-like pyramid of a heatmap, e.g. the tumor probabilities of a model at 1/32 of the slide resolution. The
+    heatmap is a 2D array or memory map; its level 0 has the resolution of the array and every further level halves
+    it. The levels are computed lazily per tile, so only the tiles that are displayed are ever computed and a
+    memory-mapped heatmap is only read where it is needed. The values of the tiles are cached, so a new colormap does
+    not compute them again. read_region colormaps the values of a tile, so the SlideView reads the heatmap like a
+    slide: through its scheduler, into its tile cache and on its tile grid.
+    """
+    strip_values = 2 ** 22  # values of the heatmap read at once
+
+    def __init__(self, data: np.ndarray, downsample: float, tile_size: int, tile_cache: TileCache,
+                 colormap='viridis', value_range: tuple = (0.0, 1.0), threshold: float = None,
+                 reduction: str = 'mean', values_id: str = None):
+        """
+        Initialization of the HeatmapSource
+        :param data: 2D array of the values, e.g. np.load(path, mmap_mode='r'); NaN marks missing values
+        :type data: np.ndarray
+        :param downsample: slide pixels (level 0) per heatmap pixel
+        :type downsample: float
+        :param tile_size: edge length of the tiles in pixels of their level, i.e. the tile size of the SlideView
+        :type tile_size: int
+        :param tile_cache: the cache of the values and the colormapped tiles
+        :type tile_cache: TileCache
+        :param colormap: name of a colormap of COLORMAPS or an array of RGB(A) colors
+        :param value_range: values mapped to the first and the last color of the colormap
+        :type value_range: tuple
+        :param threshold: values below the threshold are transparent, None displays all values
+        :type threshold: float
+        :param reduction: 'mean' or 'max' of the values covered by a pixel of a coarser level, 'max' keeps small
+                          hotspots visible when zoomed out
+        :type reduction: str
+        :param values_id: identifier of the values in the tile cache, sources of the same heatmap share it
+        :type values_id: str
+        """
+        if reduction not in ('mean', 'max'):
+            raise ValueError(f'An incorrect reduction: {reduction} was chosen!')
+        self.data = data
+        self.tile_size = tile_size
+        self.tile_cache = tile_cache
+        self.value_range = value_range
+        self.threshold = threshold
+        self.reduction = reduction
+        self.lut = np.concatenate([colormap_lut(colormap), np.zeros((1, 4), np.uint8)])  # last entry: transparent
+        self.colormap = colormap
+
+        height, width = data.shape[:2]
+        self.level_count = max(1, math.ceil(math.log2(max(width, height) / tile_size)) + 1)
+        self.level_dimensions = tuple((-(-width // 2 ** level), -(-height // 2 ** level))
+                                      for level in range(self.level_count))
+        self.level_downsamples = tuple(downsample * 2 ** level for level in range(self.level_count))
+        self.properties = {}
+
+        # the colormapped tiles of different colormaps are cached separately, the values are shared
+        self.values_id = f'heatmap://{next(heatmap_ids)}' if values_id is None else values_id
+        parameters = self.lut.tobytes() + repr((value_range, threshold)).encode()
+        self.slide_id = f'{self.values_id}/{reduction}/{hashlib.sha1(parameters).hexdigest()[:16]}'
+
+    def with_colormap(self, colormap=None, value_range: tuple = None, threshold: float = None):
+        """
+        Creates a source of the same heatmap with another colormap. The values computed so far are reused.
+        :param colormap: the new colormap, defaults to the current one
+        :param value_range: the new value range, defaults to the current one
+        :type value_range: tuple
+        :param threshold: the new threshold, defaults to the current one
+        :type threshold: float
+        :return: the new source
+        """
+        return HeatmapSource(self.data, self.level_downsamples[0], self.tile_size, self.tile_cache,
+                             self.colormap if colormap is None else colormap,
+                             self.value_range if value_range is None else value_range,
+                             self.threshold if threshold is None else threshold, self.reduction, self.values_id)
+
+    def values(self, level: int, col: int, row: int) -> np.ndarray:
+        """
+        Returns the values of a tile. The tile reduces the block of the heatmap it covers, e.g. 16 x 16 values per
+        pixel on level 4. The block is read in strips, so even the coarsest tiles of a memory-mapped heatmap only keep
+        a bounded part of it in memory. The tile is cached.
+        :param level: level of the tile
+        :type level: int
+        :param col: column of the tile in the tile grid of the level
+        :type col: int
+        :param row: row of the tile in the tile grid of the level
+        :type row: int
+        :return: float32 array of shape (height, width), NaN where no value is known
+        """
+        key = TileCache.key(self.values_id + '/' + self.reduction, level, col, row)
+        tile = self.tile_cache.get(key)
+        if tile is not None:
+            return tile
+
+        size, factor = self.tile_size, 2 ** level
+        level_width, level_height = self.level_dimensions[level]
+        width, height = min(size, level_width - col * size), min(size, level_height - row * size)
+        x, y = col * size * factor, row * size * factor
+
+        tile = np.empty((height, width), np.float32)
+        strip_rows = max(1, self.strip_values // (width * factor * factor))  # rows of the tile per strip
+        for start in range(0, height, strip_rows):
+            rows = min(strip_rows, height - start)
+            block = np.full((rows * factor, width * factor), np.nan, np.float32)  # NaN outside the heatmap
+            data = self.data[y + start * factor:y + (start + rows) * factor, x:x + width * factor]
+            block[:data.shape[0], :data.shape[1]] = data
+            if factor == 1:
+                tile[start:start + rows] = block
+                continue
+
+            known = np.isfinite(block)
+            counts = known.reshape(rows, factor, width, factor).sum(axis=3).sum(axis=1)
+            if self.reduction == 'max':
+                reduced = np.where(known, block, -np.inf).reshape(rows, factor, width, factor).max(axis=3).max(axis=1)
+            else:
+                sums = np.where(known, block, 0).reshape(rows, factor, width, factor).sum(axis=3).sum(axis=1)
+                reduced = sums / np.maximum(counts, 1)
+            tile[start:start + rows] = np.where(counts > 0, reduced, np.nan)
+
+        tile.flags.writeable = False
+        self.tile_cache.put(key, tile)
+        return tile
+
+    def colorize(self, values: np.ndarray) -> np.ndarray:
+        """
+        Maps values to the colors of the colormap
+        :param values: the values
+        :type values: np.ndarray
+        :return: RGBA array, transparent where the values are NaN or below the threshold
+        """
+        low, high = self.value_range
+        with np.errstate(invalid='ignore'):
+            index = np.clip((values - low) * (255 / max(high - low, 1e-12)), 0, 255)
+            hidden = ~np.isfinite(values)
+            if self.threshold is not None:
+                hidden |= values < self.threshold
+        index = np.where(hidden, 256, index).astype(np.intp)
+        return self.lut[index]
+
+    def read_region(self, location: tuple, level: int, size: tuple) -> np.ndarray:
+        """
+        Colormaps a tile. The regions have to be aligned to the tile grid, as read_tile reads them.
+        :param location: upper left corner of the tile in slide coordinates (level 0)
+        :type location: tuple
+        :param level: level of the tile
+        :type level: int
+        :param size: size of the tile in pixels of the level
+        :type size: tuple
+        :return: the tile as RGBA array
+        """
+        tile_size_slide = self.tile_size * self.level_downsamples[level]
+        col, row = round(location[0] / tile_size_slide), round(location[1] / tile_size_slide)
+        return self.colorize(self.values(level, col, row)[:size[1], :size[0]])
+
+
+class HeatmapJob(QObject):
+    tileFinished = Signal(int, int, int, object)
+    finished = Signal()
+
+    def __init__(self, level: int, tile_range: tuple, pending: int):
+        """
+        Initialization of the HeatmapJob, which passes the tiles read by the scheduler to the GUI thread
+        :param level: level of the tiles
+        :type level: int
+        :param tile_range: first and last column and row (first_col, first_row, last_col, last_row) of the tiles
+        :type tile_range: tuple
+        :param pending: number of requested tiles
+        :type pending: int
+        """
+        super().__init__()
+        self.level = level
+        self.tile_range = tile_range
+        self.pending = pending
+        self.mutex = QMutex()
+
+    def tile_read(self, request: TileRequest, tile):
+        """
+        Called by the scheduler once a tile is read
+        :param request: the finished request
+        :type request: TileRequest
+        :param tile: the tile or None if reading failed
+        :return: /
+        """
+        try:
+            if tile is not None:
+                self.tileFinished.emit(*request.key[1:4], tile)
+            with QMutexLocker(self.mutex):
+                self.pending -= 1
+                all_finished = self.pending == 0
+            if all_finished:
+                self.finished.emit()
+        except RuntimeError:  # the job is deleted if the application quits while reading
+            pass
+
+
+class HeatmapLayer(QGraphicsObject):
+    """
+    Overlay of a heatmap on a SlideView, created by SlideView.add_heatmap. The layer displays the tiles of the heatmap
+    level matching the zoom of the view, read by the scheduler of the view like the tiles of the slide. A pan displays
+    each tile as soon as it is read; a new level replaces the displayed one at once, so the semi-transparent levels
+    are not drawn above each other. The opacity is the opacity of the item, e.g. layer.setOpacity(0.3).
+    """
+
+    def __init__(self, view, data, downsample: float = None, colormap='viridis', value_range: tuple = (0.0, 1.0),
+                 threshold: float = None, reduction: str = 'mean', parent: QGraphicsItem = None):
+        """
+        Initialization of the HeatmapLayer
+        :param view: the view displaying the slide of the heatmap
+        :type view: SlideView
+        :param data: 2D array or memory map of the values, or the path of a .npy file, which is memory-mapped
+        :param downsample: slide pixels (level 0) per heatmap pixel, defaults to the ratio of the widths of the slide
+                           and the heatmap
+        :type downsample: float
+        :param colormap: name of a colormap of COLORMAPS or an array of RGB(A) colors
+        :param value_range: values mapped to the first and the last color of the colormap
+        :type value_range: tuple
+        :param threshold: values below the threshold are transparent, None displays all values
+        :type threshold: float
+        :param reduction: 'mean' or 'max', see HeatmapSource
+        :type reduction: str
+        :param parent: the parent item
+        :type parent: QGraphicsItem
+        """
+        super().__init__(parent)
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemHasNoContents)
+        self.setZValue(0.5)  # above the tiles, below annotations
+
+        if isinstance(data, str):
+            data = np.load(data, mmap_mode='r')
+        downsample = view.slide.dimensions[0] / data.shape[1] if downsample is None else downsample
+        self.view = view
+        self.source = HeatmapSource(data, downsample, view.tile_size, view.tile_cache, colormap, value_range,
+                                    threshold, reduction)
+
+        self.job: HeatmapJob = None  # Currently running job
+        self.buffered_tiles = []  # (level, col, row, tile) of the tiles of a new level, displayed once it is complete
+        self.level = 0  # Level of the displayed tiles
+        self.tile_range = None  # Tile range of the displayed tiles
+        self.tile_items = {}  # (level, col, row) -> item of the displayed tiles
+        self.stale_tiles = set()  # (level, col, row) of the items displayed with a previous colormap
+        self.spare_items = []  # Hidden tile items for reuse
+
+    def boundingRect(self) -> QRectF:
+        width, height = self.source.level_dimensions[0]
+        return QRectF(0, 0, width * self.source.level_downsamples[0], height * self.source.level_downsamples[0])
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: QWidget = None):
+        pass  # only the tile items are drawn
+
+    def set_colormap(self, colormap=None, value_range: tuple = None, threshold: float = None):
+        """
+        Changes the colors of the heatmap. The values of the visible tiles are usually still cached, so only the
+        colormap is applied again.
+        :param colormap: the new colormap, defaults to the current one
+        :param value_range: the new value range, defaults to the current one
+        :type value_range: tuple
+        :param threshold: the new threshold, defaults to the current one
+        :type threshold: float
+        :return: /
+        """
+        self.source = self.source.with_colormap(colormap, value_range, threshold)
+        self.stale_tiles = set(self.tile_items)
+        self.job = None
+        self.buffered_tiles = []
+        self.tile_range = None
+        self.update_tiles()
+
+    def get_tile_range(self, level: int) -> tuple:
+        """
+        Calculates the tiles of a level which are needed to display the viewport of the view
+        :param level: level of the tiles
+        :type level: int
+        :return: first and last column and row (first_col, first_row, last_col, last_row) of the tiles
+        """
+        view, margin = self.view, self.view.tile_margin
+        tile_size_slide = self.source.tile_size * self.source.level_downsamples[level]
+        level_width, level_height = self.source.level_dimensions[level]
+        viewport = view.get_viewport_rect()
+        return (max(int(viewport.left() // tile_size_slide) - margin, 0),
+                max(int(viewport.top() // tile_size_slide) - margin, 0),
+                min(int(viewport.right() // tile_size_slide) + margin, (level_width - 1) // self.source.tile_size),
+                min(int(viewport.bottom() // tile_size_slide) + margin, (level_height - 1) // self.source.tile_size))
+
+    @Slot()
+    def update_tiles(self):
+        """
+        Requests the tiles of the viewport of the view, called whenever the viewport changes. While the zoom of the
+        view settles, the displayed tiles are scaled like the tiles of the slide.
+        :return: /
+        """
+        view = self.view
+        if not view.slide or self.scene() is None or not self.isVisible() or view.settle_timer.isActive():
+            return
+        level = self.source.get_best_level_for_downsample(view.cur_downsample)
+        tile_range = self.get_tile_range(level)
+        current = (self.job.level, self.job.tile_range) if self.job else (self.level, self.tile_range)
+        if (level, tile_range) == current:
+            return
+
+        scheduler = view.scheduler
+        generation = scheduler.next_generation()
+        tiles = [(col, row) for row in range(tile_range[1], tile_range[3] + 1)
+                 for col in range(tile_range[0], tile_range[2] + 1)
+                 if (level, col, row) not in self.tile_items or (level, col, row) in self.stale_tiles]
+        self.job = HeatmapJob(level, tile_range, len(tiles))
+        self.job.tileFinished.connect(self.add_tile)
+        self.job.finished.connect(self.finish_job)
+        self.buffered_tiles = []
+
+        tile_size_slide = self.source.tile_size * self.source.level_downsamples[level]
+        center = view.get_viewport_rect().center() / tile_size_slide - QPointF(0.5, 0.5)
+        for col, row in tiles:
+            scheduler.request(TileCache.key(self.source.slide_id, level, col, row), self.source,
+                              self.source.tile_size, TileScheduler.VISIBLE,
+                              (col - center.x()) ** 2 + (row - center.y()) ** 2, self.job.tile_read, generation,
+                              self)
+        scheduler.cancel_obsolete(generation, self)
+        if not tiles:
+            self.finish_job(self.job)
+
+    @Slot(int, int, int, object)
+    def add_tile(self, level: int, col: int, row: int, tile):
+        """
+        Displays a tile of the current job, or buffers it if the job displays a new level
+        :return: /
+        """
+        if self.job is None or self.sender() is not self.job:
+            return
+        if level == self.level and self.tile_range is not None:
+            self.add_tile_item(level, col, row, tile)
+        else:
+            self.buffered_tiles.append((level, col, row, tile))
+
+    @Slot()
+    def finish_job(self, job: HeatmapJob = None):
+        """
+        Displays the buffered tiles of the current job and removes the items of other levels and of tiles outside the
+        tile range
+        :param job: the finished job, defaults to the sender
+        :type job: HeatmapJob
+        :return: /
+        """
+        job = self.sender() if job is None else job
+        if self.job is None or job is not self.job:
+            return
+        for level, col, row, tile in self.buffered_tiles:
+            self.add_tile_item(level, col, row, tile)
+        self.buffered_tiles = []
+
+        level, tile_range = job.level, job.tile_range
+        self.remove_tile_items(lambda key: key[0] != level or not (tile_range[0] <= key[1] <= tile_range[2] and
+                                                                   tile_range[1] <= key[2] <= tile_range[3]))
+        self.level, self.tile_range = level, tile_range
+        self.job = None
+
+    def add_tile_item(self, level: int, col: int, row: int, tile):
+        """
+        Displays a tile as item of its own. Transparent tiles do not need an item, other uniform tiles are displayed as
+        filled rectangles.
+        :param level: level of the tile
+        :type level: int
+        :param col: column of the tile in the tile grid of the level
+        :type col: int
+        :param row: row of the tile in the tile grid of the level
+        :type row: int
+        :param tile: the tile as RGBA array or UniformTile
+        :return: /
+        """
+        key = (level, col, row)
+        uniform = isinstance(tile, UniformTile)
+        self.remove_tile_items(lambda other: other == key)
+        if uniform and tile.color[3] == 0:
+            self.tile_items[key] = None
+            return
+
+        if uniform:
+            item = QGraphicsRectItem(0, 0, tile.shape[1], tile.shape[0], self)
+            item.setBrush(QColor(*tile.color.tolist()))
+            item.setPen(Qt.PenStyle.NoPen)
+        else:
+            item = self.spare_items.pop() if self.spare_items else QGraphicsPixmapItem(self)
+            item.setPixmap(QPixmap.fromImage(array_to_qimage(tile)))
+            item.show()
+        downsample = self.source.level_downsamples[level]
+        item.setPos(col * self.source.tile_size * downsample, row * self.source.tile_size * downsample)
+        item.setScale(downsample)
+        self.tile_items[key] = item
+
+    def remove_tile_items(self, condition):
+        """
+        Removes the tile items whose key fulfills the condition, pixmap items are hidden and kept for reuse
+        :param condition: function of the key (level, col, row) of the tile
+        :return: /
+        """
+        for key in [key for key in self.tile_items if condition(key)]:
+            item = self.tile_items.pop(key)
+            self.stale_tiles.discard(key)
+            if isinstance(item, QGraphicsPixmapItem):
+                item.hide()
+                item.setPixmap(QPixmap())
+                self.spare_items.append(item)
+            elif item is not None:
+                item.setParentItem(None)
@@ -0,0 +1,33 @@
+import numpy as np
+from PIL import Image
+from PySide6.QtGui import QImage
+
+
+def tile_to_array(tile) -> np.ndarray:
+    """
+    Converts a tile to a read-only, C-contiguous RGBA array. This is the only copy of the pixel data on the way from
+    the slide to the screen; the array is cached and wrapped by a QImage without further copies.
+    :param tile: the tile as returned by read_region
+    :type tile: Image.Image or np.ndarray
+    :return: array of shape (height, width, 4) and type uint8
+    """
+    if isinstance(tile, Image.Image):
+        tile = np.asarray(tile if tile.mode == 'RGBA' else tile.convert('RGBA'))
+    array = np.ascontiguousarray(tile, dtype=np.uint8)
+    if array.shape[2] == 3:
+        array = np.concatenate([array, np.full(array.shape[:2] + (1,), 255, np.uint8)], axis=2)
+    array.flags.writeable = False
+    return array
+
+
+def array_to_qimage(array: np.ndarray) -> QImage:
+    """
+    Wraps an RGBA array as QImage without copying. The image shares the memory of the array, so the array has to be
+    kept alive as long as the image is used. Shared images must not be passed through queued signals, since the
+    receiver gets a copy of the QImage, but not of the array; pass the array and wrap it in the receiving thread.
+    :param array: array of shape (height, width, 4) and type uint8
+    :type array: np.ndarray
+    :return: image of format RGBA8888
+    """
+    height, width = array.shape[:2]
+    return QImage(array, width, height, array.strides[0], QImage.Format.Format_RGBA8888)
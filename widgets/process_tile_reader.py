@@ -0,0 +1,208 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+from PySide6.QtCore import QMutex, QMutexLocker, QSemaphore
+import numpy as np
+import os
+import weakref
+from .image_conversion import tile_to_array
+from .slide_backends import SlideBackend, open_backend
+
+# State of the worker processes: open slides and the attached shared memory slots
+worker_slides = OrderedDict()  # filepath -> open slide, least recently used first
+worker_slots = []  # SharedMemory of all slots
+worker_opener = open_backend
+worker_max_open = 8
+
+
+def attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """
+    Attaches an existing shared memory block, which is owned and unlinked by the GUI process
+    :param name: name of the block
+    :type name: str
+    :return: the attached block
+    """
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # before Python 3.13, attaching registers the block again; the spawned workers share the resource tracker of
+        # the GUI process, which keeps a single entry per block, so the block is still unlinked only once
+        return shared_memory.SharedMemory(name)
+
+
+def init_worker(slot_names: list, opener, max_open: int):
+    """
+    Initializes a worker process
+    :return: /
+    """
+    global worker_opener, worker_max_open
+    worker_opener = opener
+    worker_max_open = max_open
+    worker_slots.extend(attach_shared_memory(name) for name in slot_names)
+
+
+def worker_slide(filepath: str) -> SlideBackend:
+    """
+    Returns the slide handle of the worker process for a file. Each process holds handles of its own.
+    :return: the open slide
+    """
+    slide = worker_slides.get(filepath)
+    if slide is None:
+        slide = worker_slides[filepath] = worker_opener(filepath)
+        while len(worker_slides) > worker_max_open:
+            worker_slides.popitem(last=False)[1].close()
+    worker_slides.move_to_end(filepath)
+    return slide
+
+
+def read_metadata(filepath: str) -> dict:
+    """
+    Reads the metadata of a slide in a worker process
+    :return: dictionary of the level metadata and the properties
+    """
+    slide = worker_slide(filepath)
+    return {'level_count': slide.level_count, 'level_dimensions': tuple(slide.level_dimensions),
+            'level_downsamples': tuple(slide.level_downsamples), 'properties': dict(slide.properties)}
+
+
+def read_associated_images(filepath: str) -> dict:
+    return dict(worker_slide(filepath).associated_images)
+
+
+def read_region(filepath: str, location: tuple, level: int, size: tuple, slot: int):
+    """
+    Reads and converts a region in a worker process. The RGBA array is written to the shared memory slot if it fits,
+    otherwise it is returned through the result pipe.
+    :return: shape of the region and None if it was written to the slot, the array otherwise
+    """
+    tile = tile_to_array(worker_slide(filepath).read_region(location, level, size))
+    if slot is not None and tile.nbytes <= worker_slots[slot].size:
+        np.ndarray(tile.shape, np.uint8, buffer=worker_slots[slot].buf)[...] = tile
+        return tile.shape, None
+    return tile.shape, tile
+
+
+class ProcessTileReader:
+    """
+    Decodes tiles in worker processes, so reading and converting compressed tiles scales across all cores instead of
+    contending for the GIL. Each process holds its own slide handles; the decoded RGBA tiles are handed to the GUI
+    process through preallocated shared memory slots. The threads of the SlideView only dispatch the reads and wait
+    for them without holding the GIL.
+    """
+
+    def __init__(self, processes: int = None, slot_bytes: int = 512 * 512 * 4, slots: int = None,
+                 opener=open_backend, max_open: int = 8):
+        """
+        Initialization of the ProcessTileReader
+        :param processes: number of worker processes, defaults to os.cpu_count()
+        :type processes: int
+        :param slot_bytes: size of each shared memory slot, larger regions are returned through the result pipe
+        :type slot_bytes: int
+        :param slots: number of shared memory slots, i.e. of concurrent reads, defaults to twice the processes
+        :type slots: int
+        :param opener: picklable function that opens a slide from a file path in the worker processes
+        :param max_open: maximal number of open slides per worker process
+        :type max_open: int
+        """
+        self.processes = processes or os.cpu_count() or 1
+        self.slot_bytes = slot_bytes
+
+        self.slots = [shared_memory.SharedMemory(create=True, size=slot_bytes)
+                      for _ in range(slots or 2 * self.processes)]
+        self.free_slots = list(range(len(self.slots)))
+        self.slot_semaphore = QSemaphore(len(self.slots))
+        self.mutex = QMutex()
+
+        self.executor = ProcessPoolExecutor(self.processes, get_context('spawn'), init_worker,
+                                            ([slot.name for slot in self.slots], opener, max_open))
+        self.finalizer = weakref.finalize(self, self.release, self.executor, self.slots)
+
+    def open(self, filepath: str):
+        """
+        Opens a slide whose reads are decoded in the worker processes, e.g. as opener of a SlideHandlePool
+        :param filepath: path of the slide
+        :type filepath: str
+        :return: the slide
+        """
+        return ProcessSlide(self, filepath)
+
+    def read_region(self, filepath: str, location: tuple, level: int, size: tuple) -> np.ndarray:
+        """
+        Reads a region in a worker process and waits for it
+        :param filepath: path of the slide
+        :type filepath: str
+        :param location: upper left corner of the region in slide coordinates (level 0)
+        :type location: tuple
+        :param level: level of the region
+        :type level: int
+        :param size: size of the region in pixels of the level
+        :type size: tuple
+        :return: the region as read-only RGBA array
+        """
+        if size[0] * size[1] * 4 > self.slot_bytes:
+            return tile_to_array(self.executor.submit(read_region, filepath, location, level, size, None).result()[1])
+
+        self.slot_semaphore.acquire()
+        with QMutexLocker(self.mutex):
+            slot = self.free_slots.pop()
+        try:
+            shape, tile = self.executor.submit(read_region, filepath, location, level, size, slot).result()
+            if tile is None:
+                # the slot is reused by the next read, so the tile is copied out of it
+                tile = np.ndarray(shape, np.uint8, buffer=self.slots[slot].buf).copy()
+        finally:
+            with QMutexLocker(self.mutex):
+                self.free_slots.append(slot)
+            self.slot_semaphore.release()
+        return tile_to_array(tile)
+
+    def submit(self, function, *args):
+        """
+        Runs a function of this module in a worker process and waits for its result
+        :return: the result
+        """
+        return self.executor.submit(function, *args).result()
+
+    def close(self):
+        """
+        Shuts the worker processes down and frees the shared memory
+        :return: /
+        """
+        self.finalizer()
+
+    @staticmethod
+    def release(executor: ProcessPoolExecutor, slots: list):
+        executor.shutdown(wait=True, cancel_futures=True)
+        for slot in slots:
+            slot.close()
+            slot.unlink()
+
+
+class ProcessSlide(SlideBackend):
+    """
+    A slide whose reads are decoded by the worker processes of a ProcessTileReader
+    """
+
+    def __init__(self, reader: ProcessTileReader, filepath: str):
+        """
+        Initialization of the ProcessSlide
+        :param reader: the reader decoding the tiles
+        :type reader: ProcessTileReader
+        :param filepath: path of the slide
+        :type filepath: str
+        """
+        self.reader = reader
+        self.filepath = filepath
+
+        metadata = reader.submit(read_metadata, filepath)
+        self.level_count = metadata['level_count']
+        self.level_dimensions = metadata['level_dimensions']
+        self.level_downsamples = metadata['level_downsamples']
+        self.properties = metadata['properties']
+
+    @property
+    def associated_images(self) -> dict:
+        return self.reader.submit(read_associated_images, self.filepath)
+
+    def read_region(self, location: tuple, level: int, size: tuple) -> np.ndarray:
+        return self.reader.read_region(self.filepath, location, level, size)
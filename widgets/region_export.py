@@ -0,0 +1,323 @@
+from collections import deque
+from concurrent.futures import Future
+from PySide6.QtCore import QRunnable, QThreadPool
+import numpy as np
+import os
+from .image_conversion import tile_to_array
+from .slide_handles import SlideHandlePool
+from .tile_cache import TileCache, UniformTile, read_tile
+
+
+def normalize_region(region) -> tuple:
+    """
+    Utility method to unify the notation of a region
+    :param region: (x, y, level, size) with the upper left corner in slide coordinates (level 0) and the size in pixels
+                   of the level, either as edge length or as (width, height)
+    :return: the region as (x, y, level, width, height)
+    """
+    x, y, level, size = region
+    width, height = (size, size) if np.isscalar(size) else size
+    return int(x), int(y), int(level), int(width), int(height)
+
+
+def tissue_fraction(region: np.ndarray, min_saturation: int = 20) -> float:
+    """
+    Estimates the fraction of a region covered by tissue. Stained tissue is colored, while the background is white or
+    gray, so pixels whose color channels differ by at least min_saturation count as tissue. Transparent pixels outside
+    the slide are background.
+    :param region: RGBA array of the region
+    :type region: np.ndarray
+    :param min_saturation: smallest difference between the largest and the smallest color channel of tissue
+    :type min_saturation: int
+    :return: the fraction between 0 and 1
+    """
+    rgb = region[..., :3]
+    tissue = (rgb.max(axis=2).astype(np.int16) - rgb.min(axis=2) >= min_saturation) & (region[..., 3] > 0)
+    return float(tissue.mean()) if tissue.size else 0.0
+
+
+def tissue_mask(overview: np.ndarray, min_saturation: int = 20) -> np.ndarray:
+    """
+    Computes a coarse tissue mask, e.g. of the overview of a slide, for grid_regions
+    :param overview: RGBA array of the whole slide
+    :type overview: np.ndarray
+    :param min_saturation: smallest difference between the largest and the smallest color channel of tissue
+    :type min_saturation: int
+    :return: boolean array of the size of the overview
+    """
+    rgb = overview[..., :3]
+    return (rgb.max(axis=2).astype(np.int16) - rgb.min(axis=2) >= min_saturation) & (overview[..., 3] > 0)
+
+
+def grid_regions(slide, level: int, size, stride=None, mask: np.ndarray = None, min_coverage: float = 0.5):
+    """
+    Generates the regions of a regular grid over a slide, optionally restricted to a mask such as a tissue mask or a
+    rasterized annotation
+    :param slide: the slide
+    :type slide: SlideBackend
+    :param level: level of the regions
+    :type level: int
+    :param size: size of the regions in pixels of the level, either as edge length or as (width, height)
+    :param stride: distance of the regions in pixels of the level, defaults to the size
+    :param mask: boolean array covering the whole slide at any resolution, regions are only generated where it is set
+    :type mask: np.ndarray
+    :param min_coverage: smallest fraction of a region that has to be covered by the mask
+    :type min_coverage: float
+    :return: generator of the regions (x, y, level, (width, height))
+    """
+    width, height = (size, size) if np.isscalar(size) else size
+    stride_x, stride_y = (width, height) if stride is None else (stride, stride) if np.isscalar(stride) else stride
+    level_width, level_height = slide.level_dimensions[level]
+    downsample = slide.level_downsamples[level]
+    if mask is not None:
+        # mask pixels per pixel of the level
+        scale_x, scale_y = mask.shape[1] / level_width, mask.shape[0] / level_height
+
+    for top in range(0, level_height - height + 1, stride_y):
+        for left in range(0, level_width - width + 1, stride_x):
+            if mask is not None:
+                mask_left, mask_top = int(left * scale_x), int(top * scale_y)
+                footprint = mask[mask_top:max(int((top + height) * scale_y), mask_top + 1),
+                                 mask_left:max(int((left + width) * scale_x), mask_left + 1)]
+                if not footprint.size or footprint.mean() < min_coverage:
+                    continue
+            yield int(left * downsample), int(top * downsample), level, (width, height)
+
+
+def annotation_regions(store, slide, level: int, size, classes=None):
+    """
+    Generates one region centered on each annotation of an AnnotationStore, e.g. a patch per detected cell
+    :param store: the annotations
+    :type store: AnnotationStore
+    :param slide: the slide
+    :type slide: SlideBackend
+    :param level: level of the regions
+    :type level: int
+    :param size: size of the regions in pixels of the level, either as edge length or as (width, height)
+    :param classes: only the annotations of these classes, defaults to all
+    :return: generator of the regions (x, y, level, (width, height))
+    """
+    width, height = (size, size) if np.isscalar(size) else size
+    downsample = slide.level_downsamples[level]
+    polygons = np.arange(len(store)) if classes is None else np.nonzero(np.isin(store.classes, classes))[0]
+    centers = (store.bboxes[polygons, :2] + store.bboxes[polygons, 2:]) / 2
+    for center_x, center_y in centers.tolist():
+        yield int(center_x - width * downsample / 2), int(center_y - height * downsample / 2), level, (width, height)
+
+
+class RegionWorker(QRunnable):
+
+    def __init__(self, exporter, slide, filepath: str, region: tuple, future: Future, min_tissue: float):
+        """
+        Initialization of the RegionWorker, which reads a single region of an export
+        """
+        super().__init__()
+        self.exporter = exporter
+        self.slide = slide
+        self.filepath = filepath
+        self.region = region
+        self.future = future
+        self.min_tissue = min_tissue
+
+    def run(self):
+        if not self.future.set_running_or_notify_cancel():
+            return  # the export was stopped
+        try:
+            region = self.exporter.read_region(self.slide, self.filepath, *self.region)
+            if self.min_tissue > 0 and tissue_fraction(region) < self.min_tissue:
+                region = None
+            self.future.set_result(region)
+        except Exception as e:
+            self.future.set_exception(e)
+
+
+class RegionExporter:
+    """
+    Reads many regions of a slide in parallel without a SlideView, e.g. to cut training patches. The regions are
+    yielded in order as numpy arrays; at most max_pending regions are read ahead, so the memory stays bounded for any
+    number of regions. The exporter can share the slide pool, thread pool and caches of a SlideView (see for_view), so
+    exporting while viewing does not open the files twice. Its reads run with a lower priority than the tile reads of
+    the view, and it only looks up the tiles of the view without inserting its own, so an export does not evict the
+    tiles the view displays.
+    """
+
+    def __init__(self, slide_pool: SlideHandlePool = None, thread_pool: QThreadPool = None,
+                 tile_cache: TileCache = None, disk_cache=None, tile_size: int = None, max_pending: int = None,
+                 priority: int = -1, shared_cache: TileCache = None):
+        """
+        Initialization of the RegionExporter
+        :param slide_pool: pool of open slides, e.g. of a SlideView
+        :type slide_pool: SlideHandlePool
+        :param thread_pool: pool that reads the regions, defaults to a pool of os.cpu_count() threads
+        :type thread_pool: QThreadPool
+        :param tile_cache: cache to compose the regions from. The regions are read directly from the slide if None.
+        :type tile_cache: TileCache
+        :param disk_cache: optional persistent cache of the tiles, only used with a tile_cache
+        :type disk_cache: DiskTileCache
+        :param tile_size: edge length of the cached tiles; has to match the tile size of the views sharing the cache
+        :type tile_size: int
+        :param max_pending: number of regions read ahead, defaults to twice the threads of the pool
+        :type max_pending: int
+        :param priority: priority of the reads in the thread pool, the tile reads of the views have priority 0
+        :type priority: int
+        :param shared_cache: cache of a view that is only looked up; the tiles read by the exporter are cached in the
+                             tile_cache instead, so the least recently used order of the shared cache is kept
+        :type shared_cache: TileCache
+        """
+        if shared_cache is not None and tile_cache is None:
+            raise ValueError('A tile_cache is needed to compose regions from a shared cache!')
+        if tile_cache is not None and not tile_size:
+            raise ValueError('A tile_size is needed to compose regions from the tile cache!')
+
+        self.slide_pool = SlideHandlePool() if slide_pool is None else slide_pool
+        if thread_pool is None:
+            thread_pool = QThreadPool()
+            thread_pool.setMaxThreadCount(os.cpu_count() or 1)
+        self.thread_pool = thread_pool
+        self.tile_cache = tile_cache
+        self.shared_cache = shared_cache
+        self.disk_cache = disk_cache
+        self.tile_size = tile_size
+        self.max_pending = max_pending or 2 * self.thread_pool.maxThreadCount()
+        self.priority = priority
+
+    @classmethod
+    def for_view(cls, view, cache_bytes: int = 32 * 1024 ** 2, **kwargs):
+        """
+        Creates an exporter that shares the slide pool, thread pool and tile cache of a SlideView. The tiles of the view
+        are used without being inserted into its cache; the tiles the exporter reads are kept in a small cache of its
+        own. The persistent cache of the view is not used, so an export neither evicts it nor returns recompressed
+        tiles; for the same reason, the tile cache of the view is only shared if its disk cache is lossless. The tile
+        size of the view is the one of its current slide, so regions of other slides are read directly instead.
+        :param view: the view
+        :type view: SlideView
+        :param cache_bytes: memory budget of the own cache of the exporter in bytes
+        :type cache_bytes: int
+        :param kwargs: further arguments of the RegionExporter
+        :return: the exporter
+        """
+        if not view.tile_size:
+            return cls(view.slide_pool, view.thread_pool, **kwargs)
+        lossless = view.disk_cache is None or view.disk_cache.compression in ('png', 'raw')
+        return cls(view.slide_pool, view.thread_pool, TileCache(cache_bytes), None, view.tile_size,
+                   shared_cache=view.tile_cache if lossless else None, **kwargs)
+
+    def read_region(self, slide, filepath: str, x: int, y: int, level: int, width: int, height: int) -> np.ndarray:
+        """
+        Reads a single region, composed from the cached tiles if the exporter has a tile cache. Called by the reading
+        threads.
+        :return: the region as RGBA array of shape (height, width, 4), transparent outside the slide
+        """
+        if self.tile_cache is None:
+            return tile_to_array(slide.read_region((x, y), level, (width, height)))
+
+        downsample = slide.level_downsamples[level]
+        level_width, level_height = slide.level_dimensions[level]
+        left, top = int(x // downsample), int(y // downsample)
+        tile_size = self.tile_size
+
+        region = np.zeros((height, width, 4), np.uint8)
+        for row in range(max(top // tile_size, 0),
+                         min((top + height - 1) // tile_size, (level_height - 1) // tile_size) + 1):
+            for col in range(max(left // tile_size, 0),
+                             min((left + width - 1) // tile_size, (level_width - 1) // tile_size) + 1):
+                tile = None
+                if self.shared_cache is not None:
+                    # uniform tiles of the view may be predicted from the overview or averaged, only pixels are reused
+                    tile = self.shared_cache.peek(TileCache.key(filepath, level, col, row))
+                    if not isinstance(tile, np.ndarray):
+                        tile = None
+                if tile is None:
+                    tile = read_tile(slide, filepath, self.tile_cache, level, col, row, tile_size, self.disk_cache,
+                                     uniform_tolerance=0)
+                if isinstance(tile, UniformTile):
+                    tile = tile.to_array()
+                x0, y0 = max(left, col * tile_size), max(top, row * tile_size)
+                x1 = min(left + width, col * tile_size + tile.shape[1])
+                y1 = min(top + height, row * tile_size + tile.shape[0])
+                if x1 > x0 and y1 > y0:
+                    region[y0 - top:y1 - top, x0 - left:x1 - left] = \
+                        tile[y0 - row * tile_size:y1 - row * tile_size, x0 - col * tile_size:x1 - col * tile_size]
+        return region
+
+    def regions(self, filepath: str, regions, min_tissue: float = 0.0):
+        """
+        Reads regions of a slide in parallel. Closing the generator cancels the reads that have not started yet.
+        :param filepath: path of the slide
+        :type filepath: str
+        :param regions: iterable of regions (x, y, level, size), see normalize_region
+        :param min_tissue: regions with a smaller tissue fraction (see tissue_fraction) are skipped
+        :type min_tissue: float
+        :return: generator of (region, RGBA array) with the region as (x, y, level, width, height)
+        """
+        slide = self.slide_pool.open(filepath)
+        pending = deque()  # (region, Future) in the order of the regions
+        regions = iter(regions)
+        try:
+            while True:
+                for region in regions:
+                    region = normalize_region(region)
+                    future = Future()
+                    self.thread_pool.start(RegionWorker(self, slide, filepath, region, future, min_tissue),
+                                           self.priority)
+                    pending.append((region, future))
+                    if len(pending) >= self.max_pending:
+                        break
+                if not pending:
+                    return
+
+                region, future = pending.popleft()
+                array = future.result()
+                if array is not None:
+                    yield region, array
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+    def export(self, filepath: str, regions, directory: str, shard_size: int = 1024, min_tissue: float = 0.0,
+               channels: int = 3, prefix: str = 'patches') -> int:
+        """
+        Exports regions of equal size into NPY shards. Shard i consists of {prefix}_{i:05d}.npy with the stacked
+        regions of shape (n, height, width, channels) and {prefix}_{i:05d}_regions.npy with the rows
+        (x, y, level, width, height). Only one shard is held in memory.
+        :param filepath: path of the slide
+        :type filepath: str
+        :param regions: iterable of regions (x, y, level, size), see normalize_region
+        :param directory: output directory, created if it does not exist
+        :type directory: str
+        :param shard_size: number of regions per shard
+        :type shard_size: int
+        :param min_tissue: regions with a smaller tissue fraction (see tissue_fraction) are skipped
+        :type min_tissue: float
+        :param channels: 3 for RGB or 4 for RGBA
+        :type channels: int
+        :param prefix: prefix of the file names
+        :type prefix: str
+        :return: number of exported regions
+        """
+        if channels not in (3, 4):
+            raise ValueError(f'An incorrect number of channels: {channels} was chosen!')
+        os.makedirs(directory, exist_ok=True)
+
+        shard, shard_regions, shards, count = None, [], 0, 0
+
+        def write_shard():
+            path = os.path.join(directory, f'{prefix}_{shards:05d}')
+            np.save(path + '.npy', shard[:len(shard_regions)])
+            np.save(path + '_regions.npy', np.array(shard_regions, np.int64))
+
+        for region, array in self.regions(filepath, regions, min_tissue):
+            if shard is None:
+                shard = np.empty((shard_size,) + array.shape[:2] + (channels,), np.uint8)
+            elif array.shape[:2] != shard.shape[1:3]:
+                raise ValueError(f'All regions of an export need the same size, got {array.shape[1::-1]} instead of '
+                                 f'{shard.shape[2:0:-1]}!')
+            shard[len(shard_regions)] = array[..., :channels]
+            shard_regions.append(region)
+            count += 1
+            if len(shard_regions) == shard_size:
+                write_shard()
+                shard_regions, shards = [], shards + 1
+        if shard_regions:
+            write_shard()
+        return count
@@ -0,0 +1,239 @@
+from abc import ABC, abstractmethod
+from urllib.parse import urlparse, parse_qs
+from PIL import Image
+import numpy as np
+import os
+import sys
+import time
+
+if sys.platform.startswith("win"):
+    openslide_path = os.path.abspath("./openslide/bin")
+    if os.path.isdir(openslide_path):
+        os.add_dll_directory(openslide_path)
+try:
+    from openslide import OpenSlide
+except ImportError:  # the synthetic backend works without openslide
+    OpenSlide = None
+
+
+class SlideBackend(ABC):
+    """
+    Interface of the slide readers used by the SlideView. It follows the part of the OpenSlide interface the viewer
+    needs, so OpenSlide objects can be used directly. Subclasses set the level metadata and implement read_region;
+    read_region returns an RGBA PIL image or an RGBA array of shape (height, width, 4) and has to be thread-safe.
+    """
+    level_count: int = 0
+    level_dimensions: tuple = ()
+    level_downsamples: tuple = ()
+    properties: dict = {}
+
+    @property
+    def dimensions(self) -> tuple:
+        return self.level_dimensions[0]
+
+    @property
+    def associated_images(self) -> dict:
+        return {}
+
+    def get_best_level_for_downsample(self, downsample: float) -> int:
+        """
+        Returns the level with the largest downsample that is smaller than the given one, like OpenSlide does
+        :param downsample: the desired downsample
+        :type downsample: float
+        :return: the level
+        """
+        for level in range(1, self.level_count):
+            if downsample < self.level_downsamples[level]:
+                return level - 1
+        return self.level_count - 1
+
+    @abstractmethod
+    def read_region(self, location: tuple, level: int, size: tuple):
+        """
+        Reads a region of a level. Pixels outside the slide are transparent.
+        :param location: upper left corner of the region in slide coordinates (level 0)
+        :type location: tuple
+        :param level: level of the region
+        :type level: int
+        :param size: size of the region in pixels of the level
+        :type size: tuple
+        :return: the region as RGBA image or array
+        """
+
+    def get_thumbnail(self, size: tuple) -> Image.Image:
+        """
+        Creates a thumbnail from the lowest level
+        :param size: maximal size of the thumbnail
+        :type size: tuple
+        :return: the thumbnail as RGB image
+        """
+        level = self.level_count - 1
+        region = self.read_region((0, 0), level, self.level_dimensions[level])
+        if not isinstance(region, Image.Image):
+            region = Image.fromarray(np.asarray(region), 'RGBA')
+        thumbnail = Image.new('RGB', region.size, (255, 255, 255))
+        thumbnail.paste(region, mask=region.getchannel('A'))
+        thumbnail.thumbnail(size)
+        return thumbnail
+
+    def close(self):
+        pass
+
+
+class OpenSlideBackend(SlideBackend):
+    """
+    Backend for all formats supported by OpenSlide
+    """
+
+    def __init__(self, filepath: str):
+        """
+        Initialization of the OpenSlideBackend
+        :param filepath: path of the slide
+        :type filepath: str
+        """
+        if OpenSlide is None:
+            raise ImportError('openslide-python is required to open slide files')
+        self.slide = OpenSlide(filepath)
+        self.level_count = self.slide.level_count
+        self.level_dimensions = tuple(self.slide.level_dimensions)
+        self.level_downsamples = tuple(self.slide.level_downsamples)
+        self.properties = dict(self.slide.properties)
+
+    @property
+    def associated_images(self) -> dict:
+        return dict(self.slide.associated_images)
+
+    def get_best_level_for_downsample(self, downsample: float) -> int:
+        return self.slide.get_best_level_for_downsample(downsample)
+
+    def read_region(self, location: tuple, level: int, size: tuple) -> Image.Image:
+        return self.slide.read_region(location, level, size)
+
+    def get_thumbnail(self, size: tuple) -> Image.Image:
+        return self.slide.get_thumbnail(size)
+
+    def close(self):
+        self.slide.close()
+
+
+class SyntheticSlideBackend(SlideBackend):
+    """
+    Pure numpy pyramid with a procedural tissue-like pattern, for benchmarks and tests without real slide files. The
+    pattern is a function of the slide coordinates, so all levels show the same image. An artificial latency per read
+    simulates the storage.
+    """
+
+    def __init__(self, width: int = 100000, height: int = 80000, levels: int = 5, downsample: float = 4.0,
+                 tile_size: int = 256, latency: float = 0.0):
+        """
+        Initialization of the SyntheticSlideBackend
+        :param width: width of level 0
+        :type width: int
+        :param height: height of level 0
+        :type height: int
+        :param levels: number of levels
+        :type levels: int
+        :param downsample: downsample between two consecutive levels
+        :type downsample: float
+        :param tile_size: reported native tile size
+        :type tile_size: int
+        :param latency: time in seconds each read_region call takes at least
+        :type latency: float
+        """
+        self.latency = latency
+        self.level_count = levels
+        self.level_downsamples = tuple(float(downsample ** level) for level in range(levels))
+        self.level_dimensions = tuple((int(width // d), int(height // d)) for d in self.level_downsamples)
+        self.properties = {
+            'openslide.vendor': 'synthetic',
+            'openslide.mpp-x': '0.25',
+            'openslide.mpp-y': '0.25',
+            'openslide.level[0].tile-width': str(tile_size),
+            'openslide.level[0].tile-height': str(tile_size),
+        }
+
+    @classmethod
+    def from_url(cls, url: str):
+        """
+        Creates a synthetic slide from an url like "synthetic://100000x80000?levels=5&latency=0.005"
+        :param url: the url, all query parameters are optional arguments of the constructor
+        :type url: str
+        :return: the synthetic slide
+        """
+        parsed = urlparse(url)
+        kwargs = {}
+        if parsed.netloc:
+            width, height = parsed.netloc.lower().split('x')
+            kwargs.update(width=int(width), height=int(height))
+        types = {'levels': int, 'downsample': float, 'tile_size': int, 'latency': float}
+        for name, values in parse_qs(parsed.query).items():
+            if name not in types:
+                raise ValueError(f'An incorrect parameter: {name} was chosen!')
+            kwargs[name] = types[name](values[0])
+        return cls(**kwargs)
+
+    def read_region(self, location: tuple, level: int, size: tuple) -> np.ndarray:
+        start = time.perf_counter()
+
+        downsample = self.level_downsamples[level]
+        xs = location[0] + np.arange(size[0], dtype=np.float32) * downsample
+        ys = location[1] + np.arange(size[1], dtype=np.float32) * downsample
+
+        # tissue: large smooth blobs; nuclei: small periodic dots inside the tissue
+        tissue = (np.sin(ys / 7000)[:, None] * np.sin(xs / 9000)[None, :] +
+                  0.3 * np.sin((ys[:, None] + xs[None, :]) / 2500)) > 0.25
+        nuclei = (np.sin(ys / 23)[:, None] + np.sin(xs / 29)[None, :]) > 1.4
+
+        region = np.empty((size[1], size[0], 4), np.uint8)
+        region[...] = (242, 242, 242, 255)
+        region[tissue] = (232, 160, 200, 255)
+        region[tissue & nuclei] = (110, 60, 150, 255)
+
+        width, height = self.level_dimensions[0]
+        outside = (ys < 0)[:, None] | (ys >= height)[:, None] | (xs < 0)[None, :] | (xs >= width)[None, :]
+        region[outside] = 0
+
+        remaining = self.latency - (time.perf_counter() - start)
+        if remaining > 0:
+            time.sleep(remaining)
+        return region
+
+
+# scheme -> factory of the backends opened by url, extension -> factory of the backends opened by file extension
+scheme_backends = {'synthetic': SyntheticSlideBackend.from_url}
+extension_backends = {}
+
+
+def register_backend(factory, schemes: tuple = (), extensions: tuple = ()):
+    """
+    Registers a backend, e.g. a tifffile or zarr reader for formats that can be read faster than with OpenSlide
+    :param factory: function that opens a slide from a path or url and returns a SlideBackend
+    :param schemes: url schemes handled by the backend, e.g. ('zarr',)
+    :type schemes: tuple
+    :param extensions: file extensions handled by the backend, e.g. ('.ome.tif',)
+    :type extensions: tuple
+    :return: /
+    """
+    for scheme in schemes:
+        scheme_backends[scheme.lower()] = factory
+    for extension in extensions:
+        extension_backends[extension.lower()] = factory
+
+
+def open_backend(filepath: str) -> SlideBackend:
+    """
+    Opens a slide with the backend registered for its url scheme or file extension. All other files are opened with
+    OpenSlide.
+    :param filepath: path or url of the slide
+    :type filepath: str
+    :return: the opened slide
+    """
+    scheme = filepath.split('://', 1)[0].lower() if '://' in filepath else None
+    if scheme in scheme_backends:
+        return scheme_backends[scheme](filepath)
+
+    lower_path = filepath.lower()
+    for extension in sorted(extension_backends, key=len, reverse=True):
+        if lower_path.endswith(extension):
+            return extension_backends[extension](filepath)
+    return OpenSlideBackend(filepath)
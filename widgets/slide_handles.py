@@ -0,0 +1,291 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from PySide6.QtCore import QMutex, QMutexLocker, QObject, QRunnable, Signal
+from .slide_backends import SlideBackend, open_backend
+import threading
+
+
+class SlideHandle:
+    """
+    An open slide of the SlideHandlePool together with the number of its current users. The handle is in the pool
+    while the slide is opened, so other users of the same file wait for it instead of opening it again.
+    """
+
+    def __init__(self, key: tuple):
+        self.key = key
+        self.slide = None
+        self.error: Exception = None  # Error of the open, raised to all waiting users
+        self.opened = threading.Event()  # Set once the open is finished, successful or not
+        self.users = 0
+        self.evicted = False
+
+
+class SlideHandlePool:
+    """
+    Thread-safe pool of open slides. Slides are reused per file, the number of open handles is bounded and the least
+    recently used handles are closed first. A handle that is evicted while it is used is closed by its last user.
+    Optionally, each thread gets a handle of its own, so reads of different threads do not contend for the internal
+    lock of a single openslide handle.
+    """
+
+    def __init__(self, max_open: int = 16, per_thread: bool = False, opener=open_backend):
+        """
+        Initialization of the SlideHandlePool
+        :param max_open: maximal number of open handles
+        :type max_open: int
+        :param per_thread: opens one handle per file and reading thread instead of one handle per file
+        :type per_thread: bool
+        :param opener: function that opens a slide from a file path, by default the backend registered for the path
+        """
+        self.max_open = max_open
+        self.per_thread = per_thread
+        self.opener = opener
+
+        self.handles = OrderedDict()  # (filepath, thread id or None) -> SlideHandle, least recently used first
+        self.mutex = QMutex()
+
+    def open(self, filepath: str):
+        """
+        Opens a slide through the pool
+        :param filepath: path of the slide
+        :type filepath: str
+        :return: the slide, which borrows a handle from the pool for every read
+        """
+        return PooledSlide(self, filepath)
+
+    def acquire(self, filepath: str, per_thread: bool = None) -> SlideHandle:
+        """
+        Returns an open handle of a file and marks it as used. Every acquired handle has to be released. The slide is
+        opened without holding the lock of the pool, so a slow open only blocks the users of the same file.
+        :param filepath: path of the slide
+        :type filepath: str
+        :param per_thread: acquires the handle of the calling thread, defaults to the setting of the pool
+        :type per_thread: bool
+        :return: the handle
+        """
+        per_thread = self.per_thread if per_thread is None else per_thread
+        key = (filepath, threading.get_ident() if per_thread else None)
+
+        with QMutexLocker(self.mutex):
+            handle = self.handles.get(key)
+            opening = handle is None
+            if opening:
+                handle = SlideHandle(key)
+                self.handles[key] = handle
+            self.handles.move_to_end(key)
+            handle.users += 1
+
+        if opening:
+            try:
+                handle.slide = self.opener(filepath)
+            except Exception as error:
+                handle.error = error
+                with QMutexLocker(self.mutex):
+                    if self.handles.get(key) is handle:
+                        del self.handles[key]
+            handle.opened.set()
+            with QMutexLocker(self.mutex):
+                evicted = self.evict(self.max_open)
+            self.close_handles(evicted)
+        else:
+            handle.opened.wait()
+
+        if handle.error is not None:
+            self.release(handle)
+            raise handle.error
+        return handle
+
+    def release(self, handle: SlideHandle):
+        """
+        Marks a handle as unused. Evicted handles are closed by their last user.
+        :param handle: the handle
+        :type handle: SlideHandle
+        :return: /
+        """
+        with QMutexLocker(self.mutex):
+            handle.users -= 1
+            close = handle.evicted and handle.users == 0
+        if close:
+            self.close_handles([handle])
+
+    @contextmanager
+    def borrow(self, filepath: str, per_thread: bool = None):
+        """
+        Context manager that acquires a handle and releases it afterwards
+        :param filepath: path of the slide
+        :type filepath: str
+        :param per_thread: acquires the handle of the calling thread, defaults to the setting of the pool
+        :type per_thread: bool
+        :return: the open slide
+        """
+        handle = self.acquire(filepath, per_thread)
+        try:
+            yield handle.slide
+        finally:
+            self.release(handle)
+
+    def evict(self, max_open: int, filepath: str = None) -> list:
+        """
+        Evicts the least recently used handles until at most max_open handles are open. The mutex has to be locked;
+        the unused evicted handles are returned and have to be closed after unlocking it.
+        :param max_open: number of handles to keep
+        :type max_open: int
+        :param filepath: only evicts the handles of this file, if given
+        :type filepath: str
+        :return: the evicted handles without users, handles in use are closed by their last user
+        """
+        keys = [key for key in self.handles if filepath is None or key[0] == filepath]
+        unused = []
+        for key in keys[:max(len(keys) - max_open, 0)]:
+            handle = self.handles.pop(key)
+            handle.evicted = True
+            if handle.users == 0:
+                unused.append(handle)
+        return unused
+
+    @staticmethod
+    def close_handles(handles: list):
+        """
+        Closes the slides of evicted handles, without holding the lock of the pool
+        :param handles: the handles
+        :type handles: list
+        :return: /
+        """
+        for handle in handles:
+            if handle.slide is not None:
+                handle.slide.close()
+
+    def close(self, filepath: str):
+        """
+        Closes all handles of a file
+        :param filepath: path of the slide
+        :type filepath: str
+        :return: /
+        """
+        with QMutexLocker(self.mutex):
+            evicted = self.evict(0, filepath)
+        self.close_handles(evicted)
+
+    def close_all(self):
+        """
+        Closes all handles
+        :return: /
+        """
+        with QMutexLocker(self.mutex):
+            evicted = self.evict(0)
+        self.close_handles(evicted)
+
+    def __len__(self) -> int:
+        with QMutexLocker(self.mutex):
+            return len(self.handles)
+
+
+class PooledSlide(SlideBackend):
+    """
+    A slide opened through a SlideHandlePool. It offers the SlideBackend interface used by the SlideView; the metadata
+    is read once, every read borrows a handle from the pool.
+    """
+
+    def __init__(self, pool: SlideHandlePool, filepath: str):
+        """
+        Initialization of the PooledSlide
+        :param pool: the pool providing the handles
+        :type pool: SlideHandlePool
+        :param filepath: path of the slide
+        :type filepath: str
+        """
+        self.pool = pool
+        self.filepath = filepath
+
+        with pool.borrow(filepath, per_thread=False) as slide:
+            self.level_count = slide.level_count
+            self.level_dimensions = tuple(slide.level_dimensions)
+            self.level_downsamples = tuple(slide.level_downsamples)
+            self.properties = dict(slide.properties)
+
+    def read_region(self, location: tuple, level: int, size: tuple):
+        """
+        Reads a region with a handle borrowed from the pool
+        :param location: upper left corner of the region in slide coordinates (level 0)
+        :type location: tuple
+        :param level: level of the region
+        :type level: int
+        :param size: size of the region in pixels of the level
+        :type size: tuple
+        :return: the region as RGBA image or array
+        """
+        with self.pool.borrow(self.filepath) as slide:
+            return slide.read_region(location, level, size)
+
+    def get_thumbnail(self, size: tuple):
+        """
+        Creates a thumbnail with a handle borrowed from the pool
+        :param size: maximal size of the thumbnail
+        :type size: tuple
+        :return: the thumbnail as RGB image
+        """
+        with self.pool.borrow(self.filepath, per_thread=False) as slide:
+            return slide.get_thumbnail(size)
+
+    @property
+    def associated_images(self) -> dict:
+        """
+        Reads the associated images, like label or macro image, of the slide
+        :return: name -> image of all associated images
+        """
+        with self.pool.borrow(self.filepath, per_thread=False) as slide:
+            return dict(slide.associated_images)
+
+    def close(self):
+        """
+        Closes all handles of the slide in the pool
+        :return: /
+        """
+        self.pool.close(self.filepath)
+
+
+class SlideOpener(QObject):
+    opened = Signal(str, object)
+    failed = Signal(str, str)
+
+    def __init__(self, pool: SlideHandlePool, filepath: str, width: int = None, height: int = None):
+        """
+        Initialization of the SlideOpener, which opens a slide and reads its metadata off the GUI thread
+        :param pool: the pool to open the slide with
+        :type pool: SlideHandlePool
+        :param filepath: path of the slide
+        :type filepath: str
+        :param width: width of the view the slide is opened for
+        :type width: int
+        :param height: height of the view the slide is opened for
+        :type height: int
+        """
+        super().__init__()
+        self.filepath = filepath
+        self.width = width
+        self.height = height
+        self.worker = SlideOpenWorker(self, pool, filepath)
+
+
+class SlideOpenWorker(QRunnable):
+
+    def __init__(self, opener: SlideOpener, pool: SlideHandlePool, filepath: str):
+        super().__init__()
+        self.opener = opener
+        self.pool = pool
+        self.filepath = filepath
+
+    def run(self):
+        slide, message = None, ''
+        try:
+            slide = self.pool.open(self.filepath)
+        except Exception as error:  # e.g. missing files or unsupported formats, reported to the GUI thread
+            message = str(error)
+
+        try:
+            if slide is None:
+                self.opener.failed.emit(self.filepath, message)
+            else:
+                self.opener.opened.emit(self.filepath, slide)
+        except RuntimeError:  # the opener is deleted if the application quits while opening
+            pass
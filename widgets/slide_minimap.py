@@ -0,0 +1,108 @@
+from PySide6.QtCore import QPointF, QRectF, QSize, Slot
+from PySide6.QtGui import Qt, QColor, QMouseEvent, QPainter, QPaintEvent, QPen, QPixmap
+from PySide6.QtWidgets import QWidget
+import numpy as np
+from .image_conversion import array_to_qimage
+from .slide_viewer import SlideView
+
+
+class SlideMinimap(QWidget):
+    """
+    Shows the overview of the slide of a SlideView together with the rectangle of the current viewport. Clicking or
+    dragging moves the viewport of the view to the position under the mouse.
+    """
+
+    def __init__(self, view: SlideView = None, *args):
+        """
+        Initialization of the SlideMinimap
+        :param view: the view to navigate
+        :type view: SlideView
+        :param args: arguments passed to the QWidget
+        """
+        super().__init__(*args)
+        self.view: SlideView = None
+        self.pixmap = QPixmap()
+        self.frame_pen = QPen(QColor(255, 0, 0), 2)
+        self.setMinimumSize(50, 50)
+        self.set_view(view)
+
+    def set_view(self, view: SlideView):
+        """
+        Connects the minimap to a view
+        :param view: the view or None to disconnect the minimap
+        :type view: SlideView
+        :return: /
+        """
+        if self.view is not None:
+            self.view.overviewLoaded.disconnect(self.set_overview)
+            self.view.viewportChanged.disconnect(self.update)
+        self.view = view
+        if view is not None:
+            view.overviewLoaded.connect(self.set_overview)
+            view.viewportChanged.connect(self.update)
+        self.set_overview(None if view is None else view.overview)
+
+    @Slot(object)
+    def set_overview(self, overview: np.ndarray):
+        """
+        Displays a new overview
+        :param overview: the overview as RGBA array or None
+        :type overview: np.ndarray
+        :return: /
+        """
+        self.pixmap = QPixmap() if overview is None else QPixmap.fromImage(array_to_qimage(overview))
+        self.update()
+
+    def sizeHint(self) -> QSize:
+        return QSize(200, 150)
+
+    def image_rect(self) -> QRectF:
+        """
+        Utility method to get the area of the widget covered by the overview, which is fitted into the widget
+        :return: the area in widget coordinates
+        """
+        if self.pixmap.isNull():
+            return QRectF()
+        scale = min(self.width() / self.pixmap.width(), self.height() / self.pixmap.height())
+        width, height = self.pixmap.width() * scale, self.pixmap.height() * scale
+        return QRectF((self.width() - width) / 2, (self.height() - height) / 2, width, height)
+
+    def paintEvent(self, event: QPaintEvent):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), self.palette().window())
+        rect = self.image_rect()
+        if rect.isNull() or not self.view or not self.view.slide:
+            return
+
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        painter.drawPixmap(rect, self.pixmap, QRectF(self.pixmap.rect()))
+
+        # viewport in slide coordinates mapped into the overview
+        scale = rect.width() / self.view.slide.dimensions[0]
+        viewport = self.view.get_viewport_rect()
+        frame = QRectF(rect.topLeft() + viewport.topLeft() * scale, viewport.size() * scale)
+        painter.setClipRect(rect)
+        painter.setPen(self.frame_pen)
+        painter.setBrush(Qt.BrushStyle.NoBrush)
+        painter.drawRect(frame)
+
+    def navigate(self, pos: QPointF):
+        """
+        Centers the viewport of the view at the slide position below a widget position
+        :param pos: position in widget coordinates
+        :type pos: QPointF
+        :return: /
+        """
+        rect = self.image_rect()
+        if rect.isNull() or not self.view or not self.view.slide:
+            return
+        scale = self.view.slide.dimensions[0] / rect.width()
+        self.view.center_on((pos - rect.topLeft()) * scale)
+
+    def mousePressEvent(self, event: QMouseEvent):
+        if event.button() == Qt.MouseButton.LeftButton:
+            self.navigate(event.position())
+
+    def mouseMoveEvent(self, event: QMouseEvent):
+        if event.buttons() & Qt.MouseButton.LeftButton:
+            self.navigate(event.position())
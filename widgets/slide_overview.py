@@ -0,0 +1,178 @@
+from collections import OrderedDict
+from PySide6.QtCore import QObject, QRunnable, Signal
+from PIL import Image
+import numpy as np
+from .image_conversion import tile_to_array
+
+
+def compute_overview(slide, max_size: int = 2048) -> np.ndarray:
+    """
+    Computes a low-resolution image of the whole slide. The associated thumbnail is used if it covers the slide and is
+    large enough, otherwise the smallest level that is at least max_size pixels large (but not much larger) is read and
+    downscaled.
+    :param slide: the slide
+    :type slide: SlideBackend
+    :param max_size: largest edge length of the overview in pixels
+    :type max_size: int
+    :return: the overview as read-only RGBA array, its edges are at most max_size pixels long
+    """
+    width, height = slide.dimensions
+
+    image = None
+    try:
+        thumbnail = slide.associated_images.get('thumbnail')
+    except Exception:  # associated images are optional and some readers fail on them
+        thumbnail = None
+    if thumbnail is not None and max(thumbnail.size) >= max_size // 2 and \
+            abs(thumbnail.width / thumbnail.height - width / height) < 0.01 * width / height:
+        image = thumbnail.convert('RGBA')
+
+    if image is None:
+        level = slide.level_count - 1
+        while level > 0 and max(slide.level_dimensions[level]) < max_size and \
+                max(slide.level_dimensions[level - 1]) <= 4 * max_size:
+            level -= 1
+        region = slide.read_region((0, 0), level, slide.level_dimensions[level])
+        image = region if isinstance(region, Image.Image) else Image.fromarray(np.asarray(region), 'RGBA')
+
+    if max(image.size) > max_size:
+        image = image.copy()
+        image.thumbnail((max_size, max_size), Image.Resampling.BILINEAR)
+    return tile_to_array(image)
+
+
+class BackgroundMask:
+    """
+    Predicts blank tiles from the overview of a slide, so they are not read at all. A tile is background if its
+    footprint in the overview, extended by one overview pixel on each side, has a single color. Tissue much smaller than
+    an overview pixel can be averaged away, so the prediction is optional.
+    """
+
+    def __init__(self, overview: np.ndarray, dimensions: tuple, tolerance: int = 3):
+        """
+        Initialization of the BackgroundMask
+        :param overview: RGBA array of the whole slide
+        :type overview: np.ndarray
+        :param dimensions: size (width, height) of the slide (level 0)
+        :type dimensions: tuple
+        :param tolerance: largest difference of each channel within the footprint of a background tile
+        :type tolerance: int
+        """
+        self.overview = overview
+        self.scale_x = overview.shape[1] / dimensions[0]  # overview pixels per slide pixel
+        self.scale_y = overview.shape[0] / dimensions[1]
+        self.tolerance = tolerance
+
+    def color(self, x: float, y: float, width: float, height: float):
+        """
+        Predicts the color of a region
+        :param x: left edge of the region in slide coordinates (level 0)
+        :param y: upper edge of the region in slide coordinates (level 0)
+        :param width: width of the region in slide coordinates (level 0)
+        :param height: height of the region in slide coordinates (level 0)
+        :return: the RGBA color if the region is background, None otherwise
+        """
+        left, top = max(int(x * self.scale_x) - 1, 0), max(int(y * self.scale_y) - 1, 0)
+        right, bottom = int((x + width) * self.scale_x) + 2, int((y + height) * self.scale_y) + 2
+        footprint = self.overview[top:bottom, left:right].reshape(-1, 4)
+        if not len(footprint):
+            return None
+        low, high = footprint.min(axis=0), footprint.max(axis=0)
+        if (high.astype(np.int16) - low).max() > self.tolerance:
+            return None
+        return ((low.astype(np.uint16) + high) // 2).astype(np.uint8)
+
+
+class OverviewCache:
+    """
+    Least-recently-used cache of the overviews of recently opened slides. Optionally, the overviews are kept in a
+    DiskTileCache, so slides open instantly in later sessions as well. Only used from the GUI thread, the disk cache
+    may be read by the loading threads.
+    """
+
+    def __init__(self, max_entries: int = 16, disk_cache=None):
+        """
+        Initialization of the OverviewCache
+        :param max_entries: number of overviews kept in memory
+        :type max_entries: int
+        :param disk_cache: optional persistent cache of the overviews
+        :type disk_cache: DiskTileCache
+        """
+        self.max_entries = max_entries
+        self.disk_cache = disk_cache
+        self.overviews = OrderedDict()  # (filepath, max_size) -> overview, least recently used first
+
+    def get(self, filepath: str, max_size: int) -> np.ndarray:
+        """
+        Returns the overview of a slide from memory
+        :return: the overview or None if it is not cached
+        """
+        overview = self.overviews.get((filepath, max_size))
+        if overview is not None:
+            self.overviews.move_to_end((filepath, max_size))
+        return overview
+
+    def put(self, filepath: str, max_size: int, overview: np.ndarray):
+        """
+        Stores the overview of a slide in memory
+        :return: /
+        """
+        self.overviews[(filepath, max_size)] = overview
+        self.overviews.move_to_end((filepath, max_size))
+        while len(self.overviews) > self.max_entries:
+            self.overviews.popitem(last=False)
+
+    def load(self, slide, filepath: str, max_size: int) -> np.ndarray:
+        """
+        Loads the overview from the disk cache or computes it, called by the loading threads. The level -1 of the disk
+        cache holds the overviews.
+        :return: the overview
+        """
+        if self.disk_cache is not None:
+            overview = self.disk_cache.get(filepath, -1, max_size, 0, 0)
+            if overview is not None:
+                return overview
+        overview = compute_overview(slide, max_size)
+        if self.disk_cache is not None:
+            self.disk_cache.put(filepath, -1, max_size, 0, 0, overview)
+        return overview
+
+
+class OverviewLoader(QObject):
+    loaded = Signal(str, object)
+
+    def __init__(self, slide, filepath: str, max_size: int, overview_cache: OverviewCache):
+        """
+        Initialization of the OverviewLoader, which loads the overview of a slide in the background
+        :param slide: the slide
+        :type slide: PooledSlide
+        :param filepath: path of the slide, emitted with the overview
+        :type filepath: str
+        :param max_size: largest edge length of the overview in pixels
+        :type max_size: int
+        :param overview_cache: the cache that loads the overview
+        :type overview_cache: OverviewCache
+        """
+        super().__init__()
+        self.worker = OverviewWorker(self, slide, filepath, max_size, overview_cache)
+
+
+class OverviewWorker(QRunnable):
+
+    def __init__(self, loader: OverviewLoader, slide, filepath: str, max_size: int, overview_cache: OverviewCache):
+        super().__init__()
+        self.loader = loader
+        self.slide = slide
+        self.filepath = filepath
+        self.max_size = max_size
+        self.overview_cache = overview_cache
+
+    def run(self):
+        try:
+            overview = self.overview_cache.load(self.slide, self.filepath, self.max_size)
+        except Exception:  # a broken overview must not break the viewer, the tiles are displayed anyway
+            overview = None
+        try:
+            self.loader.loaded.emit(self.filepath, overview)
+        except RuntimeError:  # the loader is deleted if the application quits while loading
+            pass
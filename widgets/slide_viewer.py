@@ -1,23 +1,90 @@
-from PIL.ImageQt import ImageQt
-from PySide6.QtCore import QPointF, Signal, QPoint, QRectF, Slot, QThread, QThreadPool
-from PySide6.QtGui import QPainter, Qt, QPixmap, QResizeEvent, QWheelEvent, QMouseEvent, QImage
+from PySide6.QtCore import QPointF, Signal, QRectF, Slot, QThreadPool, QObject, QMutex, QMutexLocker, QTimer
+from PySide6.QtGui import Qt, QColor, QPixmap, QResizeEvent, QWheelEvent, QMouseEvent
 from PySide6.QtWidgets import *
-import numpy as np
 import os
-import sys
-from PIL import Image
-
-if sys.platform.startswith("win"):
-    openslide_path = os.path.abspath("./openslide/bin")
-    os.add_dll_directory(openslide_path)
-from openslide import OpenSlide
+import time
+import numpy as np
+from .image_conversion import array_to_qimage
+from .adaptive_quality import AdaptiveQuality
+from .color_transform import ColorTransform, TransformLoader
+from .disk_tile_cache import DiskTileCache
+from .heatmap_layer import HeatmapLayer
+from .process_tile_reader import ProcessTileReader
+from .slide_handles import SlideHandlePool, PooledSlide, SlideOpener
+from .slide_overview import BackgroundMask, OverviewCache, OverviewLoader
+from .tile_cache import TileCache, UniformTile
+from .tile_prefetcher import TilePrefetcher
+from .tile_scheduler import TileScheduler, TileRequest
+from .view_metrics import ViewMetrics
 
 
 class SlideView(QGraphicsView):
     sendPixmap = Signal(QGraphicsPixmapItem)
     pixmapFinished = Signal()
-
-    def __init__(self, *args):
+    overviewLoaded = Signal(object)
+    viewportChanged = Signal()
+    slideOpened = Signal(dict)
+    slideFailed = Signal(str, str)
+
+    def __init__(self, *args, max_threads: int = None, cache_bytes: int = 256 * 1024 ** 2, tile_size: int = None,
+                 tile_margin: int = 1, prefetch: bool = True, progressive: bool = True,
+                 slide_pool: SlideHandlePool = None, disk_cache: DiskTileCache = None, metrics: ViewMetrics = None,
+                 decode_processes: int = 0, overview_cache: OverviewCache = None, overview_size: int = 2048,
+                 scheduler: TileScheduler = None, zoom_settle_ms: int = 150, skip_background: bool = False,
+                 adaptive_quality: AdaptiveQuality = None, color_transform: ColorTransform = None,
+                 uniform_tolerance: int = 0):
+        """
+        Initialization of the SlideView
+        :param args: arguments passed to the QGraphicsView
+        :param max_threads: number of threads of the tile reading pool, defaults to os.cpu_count() or to the number of
+                            concurrent reads of the decode processes
+        :type max_threads: int
+        :param cache_bytes: memory budget of the tile cache in bytes
+        :type cache_bytes: int
+        :param tile_size: edge length of the tiles in pixels of their level, defaults to the native tile size of the
+                          slide or 256 if the slide is not tiled
+        :type tile_size: int
+        :param tile_margin: number of tiles loaded around the viewport on each side
+        :type tile_margin: int
+        :param prefetch: enables prefetching of the tiles in the direction of panning and zooming
+        :type prefetch: bool
+        :param progressive: displays each tile as soon as it is read instead of waiting for all visible tiles
+        :type progressive: bool
+        :param slide_pool: pool of open slides, which can be shared by several views
+        :type slide_pool: SlideHandlePool
+        :param disk_cache: optional persistent tile cache, which is checked before reading from the slide
+        :type disk_cache: DiskTileCache
+        :param metrics: optional instrumentation of the tile reads and the display, disabled if None
+        :type metrics: ViewMetrics
+        :param decode_processes: number of worker processes that read and decode the tiles, 0 reads them in the
+                                 threads of this process. Ignored if a slide_pool is given; use the open method of a
+                                 ProcessTileReader as opener of the pool instead.
+        :type decode_processes: int
+        :param overview_cache: cache of the overviews of recently opened slides, which can be shared by several views
+        :type overview_cache: OverviewCache
+        :param overview_size: largest edge length of the overview in pixels
+        :type overview_size: int
+        :param scheduler: tile scheduler shared with other views, e.g. of a ViewLink. Its thread pool, tile cache and
+                          disk cache are used instead of max_threads, cache_bytes and disk_cache. Views sharing a
+                          scheduler have to use the same tile size for the same slide.
+        :type scheduler: TileScheduler
+        :param zoom_settle_ms: time in milliseconds the zoom has to stay on a new level before its tiles are read;
+                               until then, the displayed tiles are scaled as preview
+        :type zoom_settle_ms: int
+        :param skip_background: predicts blank tiles from the overview and does not read them. Blank tiles are
+                                detected after reading in any case (see uniform_tolerance).
+        :type skip_background: bool
+        :param adaptive_quality: reads coarser levels while the viewport moves fast and the reads are slow, disabled
+                                 if None
+        :type adaptive_quality: AdaptiveQuality
+        :param color_transform: display transform of the tiles, e.g. a gamma adjustment or a stain normalization, see
+                                set_color_transform
+        :type color_transform: ColorTransform
+        :param uniform_tolerance: largest difference of each channel within a read tile that is still stored and
+                                  drawn as a single color, e.g. 6 for blank glass with sensor noise. The default 0 only
+                                  collapses exactly uniform tiles, None disables the detection.
+        :type uniform_tolerance: int
+        """
         super().__init__(*args)
         self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
         self.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
@@ -26,11 +93,19 @@ class SlideView(QGraphicsView):
         # Boolean that enables and disables annotations
         self.annotationMode = False
 
-        # The slide and the path to it
-        self.slide: OpenSlide = None
+        # The slide and the path to it. Slides are opened through a pool, which reuses and bounds the open handles.
+        # Optionally, the tiles are decoded in worker processes, which hold handles of their own.
+        self.process_reader = None
+        if slide_pool is None and decode_processes:
+            self.process_reader = ProcessTileReader(decode_processes)
+            slide_pool = SlideHandlePool(opener=self.process_reader.open)
+        self.slide_pool = SlideHandlePool() if slide_pool is None else slide_pool
+        self.slide: PooledSlide = None
         self.filepath = None
+        self.slide_opener = None  # Currently running SlideOpener of load_slide_async
 
-        # The width of the viewport and the current mouse position
+        # The width of the viewport and the current mouse position (upper left corner of the viewport in slide
+        # coordinates)
         self.width = self.frameRect().width()
         self.height = self.frameRect().height()
         self.mouse_pos: QPointF = QPointF()
@@ -46,27 +121,118 @@ class SlideView(QGraphicsView):
         self.level_downsamples = {}  # Lowest zoom for all levels
         self.cur_level = 0  # Current level for the zoom
 
-        # Display logic
-        self.fused_image = Image.Image()  # Image that displays the image
-        self.pixmap = QPixmap()  # Pixmap that displays the image
-        # self.painter = QPainter(self.fused_image)  # Painter that draws the pixmap
-        self.pixmap_item = QGraphicsPixmapItem()  # "Container" of the pixmap
-        self.anchor_point = QPoint()  # Synchronous anchorpoint of the image
-        self.pixmap_compensation = QPointF()
-        self.image_patches = {}  # Storage of previously created patches of the image
-
-        # Threading logic
-        self.max_threads = 16  # os.cpu_count()
-        self.sqrt_thread_count = int(np.sqrt(self.max_threads))
-        self.threads_finished = []
+        # Display logic: every tile is an item of its own, so only newly read tiles are uploaded. The items are
+        # children of the pixmap_item, whose coordinates are slide coordinates (level 0); panning and zooming only
+        # change the position and scale of the pixmap_item.
+        self.pixmap_item = QGraphicsPixmapItem()  # "Container" of all tile items
+        self.pixmap_level = 0  # Level of the displayed tiles
+        self.pixmap_tiles = None  # Tile range (first_col, first_row, last_col, last_row) of the displayed tiles
+        self.tile_items = {}  # (level, col, row) -> QGraphicsPixmapItem of the displayed tiles
+        self.spare_items = []  # Hidden tile items for reuse
+        self.spare_rect_items = []  # Hidden items of uniform tiles for reuse
+        self.overlay_connections = {}  # Overlay -> connection of viewportChanged to its update_tiles
+        self.overview_item = QGraphicsPixmapItem(self.pixmap_item)  # Overview of the slide as coarse background
+        self.overview_item.setZValue(-1e6)
+        self.placeholder_item = QGraphicsRectItem(self.pixmap_item)  # Extent of the slide until the overview is loaded
+        self.placeholder_item.setBrush(QColor(235, 235, 235))
+        self.placeholder_item.setPen(Qt.PenStyle.NoPen)
+        self.placeholder_item.setZValue(-2e6)
+        self.placeholder_item.hide()
+        self.loading_item = QGraphicsSimpleTextItem('Loading slide ...', self.pixmap_item)  # Shown while opening
+        self.loading_item.hide()
+
+        # Progressive rendering: finished tiles are collected and added to the scene once per frame
+        self.progressive = progressive
+        self.finished_tiles = []  # (level, col, row, RGBA array) of the tiles that are not displayed yet
+        self.paint_timer = QTimer(self)
+        self.paint_timer.setSingleShot(True)
+        self.paint_timer.setInterval(16)
+        self.paint_timer.timeout.connect(self.paint_tiles)
+
+        # Wheel coalescing: the first wheel event of a frame is applied at once, the following ones are accumulated and
+        # applied together with the next frame. The displayed tiles are scaled as preview; the tiles of a new level are
+        # only read once the zoom stays on it, so a fast zoom does not read the levels it passes through.
+        self.zoom_factor = 1.0  # Accumulated downsample factor of the wheel events that are not applied yet
+        self.zoom_anchor = QPointF()  # Viewport position of the latest wheel event
+        self.zoom_timer = QTimer(self)
+        self.zoom_timer.setSingleShot(True)
+        self.zoom_timer.setInterval(16)
+        self.zoom_timer.timeout.connect(self.apply_zoom)
+        self.settle_timer = QTimer(self)
+        self.settle_timer.setSingleShot(True)
+        self.settle_timer.setInterval(zoom_settle_ms)
+        self.settle_timer.timeout.connect(self.update_pixmap)
+
+        # Adaptive quality: under load, fast motion reads a coarser level than cur_level, which is refined once the
+        # motion stops
+        self.adaptive_quality = adaptive_quality
+        self.refine_timer = QTimer(self)
+        self.refine_timer.setSingleShot(True)
+        self.refine_timer.timeout.connect(self.update_pixmap)
+        if adaptive_quality is not None:
+            self.refine_timer.setInterval(adaptive_quality.refine_delay_ms + 10)
+
+        # Tile grid: tiles have a fixed size per level, the visible grid is computed from the viewport
+        self.tile_size = tile_size
+        self.user_tile_size = tile_size
+        self.tile_margin = tile_margin
+
+        # Threading logic: a long-lived pool owns all read jobs, so no threads are created while panning or zooming. With
+        # decode processes, the threads only wait for the processes, one thread per shared memory slot keeps them busy.
+        if max_threads is None and self.process_reader is not None:
+            max_threads = len(self.process_reader.slots)
+        if scheduler is None:
+            self.max_threads = max_threads or os.cpu_count() or 1
+            self.thread_pool = QThreadPool(self)
+            self.thread_pool.setMaxThreadCount(self.max_threads)
+        else:
+            self.thread_pool = scheduler.thread_pool
+            self.max_threads = self.thread_pool.maxThreadCount()
+        self.loader_pool = QThreadPool(self)  # Opens slides and loads overviews without blocking the tile reads
+        self.loader_pool.setMaxThreadCount(2)
+        self.image_job = None  # Currently running ImageBlockWrapper
+
+        # Tiles of all levels and slides, aligned to the tile grid of each level
+        self.tile_cache = TileCache(cache_bytes) if scheduler is None else scheduler.tile_cache
+
+        # Tiles of previous sessions, kept on local disk
+        self.disk_cache = disk_cache if scheduler is None else scheduler.disk_cache
+
+        # Low-resolution image of the whole slide, loaded in the background on open. It renders the initial view and
+        # powers the SlideMinimap.
+        self.overview_cache = OverviewCache(disk_cache=self.disk_cache) if overview_cache is None else overview_cache
+        self.overview_size = overview_size
+        self.overview: np.ndarray = None  # RGBA array of the overview
+        self.overview_downsample = 0.0  # Slide pixels (level 0) per overview pixel
+        self.overview_loader = None  # Currently running OverviewLoader
+        self.skip_background = skip_background
+        self.uniform_tolerance = uniform_tolerance
+
+        # Display transform: the reading threads transform the tiles, the transformed tiles are cached next to the raw
+        # ones. Tiles displayed with a previous transform stay visible until their replacements arrive.
+        self.color_transform = color_transform
+        self.stale_tiles = set()  # (level, col, row) of the tile items displayed with a previous transform
+        self.transform_loader = None  # Currently running TransformLoader of the overview
+
+        # Opt-in instrumentation, the hot paths only check for None if it is disabled
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.watch_cache('memory', self.tile_cache)
+            if self.disk_cache is not None:
+                metrics.watch_cache('disk', self.disk_cache)
+
+        # Orders, coalesces and cancels the tile reads on the thread pool
+        if scheduler is None:
+            scheduler = TileScheduler(self.thread_pool, self.tile_cache, self.disk_cache, self.metrics)
+        self.scheduler = scheduler
+
+        # Reads the tiles needed next with a low priority into the tile cache
+        self.prefetch_enabled = prefetch
+        self.prefetcher = TilePrefetcher(self.scheduler, self.tile_cache, owner=self)
 
         self.pixmapFinished.connect(self.set_pixmap)
 
-        # Boolean that is set to true if there is a level crossing (or all patches have to be reloaded)
-        self.zoomed = True
         self.updating = False
-        self.zoom_finished = True
-        self.debug_counter = 0
 
     def load_slide(self, filepath: str, width: int = None, height: int = None):
         """
@@ -74,7 +240,9 @@ class SlideView(QGraphicsView):
         :param filepath: path of the _slide data. The data type is based on the OpenSlide library and can handle:
                          Aperio (.svs, .tif), Hamamatsu (.vms, .vmu, .ndpi), Leica (.scn), MIRAX (.mrxs),
                          Philips (.tiff), Sakura (.svslide), Trestle (.tif), Ventana (.bif, .tif),
-                         Generic tiled TIFF (.tif) (see https://openslide.org)
+                         Generic tiled TIFF (.tif) (see https://openslide.org). Other formats and urls are read by the
+                         backends registered in slide_backends, e.g. "synthetic://100000x80000?levels=5" opens a
+                         generated test slide.
         :type filepath: str
         :param width: width of the GraphicsView
         :type width: int
@@ -85,27 +253,145 @@ class SlideView(QGraphicsView):
         # TODO: Temporary solution for saving the zoom and movement of the current wsi slide.
         #  This will not save the zoom if the user switches to any other whole slide image.
         if self.filepath and self.filepath == filepath:
+            self.abort_open()
             self.update_pixmap()
             self.sendPixmap.emit(self.pixmap_item)
             return
 
-        self.slide = OpenSlide(filepath)
-        self.filepath = filepath
+        self.abort_open()
+        self.set_slide(filepath, self.slide_pool.open(filepath), width, height)
+
+    def load_slide_async(self, filepath: str, width: int = None, height: int = None):
+        """
+        Loads a slide like load_slide, but opens it and reads its metadata off the GUI thread, so large slides or
+        network shares do not freeze the UI. A placeholder is displayed until the slide is open; slideOpened is emitted
+        with the metadata before the tiles are streamed, slideFailed if the slide cannot be opened. Loading another
+        slide aborts the open.
+        :param filepath: path of the slide, see load_slide
+        :type filepath: str
+        :param width: width of the GraphicsView
+        :type width: int
+        :param height: height of the GraphicView
+        :type height: int
+        :return: /
+        """
+        if self.filepath and self.filepath == filepath:
+            self.load_slide(filepath, width, height)
+            return
+
+        self.abort_open()
+        self.close_slide()
+        self.loading_item.setPos(((width or self.width) - self.loading_item.boundingRect().width()) / 2,
+                                 (height or self.height) / 2)
+        self.loading_item.show()
+        self.sendPixmap.emit(self.pixmap_item)
+
+        self.slide_opener = SlideOpener(self.slide_pool, filepath, width, height)
+        self.slide_opener.opened.connect(self.slide_opened)
+        self.slide_opener.failed.connect(self.slide_failed)
+        self.loader_pool.start(self.slide_opener.worker, 1)  # before a running overview of the previous slide
+
+    def abort_open(self):
+        """
+        Aborts a running asynchronous open. The handle of an open that is already running is kept in the slide pool,
+        but the slide is not displayed.
+        :return: /
+        """
+        if self.slide_opener is not None:
+            self.loader_pool.tryTake(self.slide_opener.worker)
+            self.slide_opener = None
+        self.loading_item.hide()
+
+    @Slot(str, object)
+    def slide_opened(self, filepath: str, slide: PooledSlide):
+        """
+        Displays a slide opened by the current SlideOpener
+        :param filepath: path of the slide
+        :type filepath: str
+        :param slide: the opened slide
+        :type slide: PooledSlide
+        :return: /
+        """
+        opener = self.sender()
+        if opener is not self.slide_opener:
+            return
+        self.slide_opener = None
+        self.loading_item.hide()
+        self.set_slide(filepath, slide, opener.width, opener.height)
+
+    @Slot(str, str)
+    def slide_failed(self, filepath: str, message: str):
+        """
+        Reports a slide the current SlideOpener failed to open
+        :param filepath: path of the slide
+        :type filepath: str
+        :param message: the error message
+        :type message: str
+        :return: /
+        """
+        if self.sender() is not self.slide_opener:
+            return
+        self.slide_opener = None
+        self.loading_item.hide()
+        self.slideFailed.emit(filepath, message)
+
+    def close_slide(self):
+        """
+        Stops all reads and removes the displayed slide
+        :return: /
+        """
+        self.prefetcher.cancel()
+        self.scheduler.cancel_all(self)
+        self.zoom_factor = 1.0
+        self.settle_timer.stop()
+        self.refine_timer.stop()
+        self.image_job = None
+        self.updating = False
+        self.finished_tiles = []
+        self.overview_loader = None
+        self.transform_loader = None
+        self.set_overview(None)
+        self.scheduler.release_background(self.filepath, self)
+        self.remove_tile_items(lambda key: True)
+        self.pixmap_tiles = None
+        self.placeholder_item.hide()
+        self.slide = None
+        self.filepath = None
+
         self.mouse_pos = QPointF(0, 0)
+        self.cur_downsample = 1.0
+        self.update_pixmap_geometry()
 
-        if not width or not height:
+    def set_slide(self, filepath: str, slide: PooledSlide, width: int = None, height: int = None):
+        """
+        Displays an opened slide and starts reading its tiles
+        :param filepath: path of the slide
+        :type filepath: str
+        :param slide: the opened slide
+        :type slide: PooledSlide
+        :param width: width of the GraphicsView
+        :type width: int
+        :param height: height of the GraphicView
+        :type height: int
+        :return: /
+        """
+        self.close_slide()
+        self.slide = slide
+        self.filepath = filepath
+        if self.disk_cache is not None:
+            self.disk_cache.slide_token(filepath, refresh=True)
+        self.slideOpened.emit(self.get_metadata())
+
+        if width and height:
+            self.width = width
+            self.height = height
+        else:
             self.width = self.frameRect().width()
             self.height = self.frameRect().height()
 
-        bottom_right = QPointF(self.width * 4, self.height * 4)
-        scene_rect = QRectF(self.mouse_pos, bottom_right)
+        self.setSceneRect(QRectF(0, 0, self.width, self.height))
 
-        self.setSceneRect(scene_rect)
-
-        self.fused_image = Image.new('RGBA', (self.width * 4, self.height * 4))
-        self.pixmap = QPixmap(self.width * 4, self.height * 4)
-        self.pixmap_item.setPixmap(self.pixmap)
-        self.pixmap_item.setShapeMode(QGraphicsPixmapItem.ShapeMode.BoundingRectShape)
+        self.tile_size = self.user_tile_size or self.get_native_tile_size()
 
         self.level_downsamples = [self.slide.level_downsamples[level] for level in range(self.slide.level_count)]
 
@@ -114,133 +400,407 @@ class SlideView(QGraphicsView):
         self.cur_level = self.slide.get_best_level_for_downsample(self.max_downsample)
         self.cur_level_zoom = self.cur_downsample / self.level_downsamples[self.cur_level]
 
-        self.pixmap_item.setPos(-self.width / self.cur_level_zoom, -self.height / self.cur_level_zoom)
-        self.pixmap_item.setScale(1 / self.cur_level_zoom)
+        # the extent of the slide is shown until the overview and the tiles are loaded
+        self.placeholder_item.setRect(QRectF(0, 0, *self.slide.dimensions))
+        self.placeholder_item.show()
 
-        self.anchor_point = QPoint(0, 0)
+        self.load_overview()
+        self.update_pixmap()
+        self.sendPixmap.emit(self.pixmap_item)
 
-        self.image_patches = [QPixmap(self.width, self.height) for _ in range(self.max_threads)]
-        self.image_patches = np.array(self.image_patches)
-        self.image_patches = self.image_patches.reshape([self.sqrt_thread_count, self.sqrt_thread_count])
+    def get_metadata(self) -> dict:
+        """
+        Utility method to summarize the metadata of the current slide
+        :return: dictionary with the dimensions, level_count, level_dimensions, level_downsamples, mpp_x, mpp_y
+                 (micrometers per pixel of level 0, None if unknown) and the vendor
+        """
+        def float_property(name):
+            try:
+                return float(self.slide.properties[name])
+            except (KeyError, ValueError):
+                return None
+
+        return {'filepath': self.filepath, 'dimensions': self.slide.dimensions, 'level_count': self.slide.level_count,
+                'level_dimensions': self.slide.level_dimensions, 'level_downsamples': self.slide.level_downsamples,
+                'mpp_x': float_property('openslide.mpp-x'), 'mpp_y': float_property('openslide.mpp-y'),
+                'vendor': self.slide.properties.get('openslide.vendor')}
+
+    def load_overview(self):
+        """
+        Displays the overview of the slide, which is shown upscaled below the tiles until they are loaded. A cached
+        overview is displayed at once, otherwise it is loaded in the background, so opening a slide never waits for
+        it.
+        :return: /
+        """
+        self.set_overview(None)
+        overview = self.overview_cache.get(self.filepath, self.overview_size)
+        if overview is not None:
+            self.set_overview(overview)
+            return
 
-        self.zoomed = True
+        self.overview_loader = OverviewLoader(self.slide, self.filepath, self.overview_size, self.overview_cache)
+        self.overview_loader.loaded.connect(self.overview_finished)
+        self.loader_pool.start(self.overview_loader.worker)
 
+    @Slot(str, object)
+    def overview_finished(self, filepath: str, overview: np.ndarray):
+        """
+        Displays a loaded overview unless another slide has been loaded in the meantime
+        :param filepath: path of the slide of the overview
+        :type filepath: str
+        :param overview: the overview as RGBA array or None if loading failed
+        :type overview: np.ndarray
+        :return: /
+        """
+        if self.sender() is not self.overview_loader or filepath != self.filepath:
+            return
+        self.overview_loader = None
+        if overview is not None:
+            self.overview_cache.put(filepath, self.overview_size, overview)
+            self.set_overview(overview)
+
+    def set_overview(self, overview: np.ndarray):
+        """
+        Displays an overview and passes it on to the minimaps
+        :param overview: the overview as RGBA array or None to remove the overview
+        :type overview: np.ndarray
+        :return: /
+        """
+        self.overview = overview
+        if overview is None:
+            self.overview_item.setPixmap(QPixmap())
+            self.overview_downsample = 0.0
+        else:
+            self.overview_downsample = self.slide.dimensions[0] / overview.shape[1]
+            self.overview_item.setScale(self.overview_downsample)
+            self.transform_overview()
+            if self.skip_background:
+                self.scheduler.set_background(self.filepath, BackgroundMask(overview, self.slide.dimensions), self)
+        self.overviewLoaded.emit(overview)
+
+    def transform_overview(self):
+        """
+        Displays the overview with the current color transform. The transform runs in the background, the overview is
+        displayed untransformed until then. The minimaps and the background mask keep the raw overview.
+        :return: /
+        """
+        self.transform_loader = None
+        self.overview_item.setPixmap(QPixmap.fromImage(array_to_qimage(self.overview)))
+        if self.color_transform is None:
+            return
+        self.transform_loader = TransformLoader(self.overview, self.color_transform)
+        self.transform_loader.transformed.connect(self.overview_transformed)
+        self.loader_pool.start(self.transform_loader.worker)
+
+    @Slot(str, object)
+    def overview_transformed(self, transform_id: str, overview: np.ndarray):
+        """
+        Displays the overview transformed by the current TransformLoader
+        :param transform_id: id of the applied transform
+        :type transform_id: str
+        :param overview: the transformed overview or None if the transform failed
+        :type overview: np.ndarray
+        :return: /
+        """
+        if self.sender() is not self.transform_loader:
+            return
+        self.transform_loader = None
+        if overview is not None:
+            self.overview_item.setPixmap(QPixmap.fromImage(array_to_qimage(overview)))
+
+    def set_color_transform(self, transform: ColorTransform = None):
+        """
+        Changes the display transform of the tiles, e.g. for brightness and gamma adjustments or to normalize the
+        staining of slides of different scanners. Only the visible tiles are transformed again; their raw tiles are
+        usually still in the tile cache, so the slide is not read again. Results of previous transforms stay in the
+        cache, switching back is served from it.
+        :param transform: the new transform or None to display the raw tiles
+        :type transform: ColorTransform
+        :return: /
+        """
+        old_id = None if self.color_transform is None else self.color_transform.transform_id
+        new_id = None if transform is None else transform.transform_id
+        if old_id == new_id:
+            return
+        self.color_transform = transform
+        if not self.slide:
+            return
+
+        self.stale_tiles = set(self.tile_items)
+        if self.overview is not None:
+            self.transform_overview()
+        # the tiles of the current job have the previous transform, a new job requests all stale tiles of the viewport
+        self.image_job = None
+        self.finished_tiles = []
+        self.pixmap_tiles = None
         self.update_pixmap()
-        self.sendPixmap.emit(self.pixmap_item)
 
-    def update_pixmap(self):
+    def get_viewport_rect(self) -> QRectF:
         """
-        This method updated the pixmap.
-        It should only be called when the pixmap is moved or zoomed.
+        Utility method to get the area of the slide displayed in the viewport
+        :return: the viewport in slide coordinates (level 0)
+        """
+        return QRectF(self.mouse_pos, self.mouse_pos + QPointF(self.width, self.height) * self.cur_downsample)
+
+    def center_on(self, pos: QPointF):
+        """
+        Moves the viewport, so its center is at a slide position, e.g. if a minimap is clicked
+        :param pos: the new center in slide coordinates (level 0)
+        :type pos: QPointF
         :return: /
         """
-        self.width = self.frameRect().width()
-        self.height = self.frameRect().height()
+        if not self.slide:
+            return
+        self.mouse_pos = pos - QPointF(self.width, self.height) * self.cur_downsample / 2
+        self.update_pixmap()
 
-        patch_width_pix = int(self.width)
-        patch_height_pix = int(self.height)
-        patch_width_slide = int(self.get_cur_patch_width())
-        patch_height_slide = int(self.get_cur_patch_height())
+    def set_viewport(self, center: QPointF, downsample: float):
+        """
+        Moves and zooms the viewport, e.g. to follow a linked view. The downsample is limited like when zooming, and
+        the tiles of a new level are only read once the zoom settles, like when zooming with the wheel.
+        :param center: the new center in slide coordinates (level 0)
+        :type center: QPointF
+        :param downsample: the new downsample
+        :type downsample: float
+        :return: /
+        """
+        if not self.slide:
+            return
+        old_level = self.cur_level
+        self.cur_downsample = min(max(downsample, 0.3), self.max_downsample)
+        self.cur_level = self.slide.get_best_level_for_downsample(self.cur_downsample)
+        self.cur_level_zoom = self.cur_downsample / self.level_downsamples[self.cur_level]
+        self.mouse_pos = center - QPointF(self.width, self.height) * self.cur_downsample / 2
+        self.update_or_settle(old_level)
 
-        if not self.updating:
-            new_patches = self.check_for_new_patches()
+    def get_native_tile_size(self) -> int:
+        """
+        Utility method to get the tile size of the slide file, so reads align to the tiles on disk
+        :return: native tile width of the slide or 256 if the slide is not tiled
+        """
+        try:
+            return int(self.slide.properties['openslide.level[0].tile-width'])
+        except (KeyError, ValueError):
+            return 256
 
-            offset_anchor_point = self.anchor_point - QPoint(patch_width_slide, patch_height_slide)
+    def update_pixmap(self):
+        """
+        This method updated the pixmap.
+        It should only be called when the pixmap is moved or zoomed.
+        :return: /
+        """
+        if not self.slide:
+            return
 
-            if any(new_patches):
-                self.updating = True
-                self.fused_image = Image.new('RGBA', (self.width * 4, self.height * 4))
+        self.update_pixmap_geometry()
 
-                image_thread = ImageBlockWrapper(offset_anchor_point, patch_width_pix,
-                                                 patch_height_pix, patch_width_slide, patch_height_slide,
-                                                 self.sqrt_thread_count, new_patches, self, self.max_threads,
-                                                 self.slide,
-                                                 self.cur_level, self.image_patches, self.fused_image)
-                image_thread.finished.connect(self.set_pixmap)
-                image_thread.start()
+        center = self.mouse_pos + QPointF(self.width, self.height) * self.cur_downsample / 2
+        level = self.cur_level
+        if self.adaptive_quality is not None:
+            self.adaptive_quality.track(center, self.cur_downsample, self.width, self.height)
+            offset = self.adaptive_quality.level_offset()
+            if offset:
+                level = min(self.cur_level + offset, self.slide.level_count - 1)
+                self.refine_timer.start()  # reads the full level once the motion stops
 
-    def check_for_new_patches(self) -> list[bool]:
+        tile_range = self.get_tile_range(level)
+        if self.image_job:
+            outdated = tile_range != self.image_job.tile_range or level != self.image_job.level
+        else:
+            outdated = tile_range != self.pixmap_tiles or level != self.pixmap_level
+
+        if outdated:
+            # a new generation cancels the queued reads of the previous job which are not visible anymore
+            generation = self.scheduler.next_generation()
+            missing_tiles = [(col, row) for row in range(tile_range[1], tile_range[3] + 1)
+                             for col in range(tile_range[0], tile_range[2] + 1)
+                             if (level, col, row) not in self.tile_items or (level, col, row) in self.stale_tiles]
+            self.updating = True
+            self.image_job = ImageBlockWrapper(tile_range, missing_tiles, self.tile_size, self.slide, level,
+                                               self.filepath, generation, self.adaptive_quality, self.color_transform,
+                                               self.uniform_tolerance)
+            self.image_job.tileFinished.connect(self.add_tile)
+            self.image_job.finished.connect(self.set_pixmap)
+            self.finished_tiles = []
+            self.image_job.start(self.scheduler, self.get_tile_range(level, margin=0), center, self)
+            self.scheduler.cancel_obsolete(generation, self)
+            if level != self.cur_level and self.metrics is not None:
+                self.metrics.count('coarse_jobs')
+
+        # the prefetched tiles of cur_level would not be displayed before the motion stops
+        if self.prefetch_enabled and level == self.cur_level:
+            self.prefetcher.prefetch(self)
+
+        self.viewportChanged.emit()
+
+    def get_tile_range(self, level: int = None, mouse_pos: QPointF = None, downsample: float = None,
+                       margin: int = None) -> tuple:
+        """
+        Calculates the tiles of a level which are needed to display the viewport. Only the grid of tiles depends on
+        the viewport, the tiles themselves have a fixed size.
+        :param level: level of the tiles, defaults to the current level
+        :type level: int
+        :param mouse_pos: upper left corner of the viewport in slide coordinates, defaults to the current one
+        :type mouse_pos: QPointF
+        :param downsample: downsample of the viewport, defaults to the current one
+        :type downsample: float
+        :param margin: number of tiles added on each side, defaults to the tile margin
+        :type margin: int
+        :return: first and last column and row (first_col, first_row, last_col, last_row) of the visible tiles
         """
-        This method checks if new patches need to be loaded
-        :return: A list of booleans
+        level = self.cur_level if level is None else level
+        mouse_pos = self.mouse_pos if mouse_pos is None else mouse_pos
+        downsample = self.cur_downsample if downsample is None else downsample
+        margin = self.tile_margin if margin is None else margin
+        tile_size_slide = self.tile_size * self.level_downsamples[level]
+        level_width, level_height = self.slide.level_dimensions[level]
+
+        first_col = int(mouse_pos.x() // tile_size_slide) - margin
+        first_row = int(mouse_pos.y() // tile_size_slide) - margin
+        last_col = int((mouse_pos.x() + self.width * downsample) // tile_size_slide) + margin
+        last_row = int((mouse_pos.y() + self.height * downsample) // tile_size_slide) + margin
+
+        return (max(first_col, 0), max(first_row, 0),
+                min(last_col, (level_width - 1) // self.tile_size), min(last_row, (level_height - 1) // self.tile_size))
+
+    def update_pixmap_geometry(self):
         """
-        if self.zoomed:
-            self.zoomed = False
-            return [True for _ in range(self.max_threads)]
+        Places the tile items according to the current position and zoom. Only the pixmap_item is moved and scaled,
+        the tiles keep their level and are displayed correctly until the tiles of the current level are loaded.
+        :return: /
+        """
+        self.pixmap_item.setPos(-self.mouse_pos / self.cur_downsample)
+        self.pixmap_item.setScale(1 / self.cur_downsample)
 
+    def add_tile_item(self, level: int, col: int, row: int, tile):
+        """
+        Displays a tile as item of its own. Uniform tiles are displayed as filled rectangles without any upload. Hidden
+        items are reused.
+        :param level: level of the tile
+        :type level: int
+        :param col: column of the tile in the tile grid of the level
+        :type col: int
+        :param row: row of the tile in the tile grid of the level
+        :type row: int
+        :param tile: the tile as RGBA array or UniformTile
+        :type tile: np.ndarray
+        :return: /
+        """
+        uniform = isinstance(tile, UniformTile)
+        item_type = QGraphicsRectItem if uniform else QGraphicsPixmapItem
+        item = self.tile_items.get((level, col, row))
+        if item is not None and not isinstance(item, item_type):
+            self.remove_tile_items(lambda key: key == (level, col, row))
+            item = None
+        if item is None:
+            spare_items = self.spare_rect_items if uniform else self.spare_items
+            item = spare_items.pop() if spare_items else item_type(self.pixmap_item)
+            self.tile_items[(level, col, row)] = item
+        self.stale_tiles.discard((level, col, row))
+
+        downsample = self.level_downsamples[level]
+        if uniform:
+            item.setRect(0, 0, tile.shape[1], tile.shape[0])
+            item.setBrush(QColor(*tile.color.tolist()))
+            item.setPen(Qt.PenStyle.NoPen)
         else:
-            grid_width = self.get_cur_patch_width()
-            grid_height = self.get_cur_patch_height()
-
-            int_mouse_pos = self.mouse_pos.toPoint()
-
-            new_patches = [False for _ in range(self.max_threads)]
-
-            while int_mouse_pos.x() > self.anchor_point.x() + grid_width:
-                new_patches[3] = True
-                new_patches[7] = True
-                new_patches[11] = True
-                new_patches[15] = True
-                self.image_patches = self.efficient_roll(self.image_patches, -1, axis=0)
-                self.anchor_point += QPoint(grid_width, 0)
-                self.pixmap_compensation.setX(self.pixmap_compensation.x() + self.get_cur_zoomed_patch_width())
-
-            while int_mouse_pos.x() < self.anchor_point.x():
-                new_patches[0] = True
-                new_patches[4] = True
-                new_patches[8] = True
-                new_patches[12] = True
-                self.image_patches = self.efficient_roll(self.image_patches, 1, axis=0)
-                self.anchor_point -= QPoint(grid_width, 0)
-                self.pixmap_compensation.setX(self.pixmap_compensation.x() - self.get_cur_zoomed_patch_width())
-
-            while int_mouse_pos.y() > self.anchor_point.y() + grid_height:
-                new_patches[12] = True
-                new_patches[13] = True
-                new_patches[14] = True
-                new_patches[15] = True
-                self.image_patches = self.efficient_roll(self.image_patches, -1, axis=1)
-                self.anchor_point += QPoint(0, grid_height)
-                self.pixmap_compensation.setY(self.pixmap_compensation.y() + self.get_cur_zoomed_patch_height())
-
-            while int_mouse_pos.y() < self.anchor_point.y():
-                new_patches[0] = True
-                new_patches[1] = True
-                new_patches[2] = True
-                new_patches[3] = True
-                self.image_patches = self.efficient_roll(self.image_patches, 1, axis=1)
-                self.anchor_point -= QPoint(0, grid_height)
-                self.pixmap_compensation.setY(self.pixmap_compensation.y() - self.get_cur_zoomed_patch_height())
-
-        return new_patches
-
-    @staticmethod
-    def efficient_roll(arr, direction, axis):
-        width, height = arr.shape[:2]
-        if axis == 0:
-            if direction == -1:
-                return np.concatenate((arr[1:width], arr[0:1]), axis=0)
-            if direction == 1:
-                return np.concatenate((arr[width - 1:width], arr[:width - 1]), axis=0)
-        if axis == 1:
-            if direction == -1:
-                return np.concatenate((arr[:, 1:height], arr[:, 0:1]), axis=1)
-            if direction == 1:
-                debug = np.concatenate((arr[:, height - 1:height], arr[:, :height - 1]), axis=1)
-                return debug
-        return Exception(f'An incorrect axis: {axis} or an incorrect direction: {direction} was chosen!')
+            start = time.perf_counter()
+            item.setPixmap(QPixmap.fromImage(array_to_qimage(tile)))
+            if self.metrics is not None:
+                self.metrics.record('pixmap_upload', time.perf_counter() - start)
+        item.setPos(col * self.tile_size * downsample, row * self.tile_size * downsample)
+        item.setScale(downsample)
+        item.setZValue(-level)  # finer levels are displayed above coarser ones
+        item.show()
+
+    def remove_tile_items(self, condition):
+        """
+        Hides the tile items whose key fulfills the condition and keeps them for reuse
+        :param condition: function of the key (level, col, row) of the tile
+        :return: /
+        """
+        for key in [key for key in self.tile_items if condition(key)]:
+            item = self.tile_items.pop(key)
+            self.stale_tiles.discard(key)
+            item.hide()
+            if isinstance(item, QGraphicsRectItem):
+                self.spare_rect_items.append(item)
+            else:
+                item.setPixmap(QPixmap())
+                self.spare_items.append(item)
+
+    def add_overlay(self, item: QGraphicsItem) -> QGraphicsItem:
+        """
+        Displays an item above the tiles, e.g. an AnnotationLayer. The item is a child of the pixmap_item, so its
+        coordinates are slide coordinates (level 0) and it follows panning and zooming. Remove it with
+        remove_overlay.
+        :param item: the overlay
+        :type item: QGraphicsItem
+        :return: the overlay
+        """
+        item.setParentItem(self.pixmap_item)
+        if item.zValue() <= 0:
+            item.setZValue(1)
+        return item
+
+    def remove_overlay(self, item: QGraphicsItem):
+        """
+        Removes an overlay added with add_overlay or add_heatmap
+        :param item: the overlay
+        :type item: QGraphicsItem
+        :return: /
+        """
+        if item.scene() is not None:
+            item.scene().removeItem(item)
+        item.setParentItem(None)
+        connection = self.overlay_connections.pop(item, None)
+        if connection is not None:
+            self.viewportChanged.disconnect(connection)
+        self.scheduler.cancel_all(item)
+
+    def add_heatmap(self, data, downsample: float = None, colormap='viridis', value_range: tuple = (0.0, 1.0),
+                    threshold: float = None, opacity: float = 0.5, reduction: str = 'mean') -> HeatmapLayer:
+        """
+        Displays a heatmap above the tiles of the current slide, e.g. the tumor probabilities of a model. The heatmap
+        is read like the slide: tile by tile on the tile grid of the view, by the reading threads and into the tile
+        cache, so neither the whole heatmap nor its colormapped image have to be in memory. Remove it with
+        remove_overlay before another slide is loaded.
+        :param data: 2D array or memory map of the values, or the path of a .npy file, which is memory-mapped
+        :param downsample: slide pixels (level 0) per heatmap pixel, defaults to the ratio of the widths of the slide
+                           and the heatmap
+        :type downsample: float
+        :param colormap: name of a colormap of heatmap_layer.COLORMAPS or an array of RGB(A) colors
+        :param value_range: values mapped to the first and the last color of the colormap
+        :type value_range: tuple
+        :param threshold: values below the threshold are transparent, None displays all values
+        :type threshold: float
+        :param opacity: opacity of the heatmap, change it with layer.setOpacity
+        :type opacity: float
+        :param reduction: 'mean' or 'max' of the values in coarser levels, see HeatmapSource
+        :type reduction: str
+        :return: the layer, whose colors can be changed with set_colormap
+        """
+        layer = HeatmapLayer(self, data, downsample, colormap, value_range, threshold, reduction)
+        layer.setOpacity(opacity)
+        self.add_overlay(layer)
+        self.overlay_connections[layer] = self.viewportChanged.connect(layer.update_tiles)
+        layer.update_tiles()
+        return layer
 
     def setAnnotationMode(self, b: bool):
         self.annotationMode = b
 
     def resizeEvent(self, event: QResizeEvent) -> None:
         """
-        Updates the pixmap of the widget is resized
+        Updates the pixmap of the widget is resized. Only the tiles exposed by the resize have to be read.
         :param event: event to initialize the function
         :return: /
         """
+        super().resizeEvent(event)
+        self.width = self.frameRect().width()
+        self.height = self.frameRect().height()
         if self.slide:
-            self.zoomed = True
+            self.setSceneRect(QRectF(0, 0, self.width, self.height))
             self.update_pixmap()
 
     @Slot(QWheelEvent)
@@ -251,55 +811,77 @@ class SlideView(QGraphicsView):
         :type event: QWheelEvent
         :return: /
         """
-        if not self.zoom_finished:
+        if not self.slide:
+            return
+
+        # one step per notch, high-resolution wheels and touchpads send fractions of a step
+        steps = event.angleDelta().y() / 120
+        if not steps:
             return
+        self.zoom_factor *= 1.1 ** -steps
+        self.zoom_anchor = event.position()
 
-        old_downsample = self.cur_downsample
+        if self.zoom_timer.isActive():
+            if self.metrics is not None:
+                self.metrics.count('coalesced_wheel_events')
+        else:
+            self.apply_zoom()
 
-        old_mouse = self.get_mouse_vp(event)
-        mouse_vp = event.position()
+    def apply_zoom(self):
+        """
+        Applies the accumulated wheel events and keeps the slide position below the mouse fixed. Tiles are only read if
+        the level of the displayed tiles is kept, otherwise the displayed tiles are scaled until the zoom settles.
+        :return: /
+        """
+        if self.zoom_factor == 1.0 or not self.slide:
+            return
 
-        scale_factor = 1.1 if event.angleDelta().y() <= 0 else 1 / 1.1
-        new_downsample = min(max(self.cur_downsample * scale_factor, 0.3), self.max_downsample)
+        old_downsample, old_level = self.cur_downsample, self.cur_level
+        new_downsample = min(max(self.cur_downsample * self.zoom_factor, 0.3), self.max_downsample)
+        self.zoom_factor = 1.0
 
         if new_downsample == old_downsample:
+            if self.metrics is not None:
+                self.metrics.count('dropped_wheel_events')
             return
+        self.zoom_timer.start()  # wheel events until the next frame are coalesced
 
-        if self.cur_level != self.slide.get_best_level_for_downsample(new_downsample):
-            self.zoomed = True
+        self.prefetcher.track_zoom(new_downsample < old_downsample, self.zoom_anchor)
+
+        self.mouse_pos += self.zoom_anchor * (old_downsample - new_downsample)
 
         self.cur_downsample = new_downsample
+        self.cur_level = self.slide.get_best_level_for_downsample(self.cur_downsample)
         self.cur_level_zoom = self.cur_downsample / self.level_downsamples[self.cur_level]
-        old_level_zoom = self.cur_level_zoom
-
-        self.mouse_pos += mouse_vp * old_downsample * (1 - scale_factor)
-
-        self.pixmap_item.setScale(1 / self.cur_level_zoom)
-
-        if self.zoomed:
-            # TODO: This is still dependent on calling the mouse pos twice. This could be fixed by directly calculating
-            #  the necessary vector. But I do not know how to calculate this vector.
-            self.cur_level = self.slide.get_best_level_for_downsample(self.cur_downsample)
-            self.cur_level_zoom = self.cur_downsample / self.level_downsamples[self.cur_level]
-            self.anchor_point = self.mouse_pos.toPoint()
-            tmp_pos = self.pixmap_item.pos()
-            self.pixmap_compensation += QPointF(-tmp_pos.x()-self.width / self.cur_level_zoom, -tmp_pos.y()-self.height / self.cur_level_zoom)
-            older_mouse = self.get_mouse_vp(event)
-            new_mouse = self.get_mouse_vp(event)
-            pix_move = (new_mouse - older_mouse) / self.cur_level_zoom
-            self.pixmap_compensation += pix_move
-            pix_move = old_mouse * (1 - scale_factor) / old_level_zoom
-
-            self.pixmap_item.moveBy(-pix_move.x(), -pix_move.y())
-            self.pixmap_compensation += pix_move
-            self.zoom_finished = False
 
-        else:
-            pix_move = old_mouse * (1 - scale_factor) / old_level_zoom
+        self.update_or_settle(old_level)
 
-            self.pixmap_item.moveBy(-pix_move.x(), -pix_move.y())
+    def update_or_settle(self, old_level: int):
+        """
+        Updates the view after a zoom. If the level of the displayed tiles is kept, the tiles are read at once.
+        Otherwise, the displayed tiles are scaled and the tiles of the new level are read once the zoom stayed on it
+        for zoom_settle_ms.
+        :param old_level: level before the zoom
+        :type old_level: int
+        :return: /
+        """
+        displayed_level = self.image_job.level if self.image_job else self.pixmap_level
+        if self.cur_level == displayed_level:
+            self.settle_timer.stop()
+            self.update_pixmap()
+        else:
+            # the settle time starts when the zoom enters a level, zooming within the level does not delay the reads
+            if not self.settle_timer.isActive() or self.cur_level != old_level:
+                self.settle_timer.start()
+            self.update_pixmap_geometry()
+            self.viewportChanged.emit()
 
-        self.update_pixmap()
+    def is_zooming(self) -> bool:
+        """
+        Utility method to check for wheel events that are not applied or a level that did not settle yet
+        :return: True while zooming
+        """
+        return self.zoom_timer.isActive() or self.settle_timer.isActive()
 
     @Slot(QMouseEvent)
     def mousePressEvent(self, event: QMouseEvent):
@@ -324,6 +906,7 @@ class SlideView(QGraphicsView):
         """
         if event.button() == Qt.MouseButton.LeftButton and not self.annotationMode:
             self.panning = False
+            self.prefetcher.stop_pan()
         super().mouseReleaseEvent(event)
 
     @Slot(QMouseEvent)
@@ -337,153 +920,167 @@ class SlideView(QGraphicsView):
         if self.panning and not self.annotationMode:
             new_pos = self.mapToScene(event.pos())
             move = self.pan_start - new_pos
-            self.pixmap_item.moveBy(-move.x(), -move.y())
             self.pan_start = new_pos
 
-            move = QPointF(move.x() * self.cur_downsample,
-                           move.y() * self.cur_downsample)
-            self.mouse_pos += move
+            self.mouse_pos += move * self.cur_downsample
+            self.prefetcher.track_pan(move * self.cur_downsample)
             self.update_pixmap()
         super().mouseMoveEvent(event)
 
-    def get_cur_zoomed_patch_width(self):
+    @Slot(int, int, object)
+    def add_tile(self, col: int, row: int, tile: np.ndarray):
         """
-        Utility method to calculate the current width of a patch relative to the zoom
-        :return: zoomed patch width
+        Collects a finished tile of the current job. In progressive mode, the tiles are displayed with the next frame.
+        :param col: column of the tile in the tile grid of the level
+        :type col: int
+        :param row: row of the tile in the tile grid of the level
+        :type row: int
+        :param tile: the tile as RGBA array
+        :type tile: np.ndarray
+        :return: /
         """
-        return self.width / self.cur_level_zoom
+        if self.image_job is None or self.sender() is not self.image_job:
+            if self.metrics is not None:
+                self.metrics.count('dropped_tiles')
+            return
 
-    def get_cur_zoomed_patch_height(self):
-        """
-        Utility method to calculate the current height of a patch relative to the zoom
-        :return: zoomed patch height
-        """
-        return self.height / self.cur_level_zoom
+        self.finished_tiles.append((self.image_job.level, col, row, tile))
+        if self.progressive and not self.paint_timer.isActive():
+            self.paint_timer.start()
 
-    def get_cur_patch_width(self):
+    @Slot()
+    def paint_tiles(self):
         """
-        Utility method to calculate the current width of a patch given by the current level
-        :return: zoomed patch width
+        Displays all collected tiles. Each tile is wrapped as QImage without copying and uploaded once.
+        :return: /
         """
-        return int(self.width * self.level_downsamples[self.cur_level])
+        for level, col, row, tile in self.finished_tiles:
+            self.add_tile_item(level, col, row, tile)
+        self.finished_tiles = []
 
-    def get_cur_patch_height(self):
+    @Slot()
+    def set_pixmap(self):
         """
-        Utility method to calculate the current height of a patch given by the current level
-        :return: zoomed patch height
+        Finishes the current ImageBlockWrapper once all of its tiles are read. The tiles of the job now cover the
+        viewport, so the items of other levels and of tiles outside the tile range are removed. Results of replaced
+        jobs are ignored.
+        :return: /
         """
-        return int(self.height * self.level_downsamples[self.cur_level])
+        if self.image_job is None or self.sender() is not self.image_job:
+            return  # the sender is None if a replaced job was deleted before its queued signal arrived
 
-    def get_mouse_vp(self, event):
-        """
-        This method calculates the mouse position in the viewport relative to the position of the QPixmapItem during an
-        event
-        :return: mouse pos in viewport during event
-        """
-        top_left = - self.pixmap_item.pos()
-        mouse_pos = event.position()
-        return (top_left + mouse_pos) * self.cur_level_zoom
+        self.paint_timer.stop()
+        self.paint_tiles()
+
+        if self.metrics is not None:
+            self.metrics.record('viewport_complete', time.perf_counter() - self.image_job.start_time)
 
-    @Slot(QPixmap)
-    def set_pixmap(self, result):
-        self.pixmap_item.setPixmap(result)
-        self.pixmap_item.setScale(1 / self.cur_level_zoom)
-        self.pixmap_item.moveBy(self.pixmap_compensation.x(), self.pixmap_compensation.y())
-        self.pixmap_compensation = QPointF(0, 0)
+        level, tile_range = self.image_job.level, self.image_job.tile_range
+        self.remove_tile_items(lambda key: key[0] != level or not (tile_range[0] <= key[1] <= tile_range[2] and
+                                                                   tile_range[1] <= key[2] <= tile_range[3]))
+        self.pixmap_level = level
+        self.pixmap_tiles = tile_range
+        self.image_job = None
         self.updating = False
-        self.zoom_finished = True
-
-
-class ImageBlockWrapper(QThread):
-    finished = Signal(QPixmap)
-
-    def __init__(self, offset_anchor_point, block_width, block_height,
-                 block_width_slide, block_height_slide, sqrt_threads, generate_new, parent, max_threads, slide,
-                 cur_level, image_patches, fused_image):
-        super().__init__(parent)
-        self.offset_anchor_point = offset_anchor_point
-        self.block_width = block_width
-        self.block_height = block_height
-        self.block_width_slide = block_width_slide
-        self.block_height_slide = block_height_slide
-        self.sqrt_threads = sqrt_threads
-        self.generate_new = generate_new
-        self.max_threads = max_threads
+
+
+class ImageBlockWrapper(QObject):
+    tileFinished = Signal(int, int, object)
+    finished = Signal()
+
+    def __init__(self, tile_range, tiles, tile_size, slide, level, slide_id, generation, quality=None,
+                 transform=None, uniform_tolerance=0):
+        """
+        Initialization of the ImageBlockWrapper, which loads the missing tiles of a tile range
+        :param tile_range: first and last column and row (first_col, first_row, last_col, last_row) of the tiles
+        :type tile_range: tuple
+        :param tiles: (col, row) of the tiles of the range that are not displayed yet
+        :type tiles: list
+        :param tile_size: edge length of the tiles in pixels of their level
+        :type tile_size: int
+        :param slide: the slide to read from
+        :type slide: PooledSlide
+        :param level: level of the tiles
+        :type level: int
+        :param slide_id: identifier of the slide in the cache
+        :param generation: generation of the tile requests of this job
+        :type generation: int
+        :param quality: adaptive quality of the view, which is informed of the read latencies
+        :type quality: AdaptiveQuality
+        :param transform: color transform applied to the tiles
+        :type transform: ColorTransform
+        :param uniform_tolerance: tolerance of the detection of uniform tiles, see TileScheduler.request
+        :type uniform_tolerance: int
+        """
+        super().__init__()
+        self.tile_range = tile_range
+        self.tile_size = tile_size
         self.slide = slide
-        self.cur_level = cur_level
-        self.image_patches = image_patches
-        self.fused_image = fused_image
+        self.level = level
+        self.slide_id = slide_id
+        self.generation = generation
+        self.quality = quality
+        self.transform = transform
+        self.uniform_tolerance = uniform_tolerance
+        self.start_time = time.perf_counter()
 
-    def run(self):
-        thread_list = [ImageBlockWorker(i, self.offset_anchor_point, self.block_width,
-                                        self.block_height, self.block_width_slide, self.block_height_slide,
-                                        self.sqrt_threads, self.generate_new[i], self.slide, self.cur_level,
-                                        self.image_patches, self.fused_image) for i in
-                       range(self.max_threads)]
-        [thread.start() for thread in thread_list]
-        [thread.wait() for thread in thread_list]
+        self.tiles = tiles
 
-        pixmap = QPixmap.fromImage(ImageQt(self.fused_image))
-        self.finished.emit(pixmap)
+        self.mutex = QMutex()
+        self.pending_blocks = len(self.tiles)
 
+    def start(self, scheduler: TileScheduler, visible_range: tuple, center: QPointF, owner=None):
+        """
+        Requests all tiles from the scheduler. Tiles inside the viewport are requested before the margin tiles, both
+        ordered from the center of the viewport outwards.
+        :param scheduler: the tile scheduler of the SlideView
+        :type scheduler: TileScheduler
+        :param visible_range: tile range of the viewport without margin
+        :type visible_range: tuple
+        :param center: center of the viewport in slide coordinates
+        :type center: QPointF
+        :param owner: the view the tiles are requested for
+        :return: /
+        """
+        if not self.tiles:
+            self.finished.emit()
+            return
 
-class ImageBlockWorker(QThread):
-    finished = Signal(QPainter)
+        tile_size_slide = self.tile_size * self.slide.level_downsamples[self.level]
+        center_col = center.x() / tile_size_slide - 0.5
+        center_row = center.y() / tile_size_slide - 0.5
 
-    def __init__(self, block_index, offset_anchor_point, block_width, block_height,
-                 block_width_slide, block_height_slide, sqrt_threads, generate_new, slide, cur_level, image_patches,
-                 fused_image):
-        super().__init__()
-        self.block_index = block_index
-        self.offset_anchor_point = offset_anchor_point
-        self.block_width = block_width
-        self.block_height = block_height
-        self.block_width_slide = block_width_slide
-        self.block_height_slide = block_height_slide
-        self.sqrt_threads = sqrt_threads
-        self.generate_new = generate_new
-        self.slide = slide
-        self.cur_level = cur_level
-        self.image_patches = image_patches
-        self.fused_image = fused_image
-
-    def run(self):
-        self.process_image_block(self.block_index, self.offset_anchor_point, self.block_width,
-                                 self.block_height, self.block_width_slide, self.block_height_slide,
-                                 self.sqrt_threads, self.generate_new)
-
-    def process_image_block(self, block_index: int, offset_anchor_point: QPointF, block_width: int, block_height: int,
-                            block_width_slide: int, block_height_slide: int, sqrt_threads: int, generate_new: bool):
-        """
-        This method processes each block of the image.
-        The number of blocks is determined by the max number of threads.
-
-        :param block_index: The index of the block processed by the thread
-        :param offset_anchor_point: The offset anchor point gives the upper left corner of the pixmap
-        :param block_width: Describes the width of the current block in viewport coordinates
-        :param block_height: Describes the height of the current block in viewport coordinates
-        :param block_width_slide: Describes the width of the current block in slide coordinates
-        :param block_height_slide: Describes the height of the current block in slide coordinates
-        :param sqrt_threads: The square root of max threads, since the image is a rectangle
-        :param generate_new: This is a boolean that checks if the current patch should be newly generated
-        :return: /
-        """
-        idx_width = block_index % sqrt_threads
-        idx_height = block_index // sqrt_threads
-
-        block_location = (
-            idx_width * block_width_slide,
-            idx_height * block_height_slide
-        )
-
-        if generate_new:
-            image = self.slide.read_region(
-                (int(offset_anchor_point.x() + block_location[0]), int(offset_anchor_point.y() + block_location[1])),
-                self.cur_level,
-                (block_width, block_height)
-            )
-
-            self.image_patches[idx_width, idx_height] = image
-
-        self.fused_image.paste(self.image_patches[idx_width, idx_height],
-                               (idx_width * block_width, idx_height * block_height))
+        for col, row in self.tiles:
+            visible = visible_range[0] <= col <= visible_range[2] and visible_range[1] <= row <= visible_range[3]
+            scheduler.request(TileCache.key(self.slide_id, self.level, col, row), self.slide, self.tile_size,
+                              TileScheduler.VISIBLE if visible else TileScheduler.MARGIN,
+                              (col - center_col) ** 2 + (row - center_row) ** 2, self.process_image_block,
+                              self.generation, owner, self.transform, self.uniform_tolerance)
+
+    def process_image_block(self, request: TileRequest, tile: np.ndarray):
+        """
+        This method is called by the scheduler once a tile is read. It emits the tile, the last tile also emits that
+        the job is finished.
+
+        :param request: the finished request of the tile
+        :type request: TileRequest
+        :param tile: the tile as RGBA array or None if reading failed
+        :type tile: np.ndarray
+        :return: /
+        """
+        col, row = request.key[2:4]
+        if self.quality is not None:
+            self.quality.record_latency(time.perf_counter() - request.queued_time)
+        try:
+            if tile is not None:
+                # the array is emitted instead of a QImage sharing its memory, see array_to_qimage
+                self.tileFinished.emit(col, row, tile)
+
+            with QMutexLocker(self.mutex):
+                self.pending_blocks -= 1
+                all_finished = self.pending_blocks == 0
+
+            if all_finished:
+                self.finished.emit()
+        except RuntimeError:  # the job is deleted if the application quits while reading
+            pass
@@ -0,0 +1,252 @@
+from collections import OrderedDict
+from PySide6.QtCore import QMutex, QMutexLocker
+from PIL import Image
+import numpy as np
+import time
+from .image_conversion import tile_to_array
+
+
+class UniformTile:
+    """
+    A tile of a single color, e.g. of blank glass. It is cached as color and size instead of a pixel buffer and
+    displayed as filled rectangle.
+    """
+    nbytes = 64  # rough memory footprint
+
+    def __init__(self, color: np.ndarray, shape: tuple):
+        """
+        Initialization of the UniformTile
+        :param color: RGBA color of the tile
+        :type color: np.ndarray
+        :param shape: shape (height, width, 4) of the tile
+        :type shape: tuple
+        """
+        self.color = color
+        self.shape = shape
+
+    def to_array(self) -> np.ndarray:
+        """
+        Expands the tile without allocating its pixels
+        :return: read-only RGBA array of the shape of the tile
+        """
+        return np.broadcast_to(self.color, self.shape)
+
+
+def uniform_color(tile: np.ndarray, tolerance: int = 0):
+    """
+    Checks whether a tile has a single color, e.g. blank glass with some noise. A sparse sample of the pixels rejects
+    most tissue tiles before all pixels are checked.
+    :param tile: RGBA array of the tile
+    :type tile: np.ndarray
+    :param tolerance: largest difference of each channel within the tile
+    :type tolerance: int
+    :return: the RGBA color of the tile or None if it is not uniform
+    """
+    for pixels in (tile[::16, ::16], tile):
+        pixels = pixels.reshape(-1, 4)
+        low, high = pixels.min(axis=0), pixels.max(axis=0)
+        if (high.astype(np.int16) - low).max() > tolerance:
+            return None
+    return ((low.astype(np.uint16) + high) // 2).astype(np.uint8)
+
+
+def tile_nbytes(tile) -> int:
+    """
+    Estimates the memory footprint of a cached tile
+    :param tile: the cached tile
+    :type tile: np.ndarray or Image.Image
+    :return: size of the tile in bytes
+    """
+    if isinstance(tile, Image.Image):
+        return tile.width * tile.height * len(tile.getbands())
+    return getattr(tile, 'nbytes', 0)
+
+
+class TileCache:
+    """
+    Thread-safe least-recently-used cache for slide tiles. Tiles are aligned to a fixed grid per pyramid level and
+    stored under the key (slide, level, tile column, tile row). If the memory budget is exceeded, the least recently
+    used tiles are evicted.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 ** 2):
+        """
+        Initialization of the TileCache
+        :param max_bytes: memory budget of the cache in bytes
+        :type max_bytes: int
+        """
+        self.max_bytes = max_bytes
+        self.cur_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        self.tiles = OrderedDict()  # key -> (tile, size in bytes), ordered from least to most recently used
+        self.mutex = QMutex()
+
+    @staticmethod
+    def key(slide_id, level: int, col: int, row: int) -> tuple:
+        """
+        Creates the key of a tile
+        :param slide_id: identifier of the slide, e.g. the file path
+        :param level: pyramid level of the tile
+        :param col: column of the tile in the tile grid of the level
+        :param row: row of the tile in the tile grid of the level
+        :return: the key of the tile
+        """
+        return slide_id, level, col, row
+
+    def get(self, key: tuple):
+        """
+        Returns a cached tile and marks it as most recently used
+        :param key: key of the tile
+        :type key: tuple
+        :return: the tile or None if it is not cached
+        """
+        with QMutexLocker(self.mutex):
+            entry = self.tiles.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.tiles.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key: tuple):
+        """
+        Returns a cached tile without marking it as recently used, e.g. for bulk reads that should not displace the
+        tiles of a view
+        :param key: key of the tile
+        :type key: tuple
+        :return: the tile or None if it is not cached
+        """
+        with QMutexLocker(self.mutex):
+            entry = self.tiles.get(key)
+            return None if entry is None else entry[0]
+
+    def put(self, key: tuple, tile, nbytes: int = None):
+        """
+        Stores a tile and evicts the least recently used tiles until the memory budget is met
+        :param key: key of the tile
+        :type key: tuple
+        :param tile: the tile
+        :param nbytes: size of the tile in bytes, estimated from the tile if not given
+        :type nbytes: int
+        :return: /
+        """
+        nbytes = tile_nbytes(tile) if nbytes is None else nbytes
+        if nbytes > self.max_bytes:
+            return
+
+        with QMutexLocker(self.mutex):
+            old_entry = self.tiles.pop(key, None)
+            if old_entry is not None:
+                self.cur_bytes -= old_entry[1]
+            self.tiles[key] = (tile, nbytes)
+            self.cur_bytes += nbytes
+            while self.cur_bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self.tiles.popitem(last=False)
+                self.cur_bytes -= evicted_bytes
+
+    def __contains__(self, key: tuple) -> bool:
+        with QMutexLocker(self.mutex):
+            return key in self.tiles
+
+    def __len__(self) -> int:
+        with QMutexLocker(self.mutex):
+            return len(self.tiles)
+
+    def remove_slide(self, slide_id):
+        """
+        Removes all tiles of a slide
+        :param slide_id: identifier of the slide
+        :return: /
+        """
+        with QMutexLocker(self.mutex):
+            for key in [key for key in self.tiles if key[0] == slide_id]:
+                self.cur_bytes -= self.tiles.pop(key)[1]
+
+    def clear(self):
+        """
+        Removes all tiles
+        :return: /
+        """
+        with QMutexLocker(self.mutex):
+            self.tiles.clear()
+            self.cur_bytes = 0
+
+
+def read_tile(slide, slide_id, tile_cache: TileCache, level: int, col: int, row: int, tile_size: int,
+              disk_cache=None, metrics=None, uniform_tolerance: int = None, background=None):
+    """
+    Returns a tile of the fixed tile grid of a level. The tile is taken from the tile cache or the disk cache if
+    possible and only read from the slide (and cached) otherwise. Tiles at the border of the slide are cropped to the
+    slide. Tiles are cached as read-only RGBA arrays, so a cache hit does not need any conversion. Uniform tiles are
+    cached as UniformTile.
+    :param slide: the slide to read from
+    :type slide: SlideBackend
+    :param slide_id: identifier of the slide in the cache
+    :param tile_cache: the cache of the tiles
+    :type tile_cache: TileCache
+    :param level: level of the tile
+    :type level: int
+    :param col: column of the tile in the tile grid of the level
+    :type col: int
+    :param row: row of the tile in the tile grid of the level
+    :type row: int
+    :param tile_size: edge length of the tiles in pixels of their level
+    :type tile_size: int
+    :param disk_cache: optional persistent cache, which is checked before reading from the slide
+    :type disk_cache: DiskTileCache
+    :param metrics: optional instrumentation, which records the durations of the disk reads, slide reads and
+                    conversions
+    :type metrics: ViewMetrics
+    :param uniform_tolerance: largest difference of each channel within a tile that is cached as UniformTile, None
+                              disables the detection of uniform tiles
+    :type uniform_tolerance: int
+    :param background: optional background mask of the slide; tiles it predicts as background are not read at all
+    :type background: BackgroundMask
+    :return: the tile as RGBA array of shape (height, width, 4) or as UniformTile
+    """
+    key = TileCache.key(slide_id, level, col, row)
+    tile = tile_cache.get(key)
+    if tile is not None:
+        return tile
+
+    downsample = slide.level_downsamples[level]
+    level_width, level_height = slide.level_dimensions[level]
+    width, height = min(tile_size, level_width - col * tile_size), min(tile_size, level_height - row * tile_size)
+    location = (int(col * tile_size * downsample), int(row * tile_size * downsample))
+
+    if background is not None:
+        color = background.color(location[0], location[1], width * downsample, height * downsample)
+        if color is not None:
+            tile = UniformTile(color, (height, width, 4))
+            tile_cache.put(key, tile)
+            if metrics is not None:
+                metrics.count('skipped_background_reads')
+            return tile
+
+    if disk_cache is not None:
+        start = time.perf_counter()
+        tile = disk_cache.get(slide_id, level, tile_size, col, row)
+        if tile is not None and metrics is not None:
+            metrics.record('disk_read', time.perf_counter() - start)
+    if tile is None:
+        start = time.perf_counter()
+        region = slide.read_region(location, level, (width, height))
+        read = time.perf_counter()
+        tile = tile_to_array(region)
+        if metrics is not None:
+            metrics.record('read_region', read - start)
+            metrics.record('tile_conversion', time.perf_counter() - read)
+        if disk_cache is not None:
+            disk_cache.put(slide_id, level, tile_size, col, row, tile)
+
+    if uniform_tolerance is not None:
+        color = uniform_color(tile, uniform_tolerance)
+        if color is not None:
+            tile = UniformTile(color, tile.shape)
+            if metrics is not None:
+                metrics.count('uniform_tiles')
+    tile_cache.put(key, tile)
+    return tile
@@ -0,0 +1,178 @@
+import time
+from PySide6.QtCore import QPointF
+from .tile_cache import TileCache
+from .tile_scheduler import TileScheduler, TileRequest
+
+
+class TilePrefetcher:
+    """
+    Predicts the tiles that will be needed next from the pan velocity and the zoom direction and reads them into the
+    tile cache with the lowest priority of the tile scheduler. Tiles that are no longer predicted are cancelled.
+    """
+
+    def __init__(self, scheduler: TileScheduler, tile_cache: TileCache, lookahead: float = 0.5, max_tiles: int = 64,
+                 owner=None):
+        """
+        Initialization of the TilePrefetcher
+        :param scheduler: the scheduler that reads the tiles
+        :type scheduler: TileScheduler
+        :param tile_cache: the cache the tiles are read into
+        :type tile_cache: TileCache
+        :param lookahead: time in seconds the pan movement is extrapolated
+        :type lookahead: float
+        :param max_tiles: maximal number of pending prefetch requests
+        :type max_tiles: int
+        :param owner: the view the tiles are prefetched for, owner of the requests in the scheduler
+        """
+        self.scheduler = scheduler
+        self.tile_cache = tile_cache
+        self.lookahead = lookahead
+        self.max_tiles = max_tiles
+        self.owner = owner
+
+        self.velocity = QPointF()  # Smoothed pan velocity in slide coordinates per second
+        self.last_pan_time = None
+        self.zoom_direction = 0  # -1 while zooming in, 1 while zooming out
+        self.zoom_anchor = QPointF()  # Viewport position of the last zoom
+
+        self.requests = {}  # key -> TileRequest of all pending requests
+
+    def track_pan(self, move: QPointF):
+        """
+        Updates the pan velocity
+        :param move: movement of the viewport in slide coordinates
+        :type move: QPointF
+        :return: /
+        """
+        now = time.perf_counter()
+        if self.last_pan_time is not None and now > self.last_pan_time:
+            self.velocity = self.velocity * 0.5 + move / (now - self.last_pan_time) * 0.5
+        self.last_pan_time = now
+
+    def stop_pan(self):
+        """
+        Resets the pan velocity at the end of a pan
+        :return: /
+        """
+        self.velocity = QPointF()
+        self.last_pan_time = None
+
+    def track_zoom(self, zoom_in: bool, anchor: QPointF):
+        """
+        Updates the zoom direction
+        :param zoom_in: True if the last zoom was a zoom in
+        :type zoom_in: bool
+        :param anchor: viewport position of the zoom
+        :type anchor: QPointF
+        :return: /
+        """
+        self.zoom_direction = -1 if zoom_in else 1
+        self.zoom_anchor = QPointF(anchor)
+
+    def predict_tiles(self, view) -> list:
+        """
+        Predicts the tiles needed next, ordered by importance: first the tiles in the direction of the pan, then the
+        tiles of the adjacent level in the zoom direction. Tiles of the current tile range are left out.
+        :param view: the view to predict the tiles for
+        :type view: SlideView
+        :return: list of tile keys
+        """
+        keys = []
+        visible = view.get_tile_range()
+
+        if not self.velocity.isNull():
+            predicted_pos = view.mouse_pos + self.velocity * self.lookahead
+            keys += [key for key in self.range_keys(view, view.cur_level, view.get_tile_range(mouse_pos=predicted_pos))
+                     if not self.in_range(key, visible)]
+
+        next_level = view.cur_level + self.zoom_direction
+        if self.zoom_direction and 0 <= next_level < len(view.level_downsamples):
+            # viewport at the downsample at which the next level will be displayed, zoomed at the last zoom anchor
+            if self.zoom_direction < 0:
+                next_downsample = view.level_downsamples[view.cur_level] * 0.99
+            else:
+                next_downsample = view.level_downsamples[next_level]
+            next_downsample = min(next_downsample, view.max_downsample)
+            next_pos = view.mouse_pos + self.zoom_anchor * (view.cur_downsample - next_downsample)
+            zoom_keys = self.range_keys(view, next_level, view.get_tile_range(next_level, next_pos, next_downsample))
+
+            # the zoom converges to the slide position below the anchor, so its tiles are needed first
+            anchor = view.mouse_pos + self.zoom_anchor * view.cur_downsample
+            tile_size_slide = view.tile_size * view.level_downsamples[next_level]
+            zoom_keys.sort(key=lambda k: (abs((k[2] + 0.5) * tile_size_slide - anchor.x()) +
+                                          abs((k[3] + 0.5) * tile_size_slide - anchor.y())))
+            keys += zoom_keys
+
+        return keys[:self.max_tiles]
+
+    def prefetch(self, view):
+        """
+        Cancels the requests which are no longer predicted and issues requests for the newly predicted tiles
+        :param view: the view to prefetch the tiles for
+        :type view: SlideView
+        :return: /
+        """
+        keys = self.predict_tiles(view)
+        wanted = set(keys)
+
+        # the workers remove finished requests concurrently, so only snapshots of the requests are iterated
+        for key, request in list(self.requests.items()):
+            if key not in wanted or request.cancelled:
+                self.requests.pop(key, None)
+                self.cancel_request(request)
+
+        for distance, key in enumerate(keys):
+            if key not in self.requests and key not in self.tile_cache:
+                self.requests[key] = self.scheduler.request(key, view.slide, view.tile_size, TileScheduler.PREFETCH,
+                                                            distance, self.request_finished, owner=self.owner,
+                                                            uniform_tolerance=view.uniform_tolerance)
+
+    def request_finished(self, request: TileRequest, tile):
+        """
+        Called by the workers if a request is finished
+        :param request: the finished request
+        :type request: TileRequest
+        :param tile: the read tile
+        :return: /
+        """
+        if self.requests.get(request.key) is request:
+            self.requests.pop(request.key, None)
+
+    def cancel(self):
+        """
+        Cancels all pending requests, e.g. if another slide is loaded
+        :return: /
+        """
+        for request in list(self.requests.values()):
+            self.cancel_request(request)
+        self.requests = {}
+        self.stop_pan()
+        self.zoom_direction = 0
+
+    def cancel_request(self, request: TileRequest):
+        """
+        Cancels a prefetch request, unless the tile has been requested as visible tile in the meantime
+        :param request: the request
+        :type request: TileRequest
+        :return: /
+        """
+        if request.priority == TileScheduler.PREFETCH:
+            self.scheduler.cancel(request)
+
+    @staticmethod
+    def range_keys(view, level: int, tile_range: tuple) -> list:
+        """
+        Utility method to list the keys of all tiles of a tile range
+        :return: list of tile keys
+        """
+        first_col, first_row, last_col, last_row = tile_range
+        return [TileCache.key(view.filepath, level, col, row)
+                for row in range(first_row, last_row + 1) for col in range(first_col, last_col + 1)]
+
+    @staticmethod
+    def in_range(key: tuple, tile_range: tuple) -> bool:
+        """
+        Utility method to check if a tile is part of a tile range
+        :return: True if the tile is part of the range
+        """
+        return tile_range[0] <= key[2] <= tile_range[2] and tile_range[1] <= key[3] <= tile_range[3]
@@ -0,0 +1,297 @@
+import heapq
+import itertools
+import time
+from PySide6.QtCore import QMutex, QMutexLocker, QRunnable, QThreadPool
+from .color_transform import transform_tile
+from .disk_tile_cache import DiskTileCache
+from .tile_cache import TileCache, read_tile
+
+
+class TileRequest:
+    """
+    A scheduled read of a single tile. Requests for the same tile are coalesced, so one request can have several
+    callbacks. The key of a request with a color transform is the key of the raw tile extended by the transform_id.
+    """
+
+    def __init__(self, key: tuple, slide, tile_size: int, priority: int, distance: float, transform=None,
+                 uniform_tolerance: int = 0):
+        self.key = key
+        self.transform = transform  # ColorTransform applied to the raw tile or None
+        self.uniform_tolerance = uniform_tolerance  # Tolerance of the uniform tile detection, None disables it
+        self.slide = slide
+        self.tile_size = tile_size
+        self.priority = priority
+        self.distance = distance
+        self.generations = {}  # owner -> latest generation of all owners that requested the tile
+        self.callbacks = []
+        self.seq = 0  # Sequence number of the valid heap entry, older entries of a reprioritized request are skipped
+        self.cancelled = False
+        self.running = False
+        self.queued_time = time.perf_counter()
+
+
+class TileReadWorker(QRunnable):
+
+    def __init__(self, scheduler):
+        """
+        Initialization of the TileReadWorker. The worker does not belong to a certain tile, it processes the most
+        urgent request at the time it is run.
+        :param scheduler: the scheduler to take the request from
+        :type scheduler: TileScheduler
+        """
+        super().__init__()
+        self.scheduler = scheduler
+
+    def run(self):
+        request = self.scheduler.take_next()
+        if request is None:
+            return
+
+        metrics = self.scheduler.metrics
+        if metrics is not None:
+            metrics.record('queue_wait', time.perf_counter() - request.queued_time)
+
+        tile = None
+        try:
+            slide_id, level, col, row = request.key[:4]
+            tile_cache = self.scheduler.tile_cache
+            if request.transform is not None:
+                tile = tile_cache.get(request.key)
+            if tile is None:
+                tile = read_tile(request.slide, slide_id, tile_cache, level, col, row, request.tile_size,
+                                 self.scheduler.disk_cache, metrics, request.uniform_tolerance,
+                                 self.scheduler.backgrounds.get(slide_id))
+                # a changed transform finds the raw tile in the cache and only transforms it again
+                if request.transform is not None:
+                    tile = transform_tile(tile, request.transform, tile_cache, request.key, metrics)
+        finally:
+            self.scheduler.finish(request, tile)
+
+
+class TileScheduler:
+    """
+    Priority queue for tile reads on top of a thread pool. Visible tiles are read first, ordered from the center of the
+    viewport outwards, followed by the margin tiles and finally the prefetched tiles. Each update of the view opens a
+    new generation; queued requests of older generations which are not requested again are cancelled, so a zoom or a
+    large pan does not wait for reads that are no longer visible. Several views can share a scheduler: generations are
+    tracked per owner, and a request is only cancelled once none of its owners needs it anymore.
+    """
+    VISIBLE = 0  # Tiles inside the viewport
+    MARGIN = 1  # Tiles in the margin around the viewport
+    PREFETCH = 2  # Tiles that are predicted to be needed next
+
+    def __init__(self, thread_pool: QThreadPool, tile_cache: TileCache, disk_cache: DiskTileCache = None,
+                 metrics=None):
+        """
+        Initialization of the TileScheduler
+        :param thread_pool: the pool that reads the tiles
+        :type thread_pool: QThreadPool
+        :param tile_cache: the cache the tiles are read into
+        :type tile_cache: TileCache
+        :param disk_cache: optional persistent cache, which is checked before reading from the slide
+        :type disk_cache: DiskTileCache
+        :param metrics: optional instrumentation of the queue wait and read times
+        :type metrics: ViewMetrics
+        """
+        self.thread_pool = thread_pool
+        self.tile_cache = tile_cache
+        self.disk_cache = disk_cache
+        self.metrics = metrics
+        self.backgrounds = {}  # slide id -> BackgroundMask predicting the blank tiles, which are not read
+        self.background_owners = {}  # slide id -> views displaying the slide, the mask is kept while there are any
+        self.generation = 0
+
+        self.heap = []  # (priority, distance, seq, request) of all queued requests
+        self.requests = {}  # key -> TileRequest of all queued and running requests
+        self.counter = itertools.count()
+        self.mutex = QMutex()
+
+    def next_generation(self) -> int:
+        """
+        Opens a new generation of requests
+        :return: the new generation
+        """
+        with QMutexLocker(self.mutex):
+            self.generation += 1
+            return self.generation
+
+    def request(self, key: tuple, slide, tile_size: int, priority: int, distance: float = 0.0, callback=None,
+                generation: int = None, owner=None, transform=None, uniform_tolerance: int = 0) -> TileRequest:
+        """
+        Schedules the read of a tile. If the tile is already scheduled, the requests are coalesced and the request is
+        moved up if the new priority is more urgent.
+        :param key: key of the tile in the tile cache
+        :type key: tuple
+        :param slide: the slide to read from
+        :param tile_size: edge length of the tiles in pixels of their level
+        :type tile_size: int
+        :param priority: one of VISIBLE, MARGIN and PREFETCH
+        :type priority: int
+        :param distance: order of the requests of the same priority, e.g. the distance to the viewport center
+        :type distance: float
+        :param callback: function called with the request and the tile once the tile is read
+        :param generation: generation of the request, defaults to the current generation
+        :type generation: int
+        :param owner: the requesting view, whose generations are tracked separately
+        :param transform: optional color transform applied to the tile, requests of different transforms are not
+                          coalesced
+        :type transform: ColorTransform
+        :param uniform_tolerance: largest difference of each channel within a tile that is cached as UniformTile. The
+                                  default 0 only collapses exactly uniform tiles, None disables the detection. Coalesced
+                                  requests keep the tolerance of the first request.
+        :type uniform_tolerance: int
+        :return: the request
+        """
+        if transform is not None:
+            key = key + (transform.transform_id,)
+        with QMutexLocker(self.mutex):
+            generation = self.generation if generation is None else generation
+            request = self.requests.get(key)
+
+            if request is None:
+                request = TileRequest(key, slide, tile_size, priority, distance, transform, uniform_tolerance)
+                request.generations[owner] = generation
+                self.requests[key] = request
+                self.push(request)
+                start_worker = True
+            else:
+                request.generations[owner] = max(request.generations.get(owner, generation), generation)
+                if not request.running and (priority, distance) < (request.priority, request.distance):
+                    request.priority = priority
+                    request.distance = distance
+                    self.push(request)
+                start_worker = False
+
+            if callback is not None:
+                request.callbacks.append(callback)
+
+        if start_worker:
+            self.thread_pool.start(TileReadWorker(self))
+        return request
+
+    def push(self, request: TileRequest):
+        """
+        Pushes a new heap entry of a request, which invalidates its older entries. The mutex has to be locked.
+        :param request: the request
+        :type request: TileRequest
+        :return: /
+        """
+        request.seq = next(self.counter)
+        heapq.heappush(self.heap, (request.priority, request.distance, request.seq, request))
+
+    def take_next(self) -> TileRequest:
+        """
+        Takes the most urgent request from the queue and marks it as running
+        :return: the request or None if the queue is empty
+        """
+        with QMutexLocker(self.mutex):
+            while self.heap:
+                _, _, seq, request = heapq.heappop(self.heap)
+                if request.cancelled or request.running or seq != request.seq:
+                    continue
+                request.running = True
+                return request
+        return None
+
+    def finish(self, request: TileRequest, tile):
+        """
+        Removes a finished request and calls its callbacks
+        :param request: the finished request
+        :type request: TileRequest
+        :param tile: the tile or None if reading failed
+        :return: /
+        """
+        with QMutexLocker(self.mutex):
+            if self.requests.get(request.key) is request:
+                del self.requests[request.key]
+            callbacks = list(request.callbacks)
+
+        for callback in callbacks:
+            callback(request, tile)
+
+    def cancel(self, request: TileRequest):
+        """
+        Cancels a request if it is not running yet
+        :param request: the request
+        :type request: TileRequest
+        :return: /
+        """
+        with QMutexLocker(self.mutex):
+            if not request.running and self.requests.get(request.key) is request:
+                request.cancelled = True
+                del self.requests[request.key]
+
+    def cancel_obsolete(self, generation: int = None, owner=None):
+        """
+        Cancels all queued visible and margin requests of an owner of generations older than the given one. Requests
+        still needed by other owners are kept. Running requests are finished, their tiles end up in the cache.
+        :param generation: the oldest generation to keep, defaults to the current generation
+        :type generation: int
+        :param owner: the owner whose requests are cancelled
+        :return: /
+        """
+        cancelled = 0
+        with QMutexLocker(self.mutex):
+            generation = self.generation if generation is None else generation
+            for key, request in list(self.requests.items()):
+                if request.running or request.priority == self.PREFETCH:
+                    continue
+                if owner in request.generations and request.generations[owner] < generation:
+                    del request.generations[owner]
+                    if not request.generations:
+                        request.cancelled = True
+                        del self.requests[key]
+                        cancelled += 1
+        if cancelled and self.metrics is not None:
+            self.metrics.count('cancelled_requests', cancelled)
+
+    def cancel_all(self, owner=None):
+        """
+        Cancels all queued requests of an owner, e.g. if the owner loads another slide. Without owner, all queued
+        requests are cancelled.
+        :param owner: the owner whose requests are cancelled
+        :return: /
+        """
+        with QMutexLocker(self.mutex):
+            for key, request in list(self.requests.items()):
+                if request.running:
+                    continue
+                if owner is not None:
+                    request.generations.pop(owner, None)
+                    if request.generations:
+                        continue
+                request.cancelled = True
+                del self.requests[key]
+            if owner is None:
+                self.heap = []
+
+    def set_background(self, slide_id: str, mask, owner):
+        """
+        Sets the background mask of a slide, which is used by all views sharing the scheduler
+        :param slide_id: id of the slide
+        :type slide_id: str
+        :param mask: the mask
+        :type mask: BackgroundMask
+        :param owner: the view displaying the slide
+        :return: /
+        """
+        with QMutexLocker(self.mutex):
+            self.backgrounds[slide_id] = mask
+            self.background_owners.setdefault(slide_id, set()).add(owner)
+
+    def release_background(self, slide_id: str, owner):
+        """
+        Releases the background mask of a slide for an owner. The mask is removed once no owner displays the slide.
+        :param slide_id: id of the slide
+        :type slide_id: str
+        :param owner: the view that no longer displays the slide
+        :return: /
+        """
+        with QMutexLocker(self.mutex):
+            owners = self.background_owners.get(slide_id)
+            if owners is None:
+                return
+            owners.discard(owner)
+            if not owners:
+                del self.background_owners[slide_id]
+                self.backgrounds.pop(slide_id, None)
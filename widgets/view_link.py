@@ -0,0 +1,189 @@
+from PySide6.QtCore import QObject, QPointF, QThreadPool, Signal
+from PySide6.QtGui import QTransform
+import math
+import os
+from .disk_tile_cache import DiskTileCache
+from .slide_handles import SlideHandlePool
+from .slide_viewer import SlideView
+from .tile_cache import TileCache
+from .tile_scheduler import TileScheduler
+
+
+class ViewLink(QObject):
+    """
+    Links several SlideViews, e.g. to compare consecutive sections side by side. All views share one thread pool, tile
+    cache, tile scheduler and slide pool, so reads are coalesced and budgeted globally. The views also share a common
+    viewport state: panning or zooming one view moves all others. The state is kept in reference coordinates; an
+    optional affine transform per view maps the reference coordinates to the level 0 coordinates of its slide, e.g. to
+    compensate the offset, scale or rotation between two sections. The views are not rotated, a rotation only maps the
+    positions.
+    """
+    viewportChanged = Signal(QPointF, float)
+
+    def __init__(self, max_threads: int = None, cache_bytes: int = 512 * 1024 ** 2, disk_cache: DiskTileCache = None,
+                 slide_pool: SlideHandlePool = None, metrics=None):
+        """
+        Initialization of the ViewLink
+        :param max_threads: number of threads of the shared tile reading pool, defaults to os.cpu_count()
+        :type max_threads: int
+        :param cache_bytes: memory budget of the shared tile cache in bytes
+        :type cache_bytes: int
+        :param disk_cache: optional persistent tile cache shared by all views
+        :type disk_cache: DiskTileCache
+        :param slide_pool: pool of open slides shared by all views
+        :type slide_pool: SlideHandlePool
+        :param metrics: optional instrumentation of the shared scheduler
+        :type metrics: ViewMetrics
+        """
+        super().__init__()
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(max_threads or os.cpu_count() or 1)
+        self.tile_cache = TileCache(cache_bytes)
+        self.scheduler = TileScheduler(self.thread_pool, self.tile_cache, disk_cache, metrics)
+        self.slide_pool = SlideHandlePool() if slide_pool is None else slide_pool
+
+        self.views = []  # linked views
+        self.opened_views = set()  # views that opened a slide and adopt the common state instead of changing it
+        self.transforms = {}  # view -> QTransform from reference coordinates to the slide coordinates of the view
+
+        # Common viewport state: center in reference coordinates and downsample in reference pixels per screen pixel
+        self.center: QPointF = None
+        self.downsample = 0.0
+        self.syncing = False
+
+    def create_view(self, *args, transform: QTransform = None, **kwargs) -> SlideView:
+        """
+        Creates a SlideView that uses the shared scheduler and slide pool and links it
+        :param args: arguments passed to the SlideView
+        :param transform: transform from the reference coordinates to the slide coordinates of the view
+        :type transform: QTransform
+        :param kwargs: keyword arguments passed to the SlideView
+        :return: the view
+        """
+        view = SlideView(*args, scheduler=self.scheduler, slide_pool=self.slide_pool, **kwargs)
+        self.add_view(view, transform)
+        return view
+
+    def add_view(self, view: SlideView, transform: QTransform = None):
+        """
+        Links a view. Views created without the shared scheduler are linked as well, but do not share their reads.
+        :param view: the view
+        :type view: SlideView
+        :param transform: transform from the reference coordinates to the slide coordinates of the view
+        :type transform: QTransform
+        :return: /
+        """
+        self.views.append(view)
+        self.transforms[view] = QTransform() if transform is None else transform
+        view.viewportChanged.connect(self.view_changed)
+        view.slideOpened.connect(self.view_opened)
+        if self.center is not None:
+            self.apply(view)
+
+    def remove_view(self, view: SlideView):
+        """
+        Unlinks a view
+        :param view: the view
+        :type view: SlideView
+        :return: /
+        """
+        if view in self.views:
+            view.viewportChanged.disconnect(self.view_changed)
+            view.slideOpened.disconnect(self.view_opened)
+            self.views.remove(view)
+            del self.transforms[view]
+            self.opened_views.discard(view)
+
+    def set_transform(self, view: SlideView, transform: QTransform):
+        """
+        Sets the transform of a view, e.g. after registering two sections, and moves the view accordingly
+        :param view: the view
+        :type view: SlideView
+        :param transform: transform from the reference coordinates to the slide coordinates of the view
+        :type transform: QTransform
+        :return: /
+        """
+        self.transforms[view] = transform
+        if self.center is not None:
+            self.apply(view)
+
+    @staticmethod
+    def transform_scale(transform: QTransform) -> float:
+        """
+        Utility method to get the mean scale of a transform
+        :return: the scale
+        """
+        return math.sqrt(abs(transform.determinant())) or 1.0
+
+    def view_opened(self, metadata: dict):
+        """
+        Marks a view that opened a slide, so its initial viewport does not move the other views
+        :param metadata: metadata of the slide
+        :type metadata: dict
+        :return: /
+        """
+        self.opened_views.add(self.sender())
+
+    def view_changed(self):
+        """
+        Takes the viewport of the changed view as common state and moves all other views. A view that just opened a
+        slide is moved to the common state instead.
+        :return: /
+        """
+        view = self.sender()
+        if self.syncing or view not in self.transforms or not view.slide:
+            return
+        if view in self.opened_views:
+            self.opened_views.discard(view)
+            if self.center is not None:
+                self.apply(view)
+                return
+
+        transform = self.transforms[view]
+        inverted, invertible = transform.inverted()
+        if not invertible:
+            return
+        self.center = inverted.map(view.get_viewport_rect().center())
+        self.downsample = view.cur_downsample / self.transform_scale(transform)
+
+        self.syncing = True
+        try:
+            for other in self.views:
+                if other is not view:
+                    self.apply(other)
+        finally:
+            self.syncing = False
+        self.viewportChanged.emit(self.center, self.downsample)
+
+    def set_viewport(self, center: QPointF, downsample: float):
+        """
+        Moves all views to a common viewport
+        :param center: center in reference coordinates
+        :type center: QPointF
+        :param downsample: reference pixels per screen pixel
+        :type downsample: float
+        :return: /
+        """
+        self.center = QPointF(center)
+        self.downsample = downsample
+        self.syncing = True
+        try:
+            for view in self.views:
+                self.apply(view)
+        finally:
+            self.syncing = False
+        self.viewportChanged.emit(self.center, self.downsample)
+
+    def apply(self, view: SlideView):
+        """
+        Moves a view to the common viewport
+        :param view: the view
+        :type view: SlideView
+        :return: /
+        """
+        transform = self.transforms[view]
+        syncing, self.syncing = self.syncing, True
+        try:
+            view.set_viewport(transform.map(self.center), self.downsample * self.transform_scale(transform))
+        finally:
+            self.syncing = syncing
@@ -0,0 +1,165 @@
+from collections import deque
+from PySide6.QtCore import QObject, QMutex, QMutexLocker, QTimer, Signal
+import json
+import numpy as np
+import os
+import time
+
+
+class ViewMetrics(QObject):
+    """
+    Opt-in instrumentation of a SlideView and its tile workers. Durations are kept in a rolling window per metric,
+    events are counted. A snapshot with percentiles is emitted periodically and can be appended to a rolling log file
+    (one JSON object per line). Without a ViewMetrics object, the hot paths only check for None.
+
+    Durations: read_region, tile_conversion, disk_read, queue_wait, pixmap_upload, viewport_complete, color_transform
+    Counters: dropped_wheel_events, coalesced_wheel_events, dropped_tiles, cancelled_requests, coarse_jobs,
+    uniform_tiles, skipped_background_reads
+    Caches: memory and, with a disk cache, disk (hits, misses and hit rate)
+    """
+    updated = Signal(dict)
+
+    def __init__(self, window: int = 1000, interval: int = 1000, log_path: str = None,
+                 max_log_bytes: int = 10 * 1024 ** 2):
+        """
+        Initialization of the ViewMetrics
+        :param window: number of samples kept per duration
+        :type window: int
+        :param interval: interval of the snapshots in milliseconds, 0 disables the periodic snapshots
+        :type interval: int
+        :param log_path: file the periodic snapshots are appended to
+        :type log_path: str
+        :param max_log_bytes: size at which the log file is rotated to log_path + '.1'
+        :type max_log_bytes: int
+        """
+        super().__init__()
+        self.window = window
+        self.log_path = log_path
+        self.max_log_bytes = max_log_bytes
+
+        self.durations = {}  # name -> deque of the latest durations in seconds
+        self.totals = {}  # name -> number of all recorded durations
+        self.counters = {}  # name -> count
+        self.caches = []  # caches whose hit rate is reported
+        self.start_time = time.perf_counter()
+        self.mutex = QMutex()
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.publish)
+        if interval > 0:
+            self.timer.start(interval)
+
+    def record(self, name: str, seconds: float):
+        """
+        Records a duration, thread-safe
+        :param name: name of the metric
+        :type name: str
+        :param seconds: the duration in seconds
+        :type seconds: float
+        :return: /
+        """
+        with QMutexLocker(self.mutex):
+            samples = self.durations.get(name)
+            if samples is None:
+                samples = self.durations[name] = deque(maxlen=self.window)
+            samples.append(seconds)
+            self.totals[name] = self.totals.get(name, 0) + 1
+
+    def count(self, name: str, n: int = 1):
+        """
+        Increments a counter, thread-safe
+        :param name: name of the counter
+        :type name: str
+        :param n: the increment
+        :type n: int
+        :return: /
+        """
+        with QMutexLocker(self.mutex):
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def watch_cache(self, name: str, cache):
+        """
+        Reports the hit rate of a cache with hits and misses counters, e.g. a TileCache or DiskTileCache
+        :param name: name of the cache in the snapshot
+        :type name: str
+        :param cache: the cache
+        :return: /
+        """
+        self.caches.append((name, cache, cache.hits, cache.misses))
+
+    def snapshot(self) -> dict:
+        """
+        Summarizes the rolling windows
+        :return: dictionary with the percentiles (in milliseconds) of all durations, the counters and the cache hit
+                 rates since the last reset
+        """
+        with QMutexLocker(self.mutex):
+            durations = {name: (np.array(samples) * 1000, self.totals[name])
+                         for name, samples in self.durations.items() if samples}
+            counters = dict(self.counters)
+
+        stats = {}
+        for name, (samples, total) in durations.items():
+            p50, p95, p99 = np.percentile(samples, (50, 95, 99))
+            stats[name] = {'count': total, 'mean_ms': float(samples.mean()), 'p50_ms': float(p50),
+                           'p95_ms': float(p95), 'p99_ms': float(p99), 'max_ms': float(samples.max())}
+
+        caches = {}
+        for name, cache, hits, misses in self.caches:
+            hits, misses = cache.hits - hits, cache.misses - misses
+            hit_rate = hits / (hits + misses) if hits + misses else 0.0
+            caches[name] = {'hits': hits, 'misses': misses, 'hit_rate': hit_rate}
+
+        return {'time': time.time(), 'uptime_s': time.perf_counter() - self.start_time, 'durations': stats,
+                'counters': counters, 'caches': caches}
+
+    def publish(self):
+        """
+        Emits a snapshot and appends it to the log file, called periodically
+        :return: /
+        """
+        snapshot = self.snapshot()
+        self.updated.emit(snapshot)
+        if self.log_path:
+            self.append_log(snapshot)
+
+    def append_log(self, snapshot: dict):
+        """
+        Appends a snapshot to the log file and rotates the file if it exceeds its maximal size
+        :param snapshot: the snapshot
+        :type snapshot: dict
+        :return: /
+        """
+        try:
+            with open(self.log_path, 'a') as file:
+                file.write(json.dumps(snapshot) + '\n')
+                rotate = file.tell() > self.max_log_bytes
+            if rotate:
+                os.replace(self.log_path, self.log_path + '.1')
+        except OSError:
+            pass
+
+    def to_json(self, path: str = None) -> str:
+        """
+        Dumps a snapshot as JSON
+        :param path: file the snapshot is written to, if given
+        :type path: str
+        :return: the JSON string
+        """
+        data = json.dumps(self.snapshot(), indent=2)
+        if path:
+            with open(path, 'w') as file:
+                file.write(data)
+        return data
+
+    def reset(self):
+        """
+        Clears all durations and counters
+        :return: /
+        """
+        with QMutexLocker(self.mutex):
+            self.durations = {}
+            self.totals = {}
+            self.counters = {}
+            self.caches = [(name, cache, cache.hits, cache.misses) for name, cache, _, _ in self.caches]
+            self.start_time = time.perf_counter()